@@ -0,0 +1,310 @@
+"""Extract events from many biographies with a pool of worker processes.
+
+Each worker holds one BiographyProcessor and one pooled HTTP client for its
+whole lifetime and processes documents one after the other. Documents come
+either from a manifest or from a directory of .txt files:
+
+    python batch_extraction.py --manifest manifest.json --output-dir out
+    python batch_extraction.py --input-dir biographies --output-dir out
+
+A manifest is a JSON list (or JSONL) of {"path": ..., "subject": ...}
+entries. In directory mode subjects are read from subjects.json in that
+directory ({"file name": "subject"}) or derived from the file name
+("AndreaCostaBio.txt" -> "Andrea Costa"). Each document gets a resumable
+<name>.jsonl output and the run writes summary.json next to them.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List, Optional
+
+from event_extraction import (
+    BiographyProcessor,
+    process_biography,
+    process_biography_async,
+)
+from hedging import Hedger
+from llama_client import (
+    LLAMA_API_URL,
+    AsyncRateLimitedClient,
+    RateLimitedClient,
+    RetryPolicy,
+    create_async_client,
+    create_client,
+)
+from llm_cache import AsyncCachedClient, CachedClient, LLMCache
+from results_io import load_results
+from routing import ModelRouter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Document:
+    path: str
+    subject: str
+    output_path: str = ""
+
+
+def subject_from_filename(path: str) -> str:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    stem = re.sub(r"(?i)[_\-\s]*bio(graphy)?$", "", stem)
+    stem = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", stem)
+    subject = re.sub(r"[_\-]+", " ", stem).strip()
+    return subject.title() if subject.islower() else subject
+
+
+def load_documents(
+    manifest: Optional[str], input_dir: Optional[str], output_dir: str
+) -> List[Document]:
+    if manifest:
+        with open(manifest, encoding="utf-8") as f:
+            if manifest.endswith(".jsonl"):
+                entries = [json.loads(line) for line in f if line.strip()]
+            else:
+                entries = json.load(f)
+        base = os.path.dirname(os.path.abspath(manifest))
+        documents = [
+            Document(os.path.join(base, e["path"]), e["subject"], e.get("output", ""))
+            for e in entries
+        ]
+    else:
+        subjects = {}
+        subjects_path = os.path.join(input_dir, "subjects.json")
+        if os.path.exists(subjects_path):
+            with open(subjects_path, encoding="utf-8") as f:
+                subjects = json.load(f)
+        documents = [
+            Document(
+                os.path.join(input_dir, name),
+                subjects.get(name) or subject_from_filename(name),
+            )
+            for name in sorted(os.listdir(input_dir))
+            if name.endswith(".txt")
+        ]
+
+    stems = [os.path.splitext(os.path.basename(d.path))[0] for d in documents]
+    for document, stem in zip(documents, stems):
+        if not document.output_path:
+            if stems.count(stem) > 1:
+                # Same file name in several directories: tell them apart by path
+                digest = hashlib.sha256(
+                    os.path.abspath(document.path).encode("utf-8")
+                ).hexdigest()[:8]
+                stem = f"{stem}-{digest}"
+            document.output_path = os.path.join(output_dir, f"{stem}.jsonl")
+    return documents
+
+
+# Per-process state, set up once by _init_worker. The event loop is kept for
+# the worker's lifetime because the async client's pool is bound to it.
+_processor: Optional[BiographyProcessor] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_settings: dict = {}
+
+
+def _init_worker(schema_path: str, settings: dict) -> None:
+    global _processor, _loop, _settings
+    _settings = settings
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    # Each worker gets an equal share of the account-wide quotas
+    workers = settings["workers"]
+    policy = RetryPolicy(
+        settings["rpm"] / workers if settings["rpm"] else None,
+        settings["tpm"] / workers if settings["tpm"] else None,
+        max_retries=settings["max_retries"],
+    )
+    client = RateLimitedClient(
+        create_client(settings["base_url"], max_connections=settings["pool_size"]),
+        policy,
+    )
+    async_client = AsyncRateLimitedClient(
+        create_async_client(settings["base_url"], max_connections=settings["pool_size"]),
+        policy,
+    )
+    if settings["cache"]:
+        cache = LLMCache(settings["cache"])
+        client = CachedClient(client, cache)
+        async_client = AsyncCachedClient(async_client, cache)
+    _processor = BiographyProcessor(
+        schema_path,
+        examples_path=settings["examples"],
+        client=client,
+        async_client=async_client,
+        extraction_workers=settings["extraction_workers"],
+        hedger=Hedger(settings["deadlines"], hedge=settings["hedge"])
+        if settings["hedge"] or settings["deadlines"]
+        else None,
+        guided_decoding=settings["guided_decoding"],
+        repair_attempts=settings["repair_attempts"],
+        router=ModelRouter.from_config(settings["models"])
+        if settings["models"]
+        else None,
+        joint_extraction=settings["joint"],
+        thresholds_path=settings["thresholds"],
+        stream=settings["stream"],
+    )
+
+
+def _process_document(document: Document) -> dict:
+    started = time.perf_counter()
+    summary = {"path": document.path, "subject": document.subject}
+    try:
+        with open(document.path, encoding="utf-8") as f:
+            text = f.read()
+        _processor.set_subject(document.subject)
+        _processor.events.clear()
+        output_dir = os.path.dirname(os.path.abspath(document.output_path))
+        os.makedirs(output_dir, exist_ok=True)
+        if _settings["concurrency"] > 1:
+            _loop.run_until_complete(
+                process_biography_async(
+                    text,
+                    None,
+                    document.output_path,
+                    max_concurrency=_settings["concurrency"],
+                    processor=_processor,
+                )
+            )
+        else:
+            process_biography(text, None, document.output_path, processor=_processor)
+        results = load_results(document.output_path)
+        summary.update(
+            status="ok",
+            output=document.output_path,
+            paragraphs=len(results),
+            events=sum(len(r["events"]) for r in results),
+        )
+    except Exception as e:
+        logger.error(f"Failed to process {document.path}: {e}", exc_info=True)
+        summary.update(status="error", error=str(e))
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def run_batch(
+    documents: List[Document],
+    schema_path: str,
+    output_dir: str,
+    workers: int,
+    settings: dict,
+) -> dict:
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    summaries = []
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(schema_path, settings)
+    ) as executor:
+        futures = [executor.submit(_process_document, d) for d in documents]
+        for future in as_completed(futures):
+            summary = future.result()
+            logger.info(
+                f"{summary['status']}: {summary['path']} ({summary['seconds']}s)"
+            )
+            summaries.append(summary)
+
+    elapsed = time.perf_counter() - started
+    ok = [s for s in summaries if s["status"] == "ok"]
+    run_summary = {
+        "documents": len(documents),
+        "succeeded": len(ok),
+        "failed": len(summaries) - len(ok),
+        "paragraphs": sum(s["paragraphs"] for s in ok),
+        "events": sum(s["events"] for s in ok),
+        "seconds": round(elapsed, 3),
+        "documents_per_minute": round(len(ok) / elapsed * 60, 2) if elapsed else 0.0,
+        "workers": workers,
+        "settings": settings,
+        "per_document": sorted(summaries, key=lambda s: s["path"]),
+    }
+    with open(os.path.join(output_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(run_summary, f, indent=2, ensure_ascii=False)
+    return run_summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract events from many biographies")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="JSON/JSONL list of {path, subject}")
+    source.add_argument("--input-dir", help="Directory of .txt biographies")
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--schema", default="event_schema.json")
+    parser.add_argument("--examples", default="examples.json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Paragraphs in flight per worker (>1 uses the async client)",
+    )
+    parser.add_argument("--extraction-workers", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=32)
+    parser.add_argument("--base-url", default=LLAMA_API_URL)
+    parser.add_argument("--cache", help="SQLite LLM response cache shared by workers")
+    parser.add_argument("--rpm", type=float, help="Requests per minute, split across workers")
+    parser.add_argument("--tpm", type=float, help="Tokens per minute, split across workers")
+    parser.add_argument("--max-retries", type=int, default=6)
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Hedge calls slower than their stage's p95 (streamed calls are not hedged)",
+    )
+    parser.add_argument(
+        "--deadline",
+        action="append",
+        default=[],
+        metavar="STAGE=SECONDS",
+        help="Per-stage call deadline; with --stream it covers the whole stream",
+    )
+    parser.add_argument(
+        "--guided-decoding",
+        action="store_true",
+        help="Send the event JSON Schemas as response_format",
+    )
+    parser.add_argument("--repair-attempts", type=int, default=1)
+    parser.add_argument("--models", help="Per-stage model routing config (routing.py)")
+    parser.add_argument(
+        "--joint", action="store_true", help="One extraction call per multi-type paragraph"
+    )
+    parser.add_argument("--thresholds", help="Per-type thresholds from calibration.py")
+    parser.add_argument(
+        "--stream", action="store_true", help="Stream and validate events as they close"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    documents = load_documents(args.manifest, args.input_dir, args.output_dir)
+    settings = {
+        "examples": args.examples,
+        "concurrency": args.concurrency,
+        "extraction_workers": args.extraction_workers,
+        "pool_size": args.pool_size,
+        "base_url": args.base_url,
+        "cache": args.cache,
+        "workers": args.workers,
+        "rpm": args.rpm,
+        "tpm": args.tpm,
+        "max_retries": args.max_retries,
+        "hedge": args.hedge,
+        "deadlines": {
+            stage: float(seconds)
+            for stage, seconds in (d.split("=", 1) for d in args.deadline)
+        },
+        "guided_decoding": args.guided_decoding,
+        "repair_attempts": args.repair_attempts,
+        "models": args.models,
+        "joint": args.joint,
+        "thresholds": args.thresholds,
+        "stream": args.stream,
+    }
+    summary = run_batch(documents, args.schema, args.output_dir, args.workers, settings)
+    print(json.dumps({k: v for k, v in summary.items() if k != "per_document"}, indent=2))
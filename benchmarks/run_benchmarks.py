@@ -0,0 +1,366 @@
+"""End-to-end throughput benchmarks against the local mock LLM.
+
+Each case extracts events from a corpus with process_biography (or
+process_biography_async with --concurrency > 1) against a synth-mode
+mock_llm_server, then runs the seven RiC-O mapping scripts on the
+resulting events. Corpora are the Andrea Costa biography and synthetic
+corpora of N paragraphs recombined from its sentences, so every paragraph
+is a distinct prompt. Every case runs in a fresh process so that its peak
+RSS is its own.
+
+    python benchmarks/run_benchmarks.py --sizes 1000,10000
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier>.json
+
+Results are written to benchmarks/results/<timestamp>.json.
+"""
+
+import argparse
+import contextlib
+import glob
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_llm_server import LatencyModel, MockLLMServer  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# (event type, mapping script, converter function)
+MAPPINGS = [
+    ("BIRTH", "birth_events/birth_mapping.py", "convert_birth_events_to_rdf"),
+    ("DEATH", "death_events/death_mapping.py", "convert_death_events_to_rdf"),
+    ("DOCUMENT", "document_events/document_mapping.py", "convert_document_events_to_rdf"),
+    (
+        "EDUCATION",
+        "education_events/education_mapping.py",
+        "convert_education_events_to_rdf",
+    ),
+    (
+        "EMPLOYMENT",
+        "employment_events/employment_mapping.py",
+        "convert_employment_events_to_rdf",
+    ),
+    ("POLITICS", "politics_events/politics_mapping.py", "convert_political_events_to_rdf"),
+    ("RELATIONSHIP", "relations_events/relation_mapping.py", "convert_events_to_rdf"),
+]
+
+
+def synthetic_corpus(source_text: str, paragraphs: int, seed: int = 0) -> str:
+    """Recombine the sentences of source_text into distinct paragraphs."""
+    sentences = [
+        s.strip()
+        for s in re.split(r"(?<=[.;!?])\s+", source_text.replace("\n", " "))
+        if len(s.strip()) > 20
+    ]
+    rng = random.Random(seed)
+    return "\n".join(
+        " ".join(rng.sample(sentences, rng.randint(2, 5))) for _ in range(paragraphs)
+    )
+
+
+def examples_from_evaluation(path: str, output_path: str, per_type: int = 3) -> str:
+    """Write an examples.json built from the annotated evaluation paragraphs."""
+    with open(path, encoding="utf-8") as f:
+        paragraphs = json.load(f)
+    examples, counts = [], {}
+    for paragraph in paragraphs:
+        for event in paragraph["events"]:
+            if counts.get(event["type"], 0) < per_type:
+                counts[event["type"]] = counts.get(event["type"], 0) + 1
+                examples.append(
+                    {"input_text": paragraph["paragraph_text"], "event": event["data"]}
+                )
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"examples": examples}, f, ensure_ascii=False)
+    return output_path
+
+
+def _load_converter(script: str, function: str):
+    spec = importlib.util.spec_from_file_location(
+        os.path.splitext(os.path.basename(script))[0], os.path.join(ROOT, script)
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, function)
+
+
+def _mapping_input(results: List[dict], event_type: str) -> List[dict]:
+    """The paragraphs with events of one type, holding only those events.
+
+    The relationship converter only looks at each paragraph's first event,
+    and the politics converter expects the actions under "properties" as
+    in politics_events.json, so events are filtered and reshaped to match.
+    """
+    entries = []
+    for result in results:
+        events = [e for e in result["events"] if e["type"] == event_type]
+        if event_type == "POLITICS":
+            events = [
+                e
+                if "properties" in e["data"]
+                else dict(
+                    e,
+                    data={
+                        "description": e["data"].get("description", ""),
+                        "properties": e["data"],
+                    },
+                )
+                for e in events
+            ]
+        if events:
+            entries.append(dict(result, events=events))
+    return entries
+
+
+def run_mappings(results: List[dict], output_dir: str) -> Dict[str, dict]:
+    from rdflib import Graph
+
+    mappings = {}
+    for event_type, script, function in MAPPINGS:
+        convert = _load_converter(script, function)
+        entries = _mapping_input(results, event_type)
+        type_dir = os.path.join(output_dir, event_type.lower())
+        started = time.perf_counter()
+        error = None
+        try:
+            # Some converters print a line per file written
+            with contextlib.redirect_stdout(io.StringIO()):
+                convert(entries, type_dir)
+        except Exception as e:
+            error = repr(e)
+        seconds = time.perf_counter() - started
+        # Count triples outside the timed section
+        triples = 0
+        for path in glob.glob(os.path.join(type_dir, "*.ttl")):
+            triples += len(Graph().parse(path, format="turtle"))
+        mappings[event_type] = {
+            "events": sum(len(entry["events"]) for entry in entries),
+            "seconds": round(seconds, 3),
+            "triples": triples,
+            "triples_per_second": round(triples / seconds, 1) if seconds else None,
+            "error": error,
+        }
+    return mappings
+
+
+def run_case(case: dict) -> dict:
+    """Run one corpus end to end; executed in a fresh worker process."""
+    logging.disable(logging.WARNING)
+    import asyncio
+
+    from event_extraction import (
+        BiographyProcessor,
+        process_biography,
+        process_biography_async,
+    )
+    from instrumentation import Tracer
+    from llama_client import create_async_client, create_client
+    from results_io import load_results
+
+    with tempfile.TemporaryDirectory() as workdir:
+        output_path = os.path.join(workdir, "results.jsonl")
+        tracer = Tracer()
+        processor = BiographyProcessor(
+            case["schema"],
+            examples_path=case["examples"],
+            client=create_client(case["url"]),
+            async_client=create_async_client(case["url"]),
+            extraction_workers=case["extraction_workers"],
+            tracer=tracer,
+        )
+        started = time.perf_counter()
+        if case["concurrency"] > 1:
+            asyncio.run(
+                process_biography_async(
+                    case["text"],
+                    None,
+                    output_path,
+                    max_concurrency=case["concurrency"],
+                    classify_batch_size=case["classify_batch_size"],
+                    processor=processor,
+                )
+            )
+        else:
+            process_biography(
+                case["text"],
+                None,
+                output_path,
+                classify_batch_size=case["classify_batch_size"],
+                processor=processor,
+            )
+        extraction_seconds = time.perf_counter() - started
+        results = load_results(output_path)
+        mappings = run_mappings(results, os.path.join(workdir, "rdf"))
+
+    totals = [row for row in tracer.summary() if row["event_type"] == "TOTAL"]
+    calls = sum(row["calls"] for row in totals)
+    tokens = sum(row["prompt_tokens"] + row["completion_tokens"] for row in totals)
+    paragraphs = len(results)
+    events = sum(len(r["events"]) for r in results)
+    triples = sum(m["triples"] for m in mappings.values())
+    mapping_seconds = sum(m["seconds"] for m in mappings.values())
+    return {
+        "corpus": case["corpus"],
+        "paragraphs": paragraphs,
+        "events": events,
+        "extraction_seconds": round(extraction_seconds, 3),
+        "paragraphs_per_second": round(paragraphs / extraction_seconds, 2),
+        "llm_calls": calls,
+        "calls_per_paragraph": round(calls / paragraphs, 3) if paragraphs else None,
+        "tokens": tokens,
+        "tokens_per_event": round(tokens / events, 1) if events else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "mapping_seconds": round(mapping_seconds, 3),
+        "rdf_triples": triples,
+        "rdf_triples_per_second": round(triples / mapping_seconds, 1)
+        if mapping_seconds
+        else None,
+        "stages": totals,
+        "mappings": mappings,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return completed.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline_path: str) -> str:
+    """Ratios current/baseline of the headline metrics, per corpus."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {c["corpus"]: c for c in json.load(f)["cases"]}
+    metrics = [
+        "paragraphs_per_second",
+        "calls_per_paragraph",
+        "tokens_per_event",
+        "peak_rss_mb",
+        "rdf_triples_per_second",
+    ]
+    lines = ["corpus".ljust(18) + "".join(m.rjust(24) for m in metrics)]
+    for case in current["cases"]:
+        before = baseline.get(case["corpus"])
+        if before is None:
+            continue
+        cells = []
+        for metric in metrics:
+            if case.get(metric) and before.get(metric):
+                cells.append(f"{case[metric] / before[metric]:.2f}x")
+            else:
+                cells.append("-")
+        lines.append(case["corpus"].ljust(18) + "".join(c.rjust(24) for c in cells))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extraction and mapping throughput benchmarks"
+    )
+    parser.add_argument("--biography", default=os.path.join(ROOT, "AndreaCostaBio.txt"))
+    parser.add_argument(
+        "--sizes", default="1000", help="Comma-separated synthetic corpus sizes (paragraphs)"
+    )
+    parser.add_argument("--schema", default=os.path.join(ROOT, "event_schema.json"))
+    parser.add_argument(
+        "--examples",
+        default=os.path.join(ROOT, "examples.json"),
+        help="Few-shot examples; built from evaluation-app/events.json when missing",
+    )
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        metavar="[STAGE=]DIST",
+        help="Mock latency per stage (see mock_llm_server.py), default lognormal:0.02,0.5",
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--classify-batch-size", type=int, default=1)
+    parser.add_argument("--extraction-workers", type=int, default=4)
+    parser.add_argument("--output-dir", default=os.path.join(ROOT, "benchmarks", "results"))
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.biography, encoding="utf-8") as f:
+        biography = f.read()
+    corpora = {"costa": biography}
+    for size in (int(s) for s in args.sizes.split(",") if s):
+        corpora[f"synthetic-{size}"] = synthetic_corpus(biography, size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        examples = args.examples
+        if not os.path.exists(examples):
+            examples = examples_from_evaluation(
+                os.path.join(ROOT, "evaluation-app", "events.json"),
+                os.path.join(tmp, "examples.json"),
+            )
+        latency = LatencyModel(args.latency or ["lognormal:0.02,0.5"])
+        cases = []
+        with MockLLMServer("synth", schema_path=args.schema, latency=latency) as server:
+            for corpus, text in corpora.items():
+                logger.info(f"Running {corpus}")
+                case = {
+                    "corpus": corpus,
+                    "text": text,
+                    "url": server.url,
+                    "schema": args.schema,
+                    "examples": examples,
+                    "concurrency": args.concurrency,
+                    "classify_batch_size": args.classify_batch_size,
+                    "extraction_workers": args.extraction_workers,
+                }
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(run_case, case).result()
+                logger.info(
+                    f"{corpus}: {result['paragraphs_per_second']} paragraphs/s, "
+                    f"{result['calls_per_paragraph']} calls/paragraph, "
+                    f"{result['rdf_triples_per_second']} triples/s"
+                )
+                cases.append(result)
+
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "latency": args.latency or ["lognormal:0.02,0.5"],
+            "concurrency": args.concurrency,
+            "classify_batch_size": args.classify_batch_size,
+            "extraction_workers": args.extraction_workers,
+        },
+        "cases": cases,
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(
+        args.output_dir, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    logger.info(f"Results written to {output_path}")
+    if args.compare:
+        print(compare(run, args.compare))
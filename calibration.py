@@ -0,0 +1,291 @@
+"""Per-type classification thresholds fitted on the annotated paragraphs.
+
+Every type classified above its confidence threshold costs a paragraph
+the extraction calls of that type, and a single threshold of 0.5 keeps
+many classifications that yield nothing the evaluators kept. The
+calibration classifies the paragraphs of evaluation-app/*.json, takes the
+paragraphs holding annotated events of a type as its positives (weighted
+by their number of events) and raises each type's threshold as far as the
+event recall allows:
+
+    python calibration.py --base-url http://127.0.0.1:8000 --output thresholds.json
+
+The classification recall is the share of annotated events whose
+paragraph keeps their type. An event the classification drops is lost
+for the evaluation too, so the end-to-end recall is estimated as the
+published one (0.982, measured with the 0.5 threshold) scaled by the
+classification recall relative to 0.5. Thresholds start at 0.5 and are
+only raised, so the fit can only remove extraction calls: it takes at each
+step the type whose next threshold saves the most calls per annotated
+event lost, while the estimate stays at or above --target-recall (by
+default 0.982 too, so no event kept at 0.5 is lost). New thresholds sit halfway between the
+scores they separate. The confidences are saved with --scores so a refit
+does not classify again. BiographyProcessor loads the output with
+thresholds_path (--thresholds in event_extraction.py).
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_THRESHOLD = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+def load_thresholds(path: str) -> Tuple[float, Dict[str, float]]:
+    """The default threshold and the per-type thresholds of a config."""
+    with open(path) as f:
+        config = json.load(f)
+    thresholds = {t.upper(): v for t, v in config.get("thresholds", {}).items()}
+    return config.get("default", DEFAULT_THRESHOLD), thresholds
+
+
+def load_annotations(pattern: str) -> Tuple[Dict[int, str], Dict[int, Dict[str, int]]]:
+    """Paragraph texts and annotated event counts per type, by paragraph index.
+
+    The per-type files repeat paragraphs of events.json, so counts are the
+    largest found for a paragraph and type, not their sum.
+    """
+    texts: Dict[int, str] = {}
+    counts: Dict[int, Dict[str, int]] = {}
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            continue
+        for paragraph in data:
+            # politics_events.json spells the keys without underscore
+            index = paragraph.get("paragraph_index", paragraph.get("paragraphindex"))
+            text = paragraph.get("paragraph_text", paragraph.get("paragraphtext"))
+            if index is None or not text:
+                continue
+            texts.setdefault(index, text)
+            per_type: Dict[str, int] = {}
+            for event in paragraph.get("events", []):
+                per_type[event["type"]] = per_type.get(event["type"], 0) + 1
+            paragraph_counts = counts.setdefault(index, {})
+            for event_type, count in per_type.items():
+                paragraph_counts[event_type] = max(
+                    paragraph_counts.get(event_type, 0), count
+                )
+    return texts, counts
+
+
+def candidate_thresholds(
+    scores: List[float], max_threshold: float, min_threshold: float = DEFAULT_THRESHOLD
+) -> List[float]:
+    """Increasing thresholds from min_threshold, each keeping fewer distinct
+    scores than the last.
+
+    A classification is kept when its confidence is above the threshold.
+    """
+    values = sorted({s for s in scores if s > min_threshold})
+    thresholds = [min_threshold]
+    for low, high in zip(values, values[1:] + [1.0]):
+        threshold = round((low + high) / 2, 4)
+        if threshold > max_threshold:
+            break
+        thresholds.append(threshold)
+    return thresholds
+
+
+def evaluate(
+    thresholds: Dict[str, float],
+    scores: Dict[int, Dict[str, float]],
+    counts: Dict[int, Dict[str, int]],
+    event_types: List[str],
+    default: float = DEFAULT_THRESHOLD,
+) -> dict:
+    """Extraction calls (paragraph and type pairs kept) and event recall."""
+    calls = kept = total = 0
+    for index, paragraph_scores in scores.items():
+        for event_type in event_types:
+            events = counts.get(index, {}).get(event_type, 0)
+            keep = paragraph_scores.get(event_type, 0.0) > thresholds.get(
+                event_type, default
+            )
+            calls += keep
+            kept += events if keep else 0
+            total += events
+    return {"extraction_calls": calls, "recall": kept / total if total else 1.0}
+
+
+def fit_thresholds(
+    scores: Dict[int, Dict[str, float]],
+    counts: Dict[int, Dict[str, int]],
+    event_types: List[str],
+    min_recall: float,
+    max_threshold: float = 0.9,
+) -> Dict[str, float]:
+    """Thresholds saving the most extraction calls at a classification
+    recall of at least min_recall.
+
+    Every type starts at DEFAULT_THRESHOLD and is only raised, so no type
+    gets more extraction calls than with the default.
+    """
+    options = {
+        t: candidate_thresholds([s.get(t, 0.0) for s in scores.values()], max_threshold)
+        for t in event_types
+    }
+    current = {t: 0 for t in event_types}
+
+    def thresholds_with(event_type: Optional[str] = None, option: int = 0):
+        chosen = {t: options[t][i] for t, i in current.items()}
+        if event_type is not None:
+            chosen[event_type] = options[event_type][option]
+        return chosen
+
+    state = evaluate(thresholds_with(), scores, counts, event_types)
+    if state["recall"] < min_recall:
+        logger.warning(
+            f"Recall is {state['recall']:.3f} already at {DEFAULT_THRESHOLD}, "
+            f"below the required {min_recall:.3f}"
+        )
+        return thresholds_with()
+
+    while True:
+        best = None
+        for event_type in event_types:
+            for option in range(current[event_type] + 1, len(options[event_type])):
+                candidate = evaluate(
+                    thresholds_with(event_type, option), scores, counts, event_types
+                )
+                if candidate["recall"] < min_recall:
+                    break
+                saved = state["extraction_calls"] - candidate["extraction_calls"]
+                lost = state["recall"] - candidate["recall"]
+                if saved <= 0:
+                    continue
+                # Lossless steps first, then calls saved per recall lost
+                rank = (lost <= 0, saved / lost if lost > 0 else saved)
+                if best is None or rank > best[0]:
+                    best = (rank, event_type, option, candidate)
+        if best is None:
+            return thresholds_with()
+        _, event_type, option, state = best
+        current[event_type] = option
+
+
+def score_paragraphs(
+    processor, texts: Dict[int, str], scores_path: Optional[str] = None
+) -> Dict[int, Dict[str, float]]:
+    """Classification confidences per paragraph, reusing those in scores_path."""
+    scores: Dict[int, Dict[str, float]] = {}
+    if scores_path and os.path.exists(scores_path):
+        with open(scores_path) as f:
+            scores = {int(i): s for i, s in json.load(f).items()}
+    for index, text in sorted(texts.items()):
+        if index not in scores:
+            logger.info(f"Classifying paragraph {index}")
+            scores[index] = processor.classification_scores(text)
+            if scores_path:
+                with open(scores_path, "w") as f:
+                    json.dump(scores, f, indent=2)
+    return {i: scores[i] for i in texts}
+
+
+def format_report(
+    thresholds: Dict[str, float],
+    scores: Dict[int, Dict[str, float]],
+    counts: Dict[int, Dict[str, int]],
+    event_types: List[str],
+) -> str:
+    rows = [["type", "threshold", "calls@0.5", "calls", "events", "kept@0.5", "kept"]]
+    for event_type in event_types:
+        before = after = kept_before = kept_after = events = 0
+        for index, paragraph_scores in scores.items():
+            score = paragraph_scores.get(event_type, 0.0)
+            n = counts.get(index, {}).get(event_type, 0)
+            events += n
+            before += score > DEFAULT_THRESHOLD
+            after += score > thresholds[event_type]
+            kept_before += n if score > DEFAULT_THRESHOLD else 0
+            kept_after += n if score > thresholds[event_type] else 0
+        rows.append(
+            [event_type, str(thresholds[event_type])]
+            + [str(v) for v in (before, after, events, kept_before, kept_after)]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows
+    )
+
+
+if __name__ == "__main__":
+    from event_extraction import BiographyProcessor
+    from llama_client import LLAMA_API_URL, RateLimitedClient, RetryPolicy, create_client
+    from llm_cache import CachedClient, LLMCache
+    from routing import ModelRouter
+
+    parser = argparse.ArgumentParser(description="Fit per-type classification thresholds")
+    parser.add_argument("--annotations", default="evaluation-app/*.json")
+    parser.add_argument("--schema", default="event_schema.json")
+    parser.add_argument("--examples", default="examples.json")
+    parser.add_argument("--subject", default="Andrea Costa")
+    parser.add_argument("--base-url", default=LLAMA_API_URL)
+    parser.add_argument("--models", help="Model routing config, as for the extraction")
+    parser.add_argument("--cache", help="SQLite LLM response cache")
+    parser.add_argument("--scores", help="JSON file keeping the classification confidences")
+    parser.add_argument(
+        "--published-recall",
+        type=float,
+        default=0.982,
+        help="End-to-end recall measured with the 0.5 threshold",
+    )
+    parser.add_argument("--target-recall", type=float, default=0.982)
+    parser.add_argument(
+        "--max-threshold",
+        type=float,
+        default=0.9,
+        help="Upper bound of any threshold, so no type is switched off entirely",
+    )
+    parser.add_argument("--output", default="thresholds.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    texts, counts = load_annotations(args.annotations)
+    client = RateLimitedClient(create_client(args.base_url), RetryPolicy())
+    if args.cache:
+        client = CachedClient(client, LLMCache(args.cache))
+    processor = BiographyProcessor(
+        args.schema,
+        examples_path=args.examples,
+        client=client,
+        subject=args.subject,
+        router=ModelRouter.from_config(args.models) if args.models else None,
+    )
+    event_types = list(processor.schemas)
+    scores = score_paragraphs(processor, texts, args.scores)
+    baseline = evaluate({}, scores, counts, event_types)
+    # Estimated end-to-end recall = published * recall / baseline recall
+    min_recall = baseline["recall"] * args.target_recall / args.published_recall
+    thresholds = fit_thresholds(
+        scores, counts, event_types, min_recall, args.max_threshold
+    )
+    fitted = evaluate(thresholds, scores, counts, event_types)
+    fitted["estimated_recall"] = round(
+        args.published_recall * fitted["recall"] / baseline["recall"], 4
+    ) if baseline["recall"] else None
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "default": DEFAULT_THRESHOLD,
+                "thresholds": thresholds,
+                "target_recall": args.target_recall,
+                "paragraphs": len(texts),
+                "baseline": baseline,
+                "fitted": fitted,
+            },
+            f,
+            indent=2,
+        )
+    print(format_report(thresholds, scores, counts, event_types))
+    print(
+        f"Extraction calls {baseline['extraction_calls']} -> {fitted['extraction_calls']}, "
+        f"classification recall {baseline['recall']:.3f} -> {fitted['recall']:.3f}, "
+        f"estimated recall {fitted['estimated_recall']}"
+    )
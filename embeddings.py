@@ -0,0 +1,184 @@
+"""Local sentence-embedding helpers used to avoid LLM calls.
+
+EmbeddingClassifier scores paragraphs against per-type centroids built from
+the few-shot examples and the annotated evaluation datasets, and only
+decides on its own when the best match is clear. ExampleIndex picks the
+few-shot examples closest to a paragraph.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from sklearn.metrics.pairwise import cosine_similarity
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+NO_EVENT = "NONE"
+
+
+def load_labelled_paragraphs(
+    examples_path: Optional[str], dataset_paths: Iterable[str]
+) -> Dict[str, List[str]]:
+    """Collect training texts per label.
+
+    Examples contribute their input_text under their event type. Dataset
+    paragraphs (the paragraph_index/paragraph_text/events format written by
+    process_biography) contribute their text under every annotated type, or
+    under NO_EVENT when they have no events.
+    """
+    texts = {}
+
+    def add(label: str, text: str) -> None:
+        if text and text not in texts.setdefault(label, []):
+            texts[label].append(text)
+
+    if examples_path:
+        with open(examples_path, encoding="utf-8") as f:
+            for ex in json.load(f)["examples"]:
+                add(ex["event"]["type"], ex["input_text"])
+
+    for path in dataset_paths:
+        with open(path, encoding="utf-8") as f:
+            for paragraph in json.load(f):
+                types = {e["type"] for e in paragraph.get("events", [])}
+                for event_type in types or {NO_EVENT}:
+                    add(event_type, paragraph["paragraph_text"])
+
+    return texts
+
+
+class EmbeddingClassifier:
+    def __init__(
+        self,
+        examples_path: Optional[str] = "examples.json",
+        dataset_paths: Iterable[str] = ("evaluation-app/events.json",),
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        accept_threshold: float = 0.6,
+        margin: float = 0.1,
+        decisive_types: Iterable[str] = ("BIRTH", "DEATH", NO_EVENT),
+        model: Optional[SentenceTransformer] = None,
+    ):
+        """
+        A paragraph is decided locally only if its best centroid is one of
+        decisive_types, its similarity is at least accept_threshold and it
+        beats the runner-up by at least margin. Everything else escalates.
+        """
+        self.model = model or SentenceTransformer(model_name)
+        self.accept_threshold = accept_threshold
+        self.margin = margin
+        self.decisive_types = set(decisive_types)
+        self.decided = 0
+        self.escalated = 0
+
+        texts = load_labelled_paragraphs(examples_path, dataset_paths)
+        self.labels = sorted(texts)
+        centroids = []
+        for label in self.labels:
+            embeddings = self.model.encode(texts[label], normalize_embeddings=True)
+            centroid = embeddings.mean(axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+        self.centroids = np.vstack(centroids)
+        logger.info(
+            f"Built embedding centroids for {', '.join(self.labels)} "
+            f"from {sum(len(t) for t in texts.values())} paragraphs"
+        )
+
+    def scores(self, text: str) -> Dict[str, float]:
+        embedding = self.model.encode([text], normalize_embeddings=True)
+        similarities = cosine_similarity(embedding, self.centroids)[0]
+        return dict(zip(self.labels, similarities.tolist()))
+
+    def classify(self, text: str) -> Optional[List[dict]]:
+        """Return classifications in the _classify_paragraph format, or None to escalate.
+
+        A confident NO_EVENT decision is returned as an empty list.
+        """
+        ranked = sorted(self.scores(text).items(), key=lambda item: -item[1])
+        best, best_score = ranked[0]
+        runner_up, runner_up_score = ranked[1] if len(ranked) > 1 else (None, -1.0)
+        if (
+            best in self.decisive_types
+            and best_score >= self.accept_threshold
+            and best_score - runner_up_score >= self.margin
+        ):
+            self.decided += 1
+            if best == NO_EVENT:
+                return []
+            return [
+                {
+                    "type": best,
+                    "confidence": round(best_score, 3),
+                    "reason": f"embedding pre-classifier (margin {best_score - runner_up_score:.3f} over {runner_up})",
+                }
+            ]
+        self.escalated += 1
+        return None
+
+
+class ExampleIndex:
+    """Embedding index over the few-shot examples, bucketed by event type.
+
+    Embeddings are computed once and persisted to index_path; the file is
+    reused as long as the examples and the model have not changed.
+    """
+
+    def __init__(
+        self,
+        examples: List[dict],
+        index_path: Optional[str] = "examples_index.npz",
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        model: Optional[SentenceTransformer] = None,
+    ):
+        self.examples = examples
+        self.model_name = model_name
+        self._model = model
+        self.buckets = {}
+        for position, ex in enumerate(examples):
+            self.buckets.setdefault(ex["event"]["type"], []).append(position)
+
+        fingerprint = hashlib.sha256(
+            json.dumps(
+                [model_name, [ex["input_text"] for ex in examples]], ensure_ascii=False
+            ).encode("utf-8")
+        ).hexdigest()
+
+        self.embeddings = None
+        if index_path and os.path.exists(index_path):
+            stored = np.load(index_path)
+            if str(stored["fingerprint"]) == fingerprint:
+                self.embeddings = stored["embeddings"]
+                logger.info(f"Loaded example embeddings from {index_path}")
+        if self.embeddings is None:
+            self.embeddings = self.model.encode(
+                [ex["input_text"] for ex in examples], normalize_embeddings=True
+            )
+            if index_path:
+                np.savez(
+                    index_path,
+                    fingerprint=np.array(fingerprint),
+                    embeddings=self.embeddings,
+                )
+                logger.info(f"Saved example embeddings to {index_path}")
+
+    @property
+    def model(self) -> SentenceTransformer:
+        # Only loaded when embeddings have to be computed
+        if self._model is None:
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def nearest(self, event_type: str, text: str, k: int = 3) -> List[dict]:
+        """Return the k examples of event_type most similar to text, best first."""
+        positions = self.buckets.get(event_type, [])
+        if len(positions) <= k:
+            return [self.examples[p] for p in positions]
+        query = self.model.encode([text], normalize_embeddings=True)
+        similarities = cosine_similarity(query, self.embeddings[positions])[0]
+        best = np.argsort(-similarities)[:k]
+        return [self.examples[positions[i]] for i in best]
@@ -1,10 +1,46 @@
+import argparse
+import asyncio
+import contextvars
 import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict, Optional
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from types import SimpleNamespace
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
 import logging
-from llama_client import llama_client
+from calibration import DEFAULT_THRESHOLD, load_thresholds
+from embeddings import EmbeddingClassifier, ExampleIndex
+from event_schemas import joint_response_format, response_formats
+from routing import ModelRouter
+from json_stream import EventStreamParser
+from validation import EventValidator, Violation, apply_repairs, format_path, repair_prompt
+from hedging import Hedger
+from instrumentation import Tracer, tagged
+from llama_client import (
+    LLAMA_API_URL,
+    AsyncRateLimitedClient,
+    RateLimitedClient,
+    RetryPolicy,
+    async_llama_client,
+    create_async_client,
+    create_client,
+    llama_client,
+)
+from llm_cache import (
+    AsyncCachedClient,
+    CachedClient,
+    LLMCache,
+    aclose_stream,
+    close_stream,
+    replay_chunks,
+    replay_stream_async,
+)
+from prompt_templates import PromptTemplates, format_examples
+from results_io import content_hash, load_previous_results, open_result_writer
+from segmentation import Segment, Segmenter, assign_events, group_segments
+from token_budget import TokenBudget
 from json_repair import repair_json
 
 
@@ -140,256 +176,1309 @@ class Event:
     data: Dict
     confidence: float = 0.0
 
+def loads_json(content: str) -> Tuple[object, bool]:
+    """Parse a model answer, running repair_json only if it is not valid JSON.
+
+    Returns the parsed value and whether it had to be repaired.
+    """
+    try:
+        return json.loads(content), False
+    except (TypeError, ValueError):
+        logger.debug("Answer is not valid JSON, repairing it")
+        return json.loads(repair_json(content, ensure_ascii=False)), True
+
 
 class BiographyProcessor:
-    def __init__(self, schema_path: str, examples_path: str = "examples.json"):
+    def __init__(
+        self,
+        schema_path: str,
+        examples_path: str = "examples.json",
+        client=None,
+        async_client=None,
+        extraction_workers: int = 4,
+        fused_types: Iterable[str] = (),
+        pre_classifier: Optional[EmbeddingClassifier] = None,
+        example_index_path: Optional[str] = None,
+        few_shot_k: int = 3,
+        token_budget: Optional[TokenBudget] = None,
+        event_history: Optional[int] = 1000,
+        subject: str = "Andrea Costa",
+        hedger: Optional[Hedger] = None,
+        tracer: Optional[Tracer] = None,
+        guided_decoding: bool = False,
+        repair_attempts: int = 1,
+        router: Optional[ModelRouter] = None,
+        joint_extraction: bool = False,
+        thresholds_path: Optional[str] = None,
+        stream: bool = False,
+    ):
         with open(schema_path) as f:
             self.schemas = json.load(f)
         with open(examples_path) as f:
             self.examples = json.load(f)["examples"]
-        self.events = []
+        # Recent events only; the run results are streamed by the writers
+        self.events = deque(maxlen=event_history)
+        self.client = client or llama_client
+        self.async_client = async_client or async_llama_client
+        # Per-type extraction chains of a paragraph run concurrently
+        self.extraction_workers = extraction_workers
+        # Event types extracted with one fused call instead of questionnaire + JSON
+        self.fused_types = set(fused_types)
+        # Local embedding classifier consulted before the LLM classification
+        self.pre_classifier = pre_classifier
+        # Few-shot examples: the first few_shot_k of each type, or the
+        # few_shot_k nearest ones when an embedding index path is given
+        self.few_shot_k = few_shot_k
+        self.example_index = (
+            ExampleIndex(self.examples, index_path=example_index_path)
+            if example_index_path
+            else None
+        )
+        # Prompt/completion token accounting and max_tokens sizing
+        self.token_budget = token_budget
+        # Per-stage deadlines and hedging of slow calls
+        self.hedger = hedger
+        # Structured per-call latency/token/parse records
+        self.tracer = tracer
+        # JSON Schema response formats constraining the extraction answers
+        self.response_formats = (
+            response_formats(self.schemas) if guided_decoding else {}
+        )
+        # One compiled validator per event type; invalid events get up to
+        # repair_attempts re-asks for their invalid fields only
+        self.validator = EventValidator(self.schemas)
+        self.repair_attempts = repair_attempts
+        # Model of each stage, and escalation of uncertain classifications
+        self.router = router or ModelRouter()
+        # Paragraphs of several types are extracted with one call for all of
+        # them; types whose joint output is invalid go through _extract_events
+        self.joint_extraction = joint_extraction
+        self.guided_decoding = guided_decoding
+        # Stream the per-type extraction answers and validate each event as
+        # soon as its object closes
+        self.stream = stream
+        # Per-type classification confidence thresholds (calibration.py)
+        self.default_threshold, self.thresholds = (
+            load_thresholds(thresholds_path)
+            if thresholds_path
+            else (DEFAULT_THRESHOLD, {})
+        )
+        # Static few-shot examples are rendered into the prompt prefixes once
+        self.static_examples = {}
+        if self.example_index is None:
+            for ex in self.examples:
+                bucket = self.static_examples.setdefault(ex["event"]["type"], [])
+                if len(bucket) < few_shot_k:
+                    bucket.append(ex)
+        self.subject = None
+        self.set_subject(subject)
+
+    def set_subject(self, subject: str) -> None:
+        """Point the prompts at another biography subject, e.g. between documents."""
+        if subject == self.subject:
+            return
+        self.subject = subject
+        self.prompts = PromptTemplates.build(
+            self.schemas,
+            QUESTION_SETS,
+            {t: format_examples(exs) for t, exs in self.static_examples.items()},
+            subject=subject,
+        )
 
     def process_paragraph(
-        self, text: str, prev_context: str = "", next_context: str = ""
+        self,
+        text: str,
+        prev_context: str = "",
+        next_context: str = "",
+        classifications: Optional[List[dict]] = None,
     ) -> List[Event]:
-        # 1. Classify paragraph with confidence filtering
-        event_classifications = self._classify_paragraph(
-            text, prev_context, next_context
-        )
+        # 1. Classify paragraph with confidence filtering, unless already
+        # classified as part of a batch
+        if classifications is None:
+            event_classifications = self._classify_paragraph(
+                text, prev_context, next_context
+            )
+        else:
+            event_classifications = classifications
         if not event_classifications:
             logger.info(
                 "No high-confidence classifications found for this paragraph. Skipping extraction."
             )
             return []  # Skip further processing for this paragraph.
 
-        # 2. Extract events for each high-confidence type
-        paragraph_events = []
+        # 2. Extract events for each high-confidence type, one chain per type
         for event in event_classifications:
-            event_type = event["type"]
-            confidence = event["confidence"]
             logger.info(
-                f"Processing event type: {event_type} with confidence {confidence}"
+                f"Processing event type: {event['type']} with confidence {event['confidence']}"
+            )
+
+        joint_events = {}
+        if self.joint_extraction and len(event_classifications) > 1:
+            joint_events = self._extract_events_joint(
+                text,
+                [e["type"] for e in event_classifications],
+                prev_context,
+                next_context,
             )
+        pending = [e for e in event_classifications if e["type"] not in joint_events]
+
+        # Worker threads run in a copy of this context to keep its trace tags
+        context = contextvars.copy_context()
+
+        def extract(event: dict) -> List[Event]:
+            return context.copy().run(extract_tagged, event)
 
-            events = self._extract_events(text, event_type, prev_context, next_context)
-            paragraph_events.extend(events)
+        def extract_tagged(event: dict) -> List[Event]:
+            with tagged(event_type=event["type"]):
+                return self._extract_events(
+                    text, event["type"], prev_context, next_context
+                )
+
+        if self.extraction_workers > 1 and len(pending) > 1:
+            workers = min(self.extraction_workers, len(pending))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # map() yields in submission order, so the merge is deterministic
+                extracted = list(executor.map(extract, pending))
+        else:
+            extracted = [extract(event) for event in pending]
+        per_type_events = merge_extractions(
+            event_classifications, joint_events, extracted
+        )
 
+        paragraph_events = [e for events in per_type_events for e in events]
         self.events.extend(paragraph_events)
         return paragraph_events
 
+    async def process_paragraph_async(
+        self,
+        text: str,
+        prev_context: str = "",
+        next_context: str = "",
+        classifications: Optional[List[dict]] = None,
+    ) -> List[Event]:
+        """Async counterpart of process_paragraph, using self.async_client."""
+        if classifications is None:
+            event_classifications = await self._classify_paragraph_async(
+                text, prev_context, next_context
+            )
+        else:
+            event_classifications = classifications
+        if not event_classifications:
+            logger.info(
+                "No high-confidence classifications found for this paragraph. Skipping extraction."
+            )
+            return []
+
+        for event in event_classifications:
+            logger.info(
+                f"Processing event type: {event['type']} with confidence {event['confidence']}"
+            )
+
+        joint_events = {}
+        if self.joint_extraction and len(event_classifications) > 1:
+            joint_events = await self._extract_events_joint_async(
+                text,
+                [e["type"] for e in event_classifications],
+                prev_context,
+                next_context,
+            )
+        pending = [e for e in event_classifications if e["type"] not in joint_events]
+
+        async def extract(event: dict) -> List[Event]:
+            with tagged(event_type=event["type"]):
+                return await self._extract_events_async(
+                    text, event["type"], prev_context, next_context
+                )
+
+        # gather() returns results in argument order, whatever finishes first
+        extracted = await asyncio.gather(*(extract(event) for event in pending))
+        per_type_events = merge_extractions(
+            event_classifications, joint_events, extracted
+        )
+        return [e for events in per_type_events for e in events]
+
+    def _complete(self, stage: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            # The cache is looked up before the hedger, so cache hits neither
+            # skew its latency window nor count against the deadline
+            response = None
+            create = self.client.chat.completions.create
+            if isinstance(self.client, CachedClient):
+                response = self.client.lookup(**kwargs)
+                create = self.client.fetch
+            if response is None and self.hedger is not None:
+                response = self.hedger.call(stage, lambda: create(**kwargs))
+            elif response is None:
+                response = create(**kwargs)
+        except Exception as e:
+            self._trace_call(stage, started, error=e)
+            raise
+        self._trace_call(stage, started, response)
+        self._record_usage(stage, kwargs, response)
+        return response
+
+    async def _complete_async(self, stage: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = None
+            create = self.async_client.chat.completions.create
+            if isinstance(self.async_client, AsyncCachedClient):
+                response = self.async_client.lookup(**kwargs)
+                create = self.async_client.fetch
+            if response is None and self.hedger is not None:
+                response = await self.hedger.call_async(
+                    stage, lambda: create(**kwargs)
+                )
+            elif response is None:
+                response = await create(**kwargs)
+        except Exception as e:
+            self._trace_call(stage, started, error=e)
+            raise
+        self._trace_call(stage, started, response)
+        self._record_usage(stage, kwargs, response)
+        return response
+
+    def _stream(self, stage: str, result: SimpleNamespace, **kwargs) -> Iterator[str]:
+        """Content pieces of a streamed completion.
+
+        The call is traced once the stream ends, and result.usage is set
+        from the usage chunk of servers that send one. A cache hit is
+        replayed as a stream; a miss is cached once the stream ends.
+        """
+        started = time.perf_counter()
+        result.usage = None
+        kwargs.update(stream=True, stream_options={"include_usage": True})
+        stream = None
+        try:
+            create = self.client.chat.completions.create
+            if isinstance(self.client, CachedClient):
+                cached = self.client.lookup(**kwargs)
+                if cached is not None:
+                    stream = iter(replay_chunks(cached))
+                create = self.client.fetch
+            if stream is None and self.hedger is not None:
+                # Not hedged, but the stage's deadline covers the whole stream
+                stream = self.hedger.stream(stage, lambda: create(**kwargs))
+            elif stream is None:
+                stream = create(**kwargs)
+            for chunk in stream:
+                result.usage = getattr(chunk, "usage", None) or result.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            self._trace_call(stage, started, error=e)
+            raise
+        finally:
+            close_stream(stream)
+        self._trace_call(stage, started, result)
+        self._record_usage(stage, kwargs, result)
+
+    async def _stream_async(
+        self, stage: str, result: SimpleNamespace, **kwargs
+    ) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        result.usage = None
+        kwargs.update(stream=True, stream_options={"include_usage": True})
+        stream = None
+        try:
+            create = self.async_client.chat.completions.create
+            if isinstance(self.async_client, AsyncCachedClient):
+                cached = self.async_client.lookup(**kwargs)
+                if cached is not None:
+                    stream = replay_stream_async(cached)
+                create = self.async_client.fetch
+            if stream is None and self.hedger is not None:
+                stream = self.hedger.stream_async(stage, lambda: create(**kwargs))
+            elif stream is None:
+                stream = await create(**kwargs)
+            async for chunk in stream:
+                result.usage = getattr(chunk, "usage", None) or result.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            self._trace_call(stage, started, error=e)
+            raise
+        finally:
+            await aclose_stream(stream)
+        self._trace_call(stage, started, result)
+        self._record_usage(stage, kwargs, result)
+
+    def _trace_call(
+        self, stage: str, started: float, response=None, error: Optional[Exception] = None
+    ) -> None:
+        if self.tracer is not None:
+            self.tracer.record_call(
+                stage, time.perf_counter() - started, response, error
+            )
+
+    def _trace_parse(
+        self,
+        stage: str,
+        failed: bool,
+        repaired: bool,
+        events: Optional[int] = None,
+    ) -> None:
+        if self.tracer is not None:
+            self.tracer.record_parse(
+                stage, repair_calls=int(repaired), failed=failed, events=events
+            )
+
+    def _record_usage(self, stage: str, request: dict, response) -> None:
+        if self.token_budget is not None:
+            self.token_budget.record(
+                stage, request.get("max_tokens"), getattr(response, "usage", None)
+            )
+
+    def _observe_events(self, event_type: str, response, events: List[Event]) -> None:
+        if self.token_budget is not None:
+            self.token_budget.observe_events(
+                event_type, getattr(response, "usage", None), len(events)
+            )
+
+    def _fit_request(self, request: dict) -> dict:
+        """Shrink max_tokens so that prompt and completion fit the context window."""
+        if self.token_budget is not None:
+            prompt_tokens = self.token_budget.count(request["messages"][-1]["content"])
+            request["max_tokens"] = self.token_budget.fit(
+                prompt_tokens, request["max_tokens"]
+            )
+        return request
+
+    def _response_format(self, event_type: str) -> dict:
+        return self.response_formats.get(event_type, {"type": "json_object"})
+
+    def _classification_request(self, text: str, model: str) -> dict:
+        prompt = self.prompts.classification.render(text=text)
+        request = dict(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            max_tokens=1000,
+            response_format={"type": "json_object"},
+        )
+        return self._fit_request(request)
+
+    def _batch_classification_request(self, texts: List[str]) -> dict:
+        numbered = "\n".join(
+            f"Paragraph {i + 1}: {text}" for i, text in enumerate(texts)
+        )
+        prompt = self.prompts.batch_classification.render(numbered=numbered)
+        request = dict(
+            model=self.router.model("classification"),
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            max_tokens=min(400 * len(texts), 8000),
+            response_format={"type": "json_object"},
+        )
+        return self._fit_request(request)
+
+    def _filter_classifications(self, classifications: List) -> List[dict]:
+        # Filter by the confidence threshold of each type; types are matched
+        # upper-cased, as in the schema, the thresholds and classification_scores.
+        # Entries without a string type and a numeric confidence are dropped.
+        if not isinstance(classifications, list):
+            logger.warning(f"Unexpected classification answer: {classifications!r}")
+            return []
+        classifications = [
+            dict(c, type=c["type"].upper())
+            for c in classifications
+            if isinstance(c, dict)
+            and isinstance(c.get("type"), str)
+            and isinstance(c.get("confidence"), (int, float))
+            and not isinstance(c["confidence"], bool)
+        ]
+        filtered_classifications = [
+            c
+            for c in classifications
+            if c["confidence"] > self.thresholds.get(c["type"], self.default_threshold)
+        ]
+
+        logger.info(f"Filtered classifications: {filtered_classifications}")
+        return filtered_classifications
+
+    def _parse_classifications(self, content: str) -> List[dict]:
+        logger.debug(f"Raw response content: {content}")
+
+        # Parse the JSON content
+        try:
+            classifications, repaired = loads_json(content)
+        except ValueError:
+            self._trace_parse("classification", failed=True, repaired=True)
+            raise
+        self._trace_parse("classification", failed=False, repaired=repaired)
+
+        # Ensure we have a list of classifications
+        if isinstance(classifications, dict):
+            # If we got a dict with a key containing the array, try to get it
+            for key in classifications:
+                if isinstance(classifications[key], list):
+                    classifications = classifications[key]
+                    break
+            # If we still have a dict, wrap it in a list
+            if isinstance(classifications, dict):
+                classifications = [classifications]
+
+        return classifications
+
+    def _parse_batch_classifications(
+        self, content: str, count: int
+    ) -> List[List[dict]]:
+        """Split a batched answer into per-paragraph classifications.
+
+        Raises ValueError unless there is exactly one well-formed entry per
+        paragraph, so the caller can fall back to single-paragraph calls.
+        """
+        logger.debug(f"Raw batch response content: {content}")
+        try:
+            parsed, repaired = loads_json(content)
+        except ValueError:
+            self._trace_parse("classification", failed=True, repaired=True)
+            raise
+        if isinstance(parsed, dict):
+            parsed = parsed.get("results")
+        if not isinstance(parsed, list) or len(parsed) != count:
+            self._trace_parse("classification", failed=True, repaired=repaired)
+            raise ValueError(f"Expected {count} paragraph entries, got {parsed!r}")
+        self._trace_parse("classification", failed=False, repaired=repaired)
+
+        by_paragraph = {}
+        for entry in parsed:
+            if not isinstance(entry, dict) or not isinstance(
+                entry.get("classifications"), list
+            ):
+                raise ValueError(f"Malformed paragraph entry: {entry!r}")
+            by_paragraph[int(entry.get("paragraph", 0))] = entry["classifications"]
+        if set(by_paragraph) != set(range(1, count + 1)):
+            raise ValueError(f"Unexpected paragraph numbers: {list(by_paragraph)}")
+
+        return [by_paragraph[i] for i in range(1, count + 1)]
+
+    def _pre_classify(self, text: str) -> Optional[List[dict]]:
+        if self.pre_classifier is None:
+            return None
+        decision = self.pre_classifier.classify(text)
+        if decision is not None:
+            logger.info(f"Pre-classifier decided without LLM call: {decision}")
+        return decision
+
+    def _classification_model(self, stage: str) -> str:
+        if stage == "escalation":
+            return self.router.escalation_model
+        return self.router.model("classification")
+
     def _classify_paragraph(
         self, text: str, prev_context: str, next_context: str
     ) -> List[dict]:
-        confidence_threshold = 0.5
-        prompt = f"""The following text contains a snippet of the biography of Andrea Costa. 
-        Classify the text depending on what's being discussed. 
-        Use one or more of the following classes and return the JSON array of classification. 
-        The event must be categorized indipendently of whether the event is happening to Andrea Costa or to someone mentioned in his biography.
-        BIRTH: the birth of one or more humans. For example, the birth of Andrea Costa, the birth of person who is close to him, etc. 
-        RELATIONSHIP: any relationship between two humans; friendship; friendly collaboration; the marriage of one or more humans. Not relatives (e.g. becoming a dad of a child). For example, the marriage of two people, two people becoming friends; of Andrea Costa, etc. 
-        EDUCATION: the education and upbringing of a person. Going to school, university, studying somewhere or with someone. 
-        EMPLOYMENT: the employment of someone or someone working at a specific thing. For example, going to work for a new contractor; working on a new project; working on a book. 
-        POLITICS: the political activity of someone or of a group. For example, the birth of a movement, the failure of a party, election, Andrea Costa being elected.  
-        DOCUMENT: the creation of a document, an artifact, or other relevant creation. For example, Andrea Costa writing a book.
-        DEATH: the death of an entity. For example, Andrea Costa's death, a close friend's, etc.
-        Text: {text}
-
-        Return only a JSON array of classifications. If no proper classification is possible, return any class with 0.0 confidence. 
-        [{{"type": "EVENT_TYPE", "confidence": 0.0-1.0, "reason": "explanation"}}]
-        """
+        decision = self._pre_classify(text)
+        if decision is not None:
+            return decision
+        return self._llm_classify_paragraph(text)
 
+    def _llm_classify_paragraph(
+        self, text: str, stage: str = "classification"
+    ) -> List[dict]:
+        return self._filter_classifications(self._llm_classifications(text, stage))
+
+    def _llm_classifications(self, text: str, stage: str = "classification") -> List:
+        """Unfiltered classifications of a paragraph, after any escalation."""
+        model = self._classification_model(stage)
         try:
-            response = llama_client.chat.completions.create(
-                model="llama3.3-70b",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.0,
-                max_tokens=1000,
-                response_format={"type": "json_object"},
+            response = self._complete(
+                stage, **self._classification_request(text, model)
             )
 
             # Extract content from response properly
             content = response.choices[0].message.content
-            logger.info(f"Raw response content: {content}")
+            classifications = self._parse_classifications(content)
 
-            # Parse the JSON content
-            classifications = json.loads(repair_json(content))
+        except Exception as e:
+            if not self.router.should_escalate(model, None):
+                logger.error(f"Classification failed: {str(e)}", exc_info=True)
+                return []
+            logger.warning(f"Classification failed, escalating: {e}")
+            classifications = None
+        if self.router.should_escalate(model, classifications):
+            return self._llm_classifications(text, stage="escalation")
+        return classifications
 
-            # Ensure we have a list of classifications
-            if isinstance(classifications, dict):
-                # If we got a dict with a key containing the array, try to get it
-                for key in classifications:
-                    if isinstance(classifications[key], list):
-                        classifications = classifications[key]
-                        break
-                # If we still have a dict, wrap it in a list
-                if isinstance(classifications, dict):
-                    classifications = [classifications]
-
-            # Filter by confidence threshold
-            filtered_classifications = [
-                c
-                for c in classifications
-                if isinstance(c, dict) and c.get("confidence", 0) > confidence_threshold
-            ]
-
-            logger.info(f"Filtered classifications: {filtered_classifications}")
-            return filtered_classifications
+    def classification_scores(self, text: str) -> Dict[str, float]:
+        """Highest LLM confidence per event type for a paragraph, before the
+        thresholds are applied (see calibration.py)."""
+        scores = {}
+        for c in self._llm_classifications(text):
+            if isinstance(c, dict) and isinstance(c.get("confidence"), (int, float)):
+                event_type = str(c.get("type", "")).upper()
+                scores[event_type] = max(scores.get(event_type, 0.0), c["confidence"])
+        return scores
+
+    async def _classify_paragraph_async(
+        self, text: str, prev_context: str, next_context: str
+    ) -> List[dict]:
+        decision = await asyncio.to_thread(self._pre_classify, text)
+        if decision is not None:
+            return decision
+        return await self._llm_classify_paragraph_async(text)
+
+    async def _llm_classify_paragraph_async(
+        self, text: str, stage: str = "classification"
+    ) -> List[dict]:
+        model = self._classification_model(stage)
+        try:
+            response = await self._complete_async(
+                stage, **self._classification_request(text, model)
+            )
+            content = response.choices[0].message.content
+            classifications = self._parse_classifications(content)
 
         except Exception as e:
-            logger.error(f"Classification failed: {str(e)}", exc_info=True)
-            return []
+            if not self.router.should_escalate(model, None):
+                logger.error(f"Classification failed: {str(e)}", exc_info=True)
+                return []
+            logger.warning(f"Classification failed, escalating: {e}")
+            classifications = None
+        if self.router.should_escalate(model, classifications):
+            return await self._llm_classify_paragraph_async(text, stage="escalation")
+        return self._filter_classifications(classifications)
 
-    def _extract_events(
+    def classify_paragraphs(self, texts: List[str]) -> List[List[dict]]:
+        """Classify a window of paragraphs with a single request.
+
+        Paragraphs the pre-classifier decides are left out of the request.
+        Falls back to one classification call per paragraph when the batched
+        output is malformed.
+        """
+        decisions = [self._pre_classify(text) for text in texts]
+        pending = [i for i, decision in enumerate(decisions) if decision is None]
+        if len(pending) == 1:
+            decisions[pending[0]] = self._llm_classify_paragraph(texts[pending[0]])
+        elif pending:
+            batch = [texts[i] for i in pending]
+            try:
+                response = self._complete(
+                    "classification", **self._batch_classification_request(batch)
+                )
+                content = response.choices[0].message.content
+                classified = self._parse_batch_classifications(content, len(batch))
+            except Exception as e:
+                logger.warning(
+                    f"Batch classification failed, falling back to single paragraphs: {e}"
+                )
+                classified = [self._llm_classify_paragraph(text) for text in batch]
+            else:
+                classified = [
+                    self._settle_batch_classification(text, classifications)
+                    for text, classifications in zip(batch, classified)
+                ]
+            for i, classifications in zip(pending, classified):
+                decisions[i] = classifications
+        return decisions
+
+    async def classify_paragraphs_async(self, texts: List[str]) -> List[List[dict]]:
+        decisions = [
+            await asyncio.to_thread(self._pre_classify, text) for text in texts
+        ]
+        pending = [i for i, decision in enumerate(decisions) if decision is None]
+        if len(pending) == 1:
+            decisions[pending[0]] = await self._llm_classify_paragraph_async(
+                texts[pending[0]]
+            )
+        elif pending:
+            batch = [texts[i] for i in pending]
+            try:
+                response = await self._complete_async(
+                    "classification", **self._batch_classification_request(batch)
+                )
+                content = response.choices[0].message.content
+                classified = self._parse_batch_classifications(content, len(batch))
+            except Exception as e:
+                logger.warning(
+                    f"Batch classification failed, falling back to single paragraphs: {e}"
+                )
+                classified = await asyncio.gather(
+                    *(self._llm_classify_paragraph_async(text) for text in batch)
+                )
+            else:
+                classified = await asyncio.gather(
+                    *(
+                        self._settle_batch_classification_async(text, classifications)
+                        for text, classifications in zip(batch, classified)
+                    )
+                )
+            for i, classifications in zip(pending, classified):
+                decisions[i] = classifications
+        return decisions
+
+    def _settle_batch_classification(
+        self, text: str, classifications: List
+    ) -> List[dict]:
+        """Filter a paragraph's share of a batched answer, or escalate it."""
+        model = self.router.model("classification")
+        if self.router.should_escalate(model, classifications):
+            return self._llm_classify_paragraph(text, stage="escalation")
+        return self._filter_classifications(classifications)
+
+    async def _settle_batch_classification_async(
+        self, text: str, classifications: List
+    ) -> List[dict]:
+        model = self.router.model("classification")
+        if self.router.should_escalate(model, classifications):
+            return await self._llm_classify_paragraph_async(text, stage="escalation")
+        return self._filter_classifications(classifications)
+
+    def _questionnaire_request(
+        self, text: str, event_type: str, prev_context: str, next_context: str
+    ) -> Optional[dict]:
+        if not self.schemas.get(event_type):
+            return None
+
+        template = self.prompts.questionnaire.get(event_type)
+        if template is None:
+            logger.warning(f"No questions defined for event type: {event_type}")
+            return None
+
+        def render(prev_context: str, next_context: str) -> str:
+            return template.render(
+                text=text,
+                prev_context=prev_context or "None",
+                next_context=next_context or "None",
+            )
+
+        max_tokens = 2500
+        if self.token_budget is not None:
+            prev_context, next_context = self.token_budget.trim_context(
+                render, prev_context, next_context, max_tokens
+            )
+
+        # Prompt 1: Ask questions about the text
+        question_prompt = render(prev_context, next_context)
+        request = dict(
+            model=self.router.model("questionnaire"),
+            messages=[{"role": "user", "content": question_prompt}],
+            temperature=0.0,
+            max_tokens=max_tokens,
+        )
+        return self._fit_request(request)
+
+    def _examples_section(self, event_type: str, text: str) -> Optional[str]:
+        """The per-call examples field of the JSON and fused templates.
+
+        Without an example index the examples are static and already part
+        of the template prefix, so this is empty.
+        """
+        if self.example_index is None:
+            if event_type not in self.static_examples:
+                logger.warning(f"No examples found for event type: {event_type}")
+                return None
+            return ""
+
+        # The few-shot examples closest to the paragraph
+        examples = self.example_index.nearest(event_type, text, k=self.few_shot_k)
+        if not examples:
+            logger.warning(f"No examples found for event type: {event_type}")
+            return None
+        return f"Examples:\n{format_examples(examples)}\n\n"
+
+    def _json_request(
+        self, event_type: str, answers: str, text: str
+    ) -> Optional[dict]:
+        examples = self._examples_section(event_type, text)
+        if examples is None:
+            return None
+
+        json_prompt = self.prompts.json_conversion[event_type].render(
+            examples=examples, answers=answers
+        )
+        max_tokens = 15000
+        if self.token_budget is not None:
+            max_tokens = self.token_budget.json_completion_tokens(
+                event_type, self.token_budget.expected_events(answers)
+            )
+        request = dict(
+            model=self.router.model("json_conversion"),
+            messages=[{"role": "user", "content": json_prompt}],
+            temperature=0.2,
+            max_tokens=max_tokens,
+            response_format=self._response_format(event_type),
+        )
+        return self._fit_request(request)
+
+    def _fused_request(
         self, text: str, event_type: str, prev_context: str, next_context: str
+    ) -> Optional[dict]:
+        """Single-call extraction: the questionnaire is only guidance and the
+        model answers directly with schema-conformant JSON."""
+        if not self.schemas.get(event_type):
+            return None
+
+        template = self.prompts.fused.get(event_type)
+        if template is None:
+            logger.warning(f"No questions defined for event type: {event_type}")
+            return None
+
+        examples = self._examples_section(event_type, text)
+        if examples is None:
+            return None
+
+        def render(prev_context: str, next_context: str) -> str:
+            return template.render(
+                examples=examples,
+                text=text,
+                prev_context=prev_context or "None",
+                next_context=next_context or "None",
+            )
+
+        max_tokens = 15000
+        if self.token_budget is not None:
+            # No answers to count events from: assume one per ~100 tokens of text
+            max_tokens = self.token_budget.json_completion_tokens(
+                event_type, max(1, self.token_budget.count(text) // 100)
+            )
+            prev_context, next_context = self.token_budget.trim_context(
+                render, prev_context, next_context, max_tokens
+            )
+
+        fused_prompt = render(prev_context, next_context)
+        request = dict(
+            model=self.router.model("fused"),
+            messages=[{"role": "user", "content": fused_prompt}],
+            temperature=0.2,
+            max_tokens=max_tokens,
+            response_format=self._response_format(event_type),
+        )
+        return self._fit_request(request)
+
+    def _parse_events(
+        self,
+        json_content: str,
+        event_type: str,
+        text: str,
+        stage: str = "json_conversion",
     ) -> List[Event]:
-        schema = self.schemas.get(event_type)
-        if not schema:
+        try:
+            extracted, repaired = loads_json(json_content)
+        except ValueError:
+            self._trace_parse(stage, failed=True, repaired=True)
+            raise
+
+        if isinstance(extracted, dict) and isinstance(extracted.get("events"), list):
+            # The {"events": [...]} wrapper of guided decoding
+            extracted = extracted["events"]
+        if isinstance(extracted, dict):
+            extracted = [extracted]
+        elif not isinstance(extracted, list):
+            logger.error(f"Unexpected JSON structure: {type(extracted)}")
+            self._trace_parse(stage, failed=True, repaired=repaired)
             return []
 
-        questions = QUESTION_SETS.get(event_type, [])
-        if not questions:
-            logger.warning(f"No questions defined for event type: {event_type}")
+        events = []
+        for data in extracted:
+            if isinstance(data, dict):
+                event = Event(type=event_type, text=text, data=data)
+                events.append(event)
+            else:
+                logger.warning(f"Skipping invalid event data: {data}")
+
+        self._trace_parse(stage, failed=False, repaired=repaired, events=len(events))
+        return events
+
+    def _remaining_events(
+        self, parser: EventStreamParser, event_type: str, text: str, stage: str
+    ) -> List[Event]:
+        """Events of a finished stream that the parser has not returned.
+
+        An answer the parser followed to its end is fully parsed already.
+        Otherwise the full text goes through _parse_events, and the events the
+        parser returned (a prefix of the answer) are skipped.
+        """
+        if parser.complete:
+            self._trace_parse(stage, failed=False, repaired=False, events=parser.events)
             return []
+        try:
+            events = self._parse_events(parser.text, event_type, text, stage=stage)
+        except ValueError:
+            if not parser.events:
+                raise
+            logger.warning(
+                f"Unparseable end of {event_type} answer, "
+                f"keeping its first {parser.events} events"
+            )
+            return []
+        return events[parser.events :]
 
-        # Get the type-specific instructions
-        event_instructions = schema.get("instruction", schema.get("instructions", ""))
+    def _trace_first_event(self, stage: str, started: float) -> None:
+        if self.tracer is not None:
+            self.tracer.record_first_event(stage, time.perf_counter() - started)
 
-        # Prompt 1: Ask questions about the text
-        question_prompt = f"""
-        The following text has been classified as describing a '{event_type}' event in Andrea Costa's life.
-
-        ### Context:
-        EVENT TYPE: {event_type}
-        - **Previous context:** {prev_context or 'None'}
-        - **Target text:** {text}
-        - **Following context:** {next_context or 'None'}
-
-        ### Instructions:
-        1. Read the questions carefully, and only answer the questions with information relevant for the {event_type} context. 
-        2. Read the **target text** with the utmost attention, as it contains the primary information you need.
-        2. If there are more than one event described, return the information for each event separately.
-
-        3. Use the additional context (previous and following) only as supplementary information when the target text alone does not provide clarity.
-        4. Each event is to be considered as a single situation in which there are participants. If there are multiple situations happening, describe them as separate events.
-        5. Assume the event involves Andrea Costa if no explicit subject is mentioned in the target text.
-
-        ### Questions and examples:
-        {chr(10).join(f'- {q}' for q in questions)}
-        
-        
-        ### Requirements:
-        - Provide concise, direct answers to each question in the order listed.
-        - Focus on entities, dates, their actions and only answer the questions from the {event_type} sections of the text. For example:
-        - Avoid speculation or assumptions not supported by the provided text.
-        - Use dates in **DD/MM/YYYY** format or state the year if precise dates are unavailable.
-        - Highlight the specific relations between entities, institutions, and other places if any.
+    def _stream_interrupted(
+        self, stage: str, event_type: str, events: int, error: Exception
+    ) -> None:
+        logger.warning(
+            f"{event_type} stream failed after {events} events, keeping them: {error}"
+        )
+        self._trace_parse(stage, failed=True, repaired=False, events=events)
+
+    def _stream_events(
+        self, stage: str, request: dict, event_type: str, text: str
+    ) -> List[Event]:
+        """Stream an extraction answer and validate each event as it closes.
+
+        If the stream fails partway, the events validated so far are kept;
+        only a stream that failed before its first event raises.
         """
+        started = time.perf_counter()
+        result = SimpleNamespace()
+        parser = EventStreamParser()
+        events, valid = [], []
+        try:
+            for piece in self._stream(stage, result, **request):
+                closed = [
+                    Event(type=event_type, text=text, data=d)
+                    for d in parser.feed(piece)
+                ]
+                if closed and not events:
+                    self._trace_first_event(stage, started)
+                events += closed
+                valid += self._validate_events(closed)
+        except Exception as e:
+            if not events:
+                raise
+            self._stream_interrupted(stage, event_type, len(events), e)
+            return valid
+        remaining = self._remaining_events(parser, event_type, text, stage)
+        if stage == "json_conversion":
+            self._observe_events(event_type, result, events + remaining)
+        return valid + self._validate_events(remaining)
+
+    async def _stream_events_async(
+        self, stage: str, request: dict, event_type: str, text: str
+    ) -> List[Event]:
+        """Like _stream_events, but the validation of an event (and its repair
+        calls) runs concurrently with the rest of the stream."""
+        started = time.perf_counter()
+        result = SimpleNamespace()
+        parser = EventStreamParser()
+        events, tasks = [], []
+        # None when the stream failed partway and only its first events are kept
+        remaining = None
+        try:
+            try:
+                async for piece in self._stream_async(stage, result, **request):
+                    closed = [
+                        Event(type=event_type, text=text, data=d)
+                        for d in parser.feed(piece)
+                    ]
+                    if closed and not events:
+                        self._trace_first_event(stage, started)
+                    events += closed
+                    tasks += [
+                        asyncio.ensure_future(self._validate_events_async([event]))
+                        for event in closed
+                    ]
+            except Exception as e:
+                if not events:
+                    raise
+                self._stream_interrupted(stage, event_type, len(events), e)
+            else:
+                remaining = self._remaining_events(parser, event_type, text, stage)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        if remaining is not None:
+            if stage == "json_conversion":
+                self._observe_events(event_type, result, events + remaining)
+            tasks.append(asyncio.ensure_future(self._validate_events_async(remaining)))
+        validated = await asyncio.gather(*tasks)
+        return [event for events in validated for event in events]
+
+    def _repair_request(self, event: Event, violations: List[Violation]) -> dict:
+        request = dict(
+            model=self.router.model("repair"),
+            messages=[
+                {
+                    "role": "user",
+                    "content": repair_prompt(
+                        event.type, event.data, violations, event.text
+                    ),
+                }
+            ],
+            temperature=0.2,
+            max_tokens=1000,
+            response_format={"type": "json_object"},
+        )
+        return self._fit_request(request)
 
+    def _apply_repair(
+        self, event: Event, violations: List[Violation], content: str
+    ) -> List[Violation]:
+        """Merge a repair answer into the event and return what is still invalid."""
         try:
-            response_questions = llama_client.chat.completions.create(
-                model="llama3.3-70b",
-                messages=[{"role": "user", "content": question_prompt}],
-                temperature=0.0,
-                max_tokens=2500,
+            repairs, repaired = loads_json(content)
+        except ValueError:
+            self._trace_parse("repair", failed=True, repaired=True)
+            return violations
+        if isinstance(repairs, dict):
+            event.data = apply_repairs(event.data, violations, repairs)
+            violations = self.validator.validate(event.type, event.data)
+        self._trace_parse("repair", failed=bool(violations), repaired=repaired)
+        return violations
+
+    def _settle_event(
+        self, event: Event, violations: List[Violation], invalid: bool
+    ) -> Optional[Event]:
+        """Prune what could not be repaired; None drops the whole event."""
+        if violations:
+            logger.warning(
+                f"Invalid {event.type} event after repair: "
+                + "; ".join(f"{format_path(v.path)} {v.message}" for v in violations)
             )
+            data = self.validator.prune(event.type, event.data, violations)
+            if data is None or self.validator.validate(event.type, data):
+                event = None
+            else:
+                event.data = data
+        self._trace_parse(
+            "validation", failed=invalid, repaired=False, events=int(event is not None)
+        )
+        return event
+
+    def _validate_events(self, events: List[Event]) -> List[Event]:
+        valid = []
+        for event in events:
+            violations = self.validator.validate(event.type, event.data)
+            invalid = bool(violations)
+            for _ in range(self.repair_attempts if violations else 0):
+                try:
+                    response = self._complete(
+                        "repair", **self._repair_request(event, violations)
+                    )
+                except Exception as e:
+                    logger.error(f"Repair of {event.type} event failed: {e}")
+                    break
+                violations = self._apply_repair(
+                    event, violations, response.choices[0].message.content
+                )
+                if not violations:
+                    break
+            event = self._settle_event(event, violations, invalid)
+            if event is not None:
+                valid.append(event)
+        return valid
+
+    async def _validate_events_async(self, events: List[Event]) -> List[Event]:
+        async def validate(event: Event) -> Optional[Event]:
+            violations = self.validator.validate(event.type, event.data)
+            invalid = bool(violations)
+            for _ in range(self.repair_attempts if violations else 0):
+                try:
+                    response = await self._complete_async(
+                        "repair", **self._repair_request(event, violations)
+                    )
+                except Exception as e:
+                    logger.error(f"Repair of {event.type} event failed: {e}")
+                    break
+                violations = self._apply_repair(
+                    event, violations, response.choices[0].message.content
+                )
+                if not violations:
+                    break
+            return self._settle_event(event, violations, invalid)
+
+        validated = await asyncio.gather(*(validate(event) for event in events))
+        return [event for event in validated if event is not None]
+
+    def _extract_events(
+        self, text: str, event_type: str, prev_context: str, next_context: str
+    ) -> List[Event]:
+        if event_type in self.fused_types:
+            return self._extract_events_fused(
+                text, event_type, prev_context, next_context
+            )
+
+        question_request = self._questionnaire_request(
+            text, event_type, prev_context, next_context
+        )
+        if question_request is None:
+            return []
+
+        try:
+            response_questions = self._complete("questionnaire", **question_request)
             answers = response_questions.choices[0].message.content
-            logger.info(answers)
+            logger.debug(answers)
 
         except Exception as e:
             logger.error(f"Questionnaire failed for {event_type}: {e}")
             return []
 
-        examples = [ex for ex in self.examples if ex["event"]["type"] == event_type]
+        json_request = self._json_request(event_type, answers, text)
+        if json_request is None:
+            return []
 
-        # If no examples are found, log a warning and return empty list
-        if not examples:
-            logger.warning(f"No examples found for event type: {event_type}")
+        try:
+            if self.stream:
+                return self._stream_events(
+                    "json_conversion", json_request, event_type, text
+                )
+            response_json = self._complete("json_conversion", **json_request)
+            json_content = response_json.choices[0].message.content
+            events = self._parse_events(json_content, event_type, text)
+            self._observe_events(event_type, response_json, events)
+            return self._validate_events(events)
+
+        except Exception as e:
+            logger.error(
+                f"API request failed for JSON conversion: {str(e)}", exc_info=True
+            )
             return []
 
-        # Limit the number of examples to 3
-        examples = examples[:3]
+    async def _extract_events_async(
+        self, text: str, event_type: str, prev_context: str, next_context: str
+    ) -> List[Event]:
+        if event_type in self.fused_types:
+            return await self._extract_events_fused_async(
+                text, event_type, prev_context, next_context
+            )
 
-        # Modify the json_prompt to include the examples in the required format
-        examples_text = "\n\n".join(
-            [
-                f"Example {i+1}:\nInput Text:\n{ex['input_text']}\nCorresponding JSON Output:\n{json.dumps(ex['event'], indent=2)}"
-                for i, ex in enumerate(examples)
-            ]
+        question_request = self._questionnaire_request(
+            text, event_type, prev_context, next_context
         )
+        if question_request is None:
+            return []
 
-        # Now, in the json_prompt, instead of one example, include the multiple examples
-        json_prompt = f"""
-        You are an expert Text-to-JSON agent, tasked with generating structured data for the '{event_type}' JSON schema provided.
+        try:
+            response_questions = await self._complete_async("questionnaire", **question_request)
+            answers = response_questions.choices[0].message.content
+            logger.debug(answers)
 
-        Type-Specific Instructions for {event_type}:
-        {event_instructions}
+        except Exception as e:
+            logger.error(f"Questionnaire failed for {event_type}: {e}")
+            return []
 
-        Context:
-        An expert has analyzed a section of Andrea Costa's biography and answered questions about it. Your job is to summarize this text into JSON objects (one for each of the described events) that follow the schema and the type-specific instructions above.
+        json_request = self._json_request(event_type, answers, text)
+        if json_request is None:
+            return []
 
-        Key Guidelines:
-        2. "Participants" refer to the individuals involved in the individual event. Do not conflate multiple situations into a single event.
-        3. If data for a field is unavailable, use null.
-        4. Do not add any attributes, comments, or keys beyond what is defined in the schema.
-        5. Keep the original italian language for entity labels (e.g. "Socialisti", not "Socialists").
+        try:
+            if self.stream:
+                return await self._stream_events_async(
+                    "json_conversion", json_request, event_type, text
+                )
+            response_json = await self._complete_async("json_conversion", **json_request)
+            json_content = response_json.choices[0].message.content
+            events = self._parse_events(json_content, event_type, text)
+            self._observe_events(event_type, response_json, events)
+            return await self._validate_events_async(events)
 
-        Examples:
-        {examples_text}
+        except Exception as e:
+            logger.error(
+                f"API request failed for JSON conversion: {str(e)}", exc_info=True
+            )
+            return []
 
-        Your Task:
-        - Follow the schema using the provided information
-        - Generate JSON objects for each event described in the text
+    def _extract_events_fused(
+        self, text: str, event_type: str, prev_context: str, next_context: str
+    ) -> List[Event]:
+        fused_request = self._fused_request(
+            text, event_type, prev_context, next_context
+        )
+        if fused_request is None:
+            return []
 
-        OUTPUT EXPECTATIONS:
-        - Return **only** a valid JSON array of events.
-        - Ensure the output is strictly compliant with the provided schema.
-        - DO NOT CHANGE KEYS, EVEN WHEN THEY DO NOT SEEM ENOUGH.
-        - If the text below contain comments or other data that is not required by the schema, do not insert it in the output. 
-        - Information from the text that does not fit the schema is not important. 
-        
-        INPUT TEXT: 
-        {answers}
+        try:
+            if self.stream:
+                return self._stream_events("fused", fused_request, event_type, text)
+            response = self._complete("fused", **fused_request)
+            json_content = response.choices[0].message.content
+            events = self._parse_events(json_content, event_type, text, stage="fused")
+            return self._validate_events(events)
 
-        SCHEMA:
-        {json.dumps(schema['properties'], indent=2)}
+        except Exception as e:
+            logger.error(
+                f"Fused extraction failed for {event_type}: {str(e)}", exc_info=True
+            )
+            return []
 
-        YOUR ANSWER:
-        """
+    async def _extract_events_fused_async(
+        self, text: str, event_type: str, prev_context: str, next_context: str
+    ) -> List[Event]:
+        fused_request = self._fused_request(
+            text, event_type, prev_context, next_context
+        )
+        if fused_request is None:
+            return []
 
         try:
-            response_json = llama_client.chat.completions.create(
-                model="llama3.3-70b",
-                messages=[{"role": "user", "content": json_prompt}],
-                temperature=0.2,
-                max_tokens=15000,
-                response_format={"type": "json_object"},
+            if self.stream:
+                return await self._stream_events_async(
+                    "fused", fused_request, event_type, text
+                )
+            response = await self._complete_async("fused", **fused_request)
+            json_content = response.choices[0].message.content
+            events = self._parse_events(json_content, event_type, text, stage="fused")
+            return await self._validate_events_async(events)
+
+        except Exception as e:
+            logger.error(
+                f"Fused extraction failed for {event_type}: {str(e)}", exc_info=True
             )
+            return []
 
-            json_content = response_json.choices[0].message.content
-            repaired_json = repair_json(json_content, ensure_ascii=False)
-            extracted = json.loads(repaired_json)
+    def _joint_request(
+        self,
+        text: str,
+        event_types: List[str],
+        prev_context: str,
+        next_context: str,
+    ) -> Optional[dict]:
+        """Single call extracting every event type of a paragraph: the
+        paragraph and its context are sent once, after the sections
+        (instructions, guiding questions, schema) of all the types.
 
-            if isinstance(extracted, dict):
-                extracted = [extracted]
-            elif not isinstance(extracted, list):
-                logger.error(f"Unexpected JSON structure: {type(extracted)}")
-                return []
+        Sections are in schema order whatever the classification order, so
+        paragraphs of the same types share the cacheable prompt prefix."""
+        order = list(self.schemas)
+        event_types = sorted(
+            event_types, key=lambda t: order.index(t) if t in order else len(order)
+        )
+        sections = []
+        for event_type in event_types:
+            section = self.prompts.joint_sections.get(event_type)
+            if section is None:
+                logger.warning(f"No questions defined for event type: {event_type}")
+                return None
+            examples = self._examples_section(event_type, text)
+            if examples is None:
+                return None
+            sections.append(section + examples)
 
-            events = []
-            for data in extracted:
-                if isinstance(data, dict):
-                    event = Event(type=event_type, text=text, data=data)
-                    events.append(event)
-                else:
-                    logger.warning(f"Skipping invalid event data: {data}")
+        def render(prev_context: str, next_context: str) -> str:
+            return self.prompts.joint.render(
+                sections="".join(sections),
+                event_types=", ".join(event_types),
+                text=text,
+                prev_context=prev_context or "None",
+                next_context=next_context or "None",
+            )
 
-            return events
+        max_tokens = 15000
+        if self.token_budget is not None:
+            # As for fused calls: assume one event per ~100 tokens of text
+            expected = max(1, self.token_budget.count(text) // 100)
+            max_tokens = sum(
+                self.token_budget.json_completion_tokens(event_type, expected)
+                for event_type in event_types
+            )
+            prev_context, next_context = self.token_budget.trim_context(
+                render, prev_context, next_context, max_tokens
+            )
+
+        joint_prompt = render(prev_context, next_context)
+        request = dict(
+            model=self.router.model("joint"),
+            messages=[{"role": "user", "content": joint_prompt}],
+            temperature=0.2,
+            max_tokens=max_tokens,
+            response_format=joint_response_format(event_types, self.schemas)
+            if self.guided_decoding
+            else {"type": "json_object"},
+        )
+        return self._fit_request(request)
+
+    def _parse_joint_events(
+        self, content: str, event_types: List[str], text: str
+    ) -> Dict[str, List[Event]]:
+        """Events of each type of a joint answer.
+
+        Types missing from the answer, or with an event that fails
+        validation, are left out so they can be extracted separately.
+        """
+        try:
+            parsed, repaired = loads_json(content)
+        except ValueError:
+            self._trace_parse("joint", failed=True, repaired=True)
+            raise
+        if not isinstance(parsed, dict):
+            self._trace_parse("joint", failed=True, repaired=repaired)
+            raise ValueError(f"Expected an object of event lists, got {type(parsed)}")
+
+        extracted = {}
+        for event_type in event_types:
+            items = parsed.get(event_type)
+            if not isinstance(items, list) or not all(
+                isinstance(data, dict) for data in items
+            ):
+                continue
+            events = [Event(type=event_type, text=text, data=data) for data in items]
+            if any(self.validator.validate(event_type, e.data) for e in events):
+                continue
+            extracted[event_type] = events
+
+        self._trace_parse(
+            "joint",
+            failed=len(extracted) < len(event_types),
+            repaired=repaired,
+            events=sum(len(events) for events in extracted.values()),
+        )
+        return extracted
+
+    def _extract_events_joint(
+        self,
+        text: str,
+        event_types: List[str],
+        prev_context: str,
+        next_context: str,
+    ) -> Dict[str, List[Event]]:
+        event_types = list(dict.fromkeys(event_types))
+        joint_request = self._joint_request(
+            text, event_types, prev_context, next_context
+        )
+        if joint_request is None:
+            return {}
+
+        try:
+            response = self._complete("joint", **joint_request)
+            json_content = response.choices[0].message.content
+            extracted = self._parse_joint_events(json_content, event_types, text)
 
         except Exception as e:
-            logger.error(
-                f"API request failed for JSON conversion: {str(e)}", exc_info=True
-            )
-            return []
+            logger.error(f"Joint extraction failed, extracting each type separately: {e}")
+            return {}
+        self._log_joint_fallback(event_types, extracted)
+        return extracted
+
+    async def _extract_events_joint_async(
+        self,
+        text: str,
+        event_types: List[str],
+        prev_context: str,
+        next_context: str,
+    ) -> Dict[str, List[Event]]:
+        event_types = list(dict.fromkeys(event_types))
+        joint_request = self._joint_request(
+            text, event_types, prev_context, next_context
+        )
+        if joint_request is None:
+            return {}
+
+        try:
+            response = await self._complete_async("joint", **joint_request)
+            json_content = response.choices[0].message.content
+            extracted = self._parse_joint_events(json_content, event_types, text)
+
+        except Exception as e:
+            logger.error(f"Joint extraction failed, extracting each type separately: {e}")
+            return {}
+        self._log_joint_fallback(event_types, extracted)
+        return extracted
+
+    @staticmethod
+    def _log_joint_fallback(
+        event_types: List[str], extracted: Dict[str, List[Event]]
+    ) -> None:
+        fallback = [t for t in event_types if t not in extracted]
+        if fallback:
+            logger.info(f"Invalid joint output for {fallback}, extracting them separately")
 
     def get_relevant_history(self, num_events: int = 5) -> str:
         if not self.events:
@@ -398,47 +1487,537 @@ class BiographyProcessor:
         # Convert Event objects to dictionaries
         events_as_dicts = [
             {"type": e.type, "text": e.text, "data": e.data, "confidence": e.confidence}
-            for e in self.events[-num_events:]
+            for e in list(self.events)[-num_events:]
         ]
         return json.dumps(events_as_dicts, indent=2)
 
 
-def process_biography(text: str, schema_path: str, output_path: str) -> None:
-    processor = BiographyProcessor(schema_path)
-    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+def merge_extractions(
+    classifications: List[dict],
+    joint_events: Dict[str, List[Event]],
+    extracted: List[List[Event]],
+) -> List[List[Event]]:
+    """Per-classification event lists, in classification order, from the
+    joint output and the separate extractions of the remaining types."""
+    separate = iter(extracted)
+    return [
+        joint_events[c["type"]] if c["type"] in joint_events else next(separate)
+        for c in classifications
+    ]
+
+
+def split_paragraphs(text: str) -> List[str]:
+    return [p.strip() for p in text.split("\n") if p.strip()]
+
+
+def paragraph_result(
+    index: int, paragraph: str, events: List[Event], paragraph_hash: str
+) -> dict:
+    return {
+        "paragraph_index": index,
+        "paragraph_text": paragraph,
+        "content_hash": paragraph_hash,
+        "events": [{"type": e.type, "text": e.text, "data": e.data} for e in events],
+    }
+
+
+def classification_windows(indices: List[int], batch_size: int) -> List[List[int]]:
+    return [
+        indices[start : start + batch_size]
+        for start in range(0, len(indices), batch_size)
+    ]
+
+
+def group_paragraphs(segments: List[Segment], group: List[int]) -> List[int]:
+    """The paragraph indices covered by a group of segments, in order."""
+    indices = []
+    for k in group:
+        indices += [i for i in segments[k].paragraph_indices if i not in indices]
+    return indices
+
+
+def paragraph_hashes(
+    paragraphs: List[str], segments: List[Segment], groups: List[List[int]]
+) -> List[str]:
+    """Content hash of every paragraph, covering all the text its extraction saw.
+
+    A paragraph sent on its own keeps the hash of its text and context, so
+    results of unsegmented runs stay reusable.
+    """
+    hashes = [""] * len(paragraphs)
+    for group in groups:
+        first, last = segments[group[0]], segments[group[-1]]
+        indices = group_paragraphs(segments, group)
+        alone = len(group) == 1 and first.text == paragraphs[indices[0]]
+        segment_text = None if alone else "\n".join(segments[k].text for k in group)
+        for i in indices:
+            hashes[i] = content_hash(
+                paragraphs[i], first.prev_context, last.next_context, segment_text
+            )
+    return hashes
+
+
+def segment_tag(segment: Segment):
+    """Trace tag of a segment: its paragraph index, or indices when merged."""
+    indices = segment.paragraph_indices
+    return indices[0] if len(indices) == 1 else indices
 
-    results = []  # Store results for all paragraphs
-    for i, paragraph in enumerate(paragraphs):
-        prev_context = paragraphs[i - 1] if i > 0 else ""
-        next_context = paragraphs[i + 1] if i < len(paragraphs) - 1 else ""
 
-        # Process the current paragraph
-        events = processor.process_paragraph(
-            text=paragraph, prev_context=prev_context, next_context=next_context
+def write_group_results(
+    writer,
+    paragraphs: List[str],
+    indices: List[int],
+    events: List[Event],
+    hashes: List[str],
+) -> None:
+    """Write one result per paragraph of a group, skipping those already done."""
+    for i, paragraph_events in assign_events(events, indices, paragraphs).items():
+        if not writer.done(hashes[i]):
+            writer.write(paragraph_result(i, paragraphs[i], paragraph_events, hashes[i]))
+
+
+def reuse_previous_results(
+    writer, previous_path: Optional[str], paragraphs: List[str], hashes: List[str]
+) -> List[int]:
+    """Write the results that can be reused and return the indices left to process.
+
+    A paragraph is reused when its content hash, which covers the paragraph
+    and its previous/following context, is in the previous run's results or
+    already in a resumed output. Editing a paragraph therefore re-extracts
+    it and its two neighbours only.
+    """
+    if previous_path and os.path.abspath(previous_path) == os.path.abspath(
+        writer.path
+    ):
+        raise ValueError("The previous results must not be the output file itself")
+    previous = load_previous_results(previous_path) if previous_path else {}
+
+    pending = []
+    reused = 0
+    for i, paragraph_hash in enumerate(hashes):
+        if writer.done(paragraph_hash):
+            continue
+        if paragraph_hash in previous:
+            result = dict(previous[paragraph_hash], paragraph_index=i)
+            writer.write(dict(result, content_hash=paragraph_hash))
+            reused += 1
+        else:
+            pending.append(i)
+    if previous_path:
+        logger.info(
+            f"Reused {reused} of {len(paragraphs)} paragraphs from {previous_path}, "
+            f"re-extracting {len(pending)}"
         )
+    return pending
+
+
+def pending_groups(
+    segments: List[Segment], groups: List[List[int]], pending: List[int]
+) -> List[List[int]]:
+    pending = set(pending)
+    return [
+        group
+        for group in groups
+        if any(i in pending for i in group_paragraphs(segments, group))
+    ]
+
+
+def process_biography(
+    text: str,
+    schema_path: str,
+    output_path: str,
+    classify_batch_size: int = 1,
+    previous_path: Optional[str] = None,
+    processor: Optional[BiographyProcessor] = None,
+    segmenter: Optional[Segmenter] = None,
+    **processor_kwargs,
+) -> None:
+    """Extract events segment by segment and write them to output_path.
+
+    Results are written per paragraph (line of the input) whatever the
+    segmentation. A .jsonl output_path is written as paragraphs complete
+    and resumed on rerun: paragraphs whose content hash is already in it
+    are skipped. With previous_path, unchanged paragraphs reuse that run's
+    results. An existing processor can be passed to reuse it (and its
+    clients) across documents.
+    """
+    paragraphs = split_paragraphs(text)
+    writer = open_result_writer(output_path)
+    processor = processor or BiographyProcessor(schema_path, **processor_kwargs)
+
+    segments = (segmenter or Segmenter()).segment(paragraphs)
+    groups = group_segments(segments)
+    hashes = paragraph_hashes(paragraphs, segments, groups)
+    pending = reuse_previous_results(writer, previous_path, paragraphs, hashes)
+    todo = pending_groups(segments, groups, pending)
+
+    # With classify_batch_size > 1, windows of segments share one
+    # classification request instead of one request per segment
+    classifications = {}
+    if classify_batch_size > 1:
+        for window in classification_windows(todo, classify_batch_size):
+            batch_segments = [k for group in window for k in group]
+            window_paragraphs = [i for g in window for i in group_paragraphs(segments, g)]
+            with tagged(paragraph=window_paragraphs):
+                batch = processor.classify_paragraphs(
+                    [segments[k].text for k in batch_segments]
+                )
+            classifications.update(zip(batch_segments, batch))
+
+    for group in todo:
+        events = []
+        for k in group:
+            segment = segments[k]
+            with tagged(paragraph=segment_tag(segment)):
+                events += processor.process_paragraph(
+                    text=segment.text,
+                    prev_context=segment.prev_context,
+                    next_context=segment.next_context,
+                    classifications=classifications.get(k),
+                )
+
+        # Write results per paragraph, regardless of classification outcome
+        write_group_results(
+            writer, paragraphs, group_paragraphs(segments, group), events, hashes
+        )
+
+    writer.close()
+    logger.info(f"Processed results saved to {output_path}")
+
+
+async def process_biography_async(
+    text: str,
+    schema_path: str,
+    output_path: str,
+    max_concurrency: int = 8,
+    classify_batch_size: int = 1,
+    previous_path: Optional[str] = None,
+    processor: Optional[BiographyProcessor] = None,
+    segmenter: Optional[Segmenter] = None,
+    **processor_kwargs,
+) -> None:
+    """Process all segments concurrently, at most max_concurrency at a time.
+
+    Segments only share raw text as context, so they are independent. A
+    .json output keeps paragraph_index order regardless of completion order;
+    a .jsonl output gets each paragraph as soon as its segments complete.
+    """
+    paragraphs = split_paragraphs(text)
+    writer = open_result_writer(output_path)
+    processor = processor or BiographyProcessor(schema_path, **processor_kwargs)
+    semaphore = asyncio.Semaphore(max_concurrency)
 
-        # Append result per paragraph, regardless of classification outcome
-        results.append(
-            {
-                "paragraph_index": i,
-                "paragraph_text": paragraph,
-                "events": [
-                    {"type": e.type, "text": e.text, "data": e.data} for e in events
-                ],
-            }
+    segments = (segmenter or Segmenter()).segment(paragraphs)
+    groups = group_segments(segments)
+    hashes = paragraph_hashes(paragraphs, segments, groups)
+    pending = reuse_previous_results(writer, previous_path, paragraphs, hashes)
+    todo = pending_groups(segments, groups, pending)
+
+    async def run_segment(k: int, classifications: Optional[List[dict]]) -> List[Event]:
+        segment = segments[k]
+        async with semaphore:
+            with tagged(paragraph=segment_tag(segment)):
+                return await processor.process_paragraph_async(
+                    text=segment.text,
+                    prev_context=segment.prev_context,
+                    next_context=segment.next_context,
+                    classifications=classifications,
+                )
+
+    async def run(group: List[int], classifications: Dict[int, List[dict]]) -> None:
+        per_segment = await asyncio.gather(
+            *(run_segment(k, classifications.get(k)) for k in group)
+        )
+        events = [e for segment_events in per_segment for e in segment_events]
+        processor.events.extend(events)
+        write_group_results(
+            writer, paragraphs, group_paragraphs(segments, group), events, hashes
         )
 
-    # Save the results to a JSON file
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    async def run_window(window: List[List[int]]) -> None:
+        classifications = {}
+        if classify_batch_size > 1:
+            batch_segments = [k for group in window for k in group]
+            window_paragraphs = [i for g in window for i in group_paragraphs(segments, g)]
+            async with semaphore:
+                with tagged(paragraph=window_paragraphs):
+                    batch = await processor.classify_paragraphs_async(
+                        [segments[k].text for k in batch_segments]
+                    )
+            classifications = dict(zip(batch_segments, batch))
+        await asyncio.gather(*(run(group, classifications) for group in window))
+
+    await asyncio.gather(
+        *(
+            run_window(window)
+            for window in classification_windows(todo, max(classify_batch_size, 1))
+        )
+    )
 
+    writer.close()
     logger.info(f"Processed results saved to {output_path}")
 
 
 # Usage
 if __name__ == "__main__":
-    with open("AndreaCostaBio.txt", encoding="utf-8") as f:
+    parser = argparse.ArgumentParser(description="Extract events from a biography")
+    parser.add_argument("input", nargs="?", default="AndreaCostaBio.txt")
+    parser.add_argument("--schema", default="event_schema.json")
+    parser.add_argument(
+        "--subject", default="Andrea Costa", help="Person the biography is about"
+    )
+    parser.add_argument(
+        "--output",
+        default="output.json",
+        help="Results file; a .jsonl path is written per paragraph and resumable",
+    )
+    parser.add_argument(
+        "--previous",
+        help="Results of an earlier run on a previous version of the text; "
+        "only changed paragraphs and their neighbours are re-extracted",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Process paragraphs concurrently with the async client",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of paragraphs in flight in --async mode",
+    )
+    parser.add_argument(
+        "--extraction-workers",
+        type=int,
+        default=4,
+        help="Threads used to run the per-type extractions of a paragraph",
+    )
+    parser.add_argument(
+        "--cache", help="SQLite file caching LLM responses across runs"
+    )
+    parser.add_argument(
+        "--cache-replay",
+        action="store_true",
+        help="Serve every call from --cache and fail on misses (no network)",
+    )
+    parser.add_argument("--cache-max-entries", type=int)
+    parser.add_argument("--cache-max-age-days", type=float)
+    parser.add_argument(
+        "--classify-batch-size",
+        type=int,
+        default=1,
+        help="Paragraphs classified per LLM request (1 = one request each)",
+    )
+    parser.add_argument(
+        "--fused-types",
+        default="",
+        help="Comma-separated event types (or 'all') extracted with a single fused call",
+    )
+    parser.add_argument(
+        "--pre-classifier",
+        action="store_true",
+        help="Decide clear-cut paragraphs with a local embedding classifier",
+    )
+    parser.add_argument(
+        "--example-index",
+        help="Pick few-shot examples by similarity, persisting their embeddings to this .npz file",
+    )
+    parser.add_argument(
+        "--few-shot-k", type=int, default=3, help="Few-shot examples per prompt"
+    )
+    parser.add_argument(
+        "--context-window",
+        type=int,
+        help="Enable token budgeting for a server with this context window",
+    )
+    parser.add_argument(
+        "--tokenizer", help="Hugging Face tokenizer used to count prompt tokens"
+    )
+    parser.add_argument(
+        "--base-url",
+        default=LLAMA_API_URL,
+        help="OpenAI-compatible endpoint, e.g. a local mock_llm_server.py",
+    )
+    parser.add_argument("--rpm", type=float, help="Client-side requests per minute limit")
+    parser.add_argument("--tpm", type=float, help="Client-side tokens per minute limit")
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=6,
+        help="Retries with jittered backoff on 429s, timeouts and 5xx errors",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate request when a call exceeds its stage's p95 latency "
+        "(streamed calls are not hedged)",
+    )
+    parser.add_argument(
+        "--deadline",
+        action="append",
+        default=[],
+        metavar="STAGE=SECONDS",
+        help="Give up on calls of a stage after this long, e.g. json_conversion=120 "
+        "(repeatable; with --stream it covers the whole stream)",
+    )
+    parser.add_argument(
+        "--trace", help="Write one JSONL record per LLM call and parsed response"
+    )
+    parser.add_argument(
+        "--guided-decoding",
+        action="store_true",
+        help="Send the event JSON Schemas as response_format (vLLM, OpenAI structured outputs)",
+    )
+    parser.add_argument(
+        "--repair-attempts",
+        type=int,
+        default=1,
+        help="Targeted re-asks for the invalid fields of an extracted event (0 disables)",
+    )
+    parser.add_argument(
+        "--models",
+        help="JSON config routing each stage to a model, with escalation of "
+        "uncertain classifications (see routing.py)",
+    )
+    parser.add_argument(
+        "--joint",
+        action="store_true",
+        help="Extract all types of a multi-type paragraph with one call",
+    )
+    parser.add_argument(
+        "--thresholds",
+        help="Per-type classification thresholds written by calibration.py",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the extraction answers and validate events as they close",
+    )
+    parser.add_argument(
+        "--merge-below",
+        type=int,
+        default=0,
+        metavar="TOKENS",
+        help="Merge consecutive paragraphs until a segment has this many tokens",
+    )
+    parser.add_argument(
+        "--split-above",
+        type=int,
+        metavar="TOKENS",
+        help="Split longer segments at sentence boundaries",
+    )
+    parser.add_argument(
+        "--window", type=int, default=1, help="Segments extracted together per call"
+    )
+    parser.add_argument(
+        "--overlap",
+        type=int,
+        default=1,
+        help="Neighbouring segments given as previous/following context",
+    )
+    args = parser.parse_args()
+    processor_kwargs = {
+        "subject": args.subject,
+        "extraction_workers": args.extraction_workers,
+        "fused_types": QUESTION_SETS.keys()
+        if args.fused_types == "all"
+        else [t for t in args.fused_types.upper().split(",") if t],
+        "example_index_path": args.example_index,
+        "few_shot_k": args.few_shot_k,
+        "guided_decoding": args.guided_decoding,
+        "repair_attempts": args.repair_attempts,
+        "joint_extraction": args.joint,
+        "thresholds_path": args.thresholds,
+        "stream": args.stream,
+    }
+
+    token_budget = None
+    if args.context_window:
+        token_budget = TokenBudget(args.context_window, tokenizer_name=args.tokenizer)
+        processor_kwargs["token_budget"] = token_budget
+
+    tracer = Tracer(args.trace)
+    processor_kwargs["tracer"] = tracer
+
+    hedger = None
+    if args.hedge or args.deadline:
+        deadlines = {
+            stage: float(seconds)
+            for stage, seconds in (d.split("=", 1) for d in args.deadline)
+        }
+        hedger = Hedger(deadlines, hedge=args.hedge)
+        processor_kwargs["hedger"] = hedger
+
+    if args.pre_classifier:
+        processor_kwargs["pre_classifier"] = EmbeddingClassifier()
+
+    if args.models:
+        processor_kwargs["router"] = ModelRouter.from_config(args.models)
+
+    policy = RetryPolicy(args.rpm, args.tpm, max_retries=args.max_retries)
+    client = RateLimitedClient(create_client(args.base_url), policy)
+    async_client = AsyncRateLimitedClient(create_async_client(args.base_url), policy)
+
+    cache = None
+    if args.cache:
+        cache = LLMCache(
+            args.cache,
+            max_entries=args.cache_max_entries,
+            max_age=args.cache_max_age_days * 86400
+            if args.cache_max_age_days
+            else None,
+            replay=args.cache_replay,
+        )
+        client = CachedClient(client, cache)
+        async_client = AsyncCachedClient(async_client, cache)
+    processor_kwargs["client"] = client
+    processor_kwargs["async_client"] = async_client
+
+    segmenter = Segmenter(
+        min_tokens=args.merge_below,
+        max_tokens=args.split_above,
+        window=args.window,
+        overlap=args.overlap,
+        count_tokens=token_budget.count if token_budget is not None else None,
+    )
+
+    with open(args.input, encoding="utf-8") as f:
         text = f.read()
 
-    events = process_biography(text, "event_schema.json", "output.json")
+    if args.use_async:
+        events = asyncio.run(
+            process_biography_async(
+                text,
+                args.schema,
+                args.output,
+                max_concurrency=args.concurrency,
+                classify_batch_size=args.classify_batch_size,
+                previous_path=args.previous,
+                segmenter=segmenter,
+                **processor_kwargs,
+            )
+        )
+    else:
+        events = process_biography(
+            text,
+            args.schema,
+            args.output,
+            classify_batch_size=args.classify_batch_size,
+            previous_path=args.previous,
+            segmenter=segmenter,
+            **processor_kwargs,
+        )
     print(json.dumps(events, indent=2))
+
+    tracer.close()
+    logger.info(f"Per-stage summary:\n{tracer.format_summary()}")
+    logger.info(f"Rate limiting: {policy.stats()}")
+    if hedger is not None:
+        logger.info(f"Hedging and deadlines by stage: {hedger.stats()}")
+    if token_budget is not None:
+        logger.info(f"Token usage by stage: {token_budget.summary()}")
+    if cache is not None:
+        logger.info(f"LLM cache stats: {cache.stats()}")
+        cache.close()
@@ -0,0 +1,178 @@
+"""JSON Schemas derived from the template-style event_schema.json.
+
+event_schema.json describes each event type with an example-like template
+("<Full name of the person>", one-element lists, nested objects) that is
+pasted into the prompts. json_schema() turns a template into a real JSON
+Schema: strings and nested objects are nullable (the prompts ask for null
+when data is unavailable), lists are arrays of their single item and no
+other keys are allowed. response_format() wraps it for servers that
+support guided decoding (OpenAI-style "json_schema" response formats, as
+accepted by vLLM and others).
+
+validation_schema() is the looser schema validation.py checks extracted
+events against: only what the mapping scripts rely on is required.
+"""
+
+import re
+from typing import Dict, List
+
+
+def json_schema(template, nullable: bool = False) -> dict:
+    if isinstance(template, dict):
+        schema = {
+            "type": ["object", "null"] if nullable else "object",
+            "properties": {
+                key: json_schema(value, nullable=True) for key, value in template.items()
+            },
+            "required": list(template),
+            "additionalProperties": False,
+        }
+    elif isinstance(template, list):
+        # Arrays are never null: the mapping scripts iterate over them
+        schema = {"type": "array", "items": json_schema(template[0]) if template else {}}
+    elif isinstance(template, bool):
+        schema = {"type": ["boolean", "null"]}
+    elif isinstance(template, (int, float)):
+        schema = {"type": ["number", "null"]}
+    else:
+        schema = {"type": ["string", "null"]}
+        hint = str(template).strip("<>")
+        if hint:
+            schema["description"] = hint
+    return schema
+
+
+# Fields the mapping scripts build URIs from, by event type: they must be
+# non-empty strings. Paths go through arrays to their items, so
+# "participants.name" is the name of every participant.
+IDENTIFIERS = {
+    "BIRTH": ["participants.name"],
+    "DEATH": ["participants.name"],
+    "EDUCATION": ["education.name"],
+    "EMPLOYMENT": ["employment.name", "employment.worksFor.name"],
+    "RELATIONSHIP": ["relations.name", "relations.hasRelationshipWith.name"],
+    "POLITICS": ["actions.participants.name"],
+    "DOCUMENT": ["document.title", "document.creator.name"],
+}
+
+# What the mapping scripts index directly at the root of each event type;
+# required arrays must not be empty either
+MAPPING_CONSTRAINTS = {
+    # birth_mapping.py looks the newborn up among the participants
+    "BIRTH": {
+        "required": ["participants"],
+        "properties": {
+            "participants": {
+                "contains": {"type": "object", "properties": {"role": {"const": "newborn"}}}
+            }
+        },
+    },
+    "DEATH": {"required": ["participants"]},
+    "EDUCATION": {"required": ["education"]},
+    "EMPLOYMENT": {"required": ["employment"]},
+    # politics_mapping.py does without actions, but not with all of them pruned
+    "POLITICS": {"properties": {"actions": {"minItems": 1}}},
+    # relation_mapping.py maps the first relation
+    "RELATIONSHIP": {"required": ["relations"], "properties": {"relations": {"minItems": 1}}},
+    "DOCUMENT": {"required": ["document"], "properties": {"document": {"type": "object"}}},
+}
+
+
+def validation_schema(template) -> dict:
+    """What the mapping scripts need from a value shaped like template.
+
+    Unlike json_schema(), keys may be missing and extra keys are allowed (the
+    annotated events carry "type" and leave unknown dates out); nothing is
+    required here (see IDENTIFIERS). Arrays and objects must not be null: the
+    mapping scripts index them, and EventValidator fills in null ones.
+    """
+    if isinstance(template, dict):
+        properties = {key: validation_schema(value) for key, value in template.items()}
+        return {"type": "object", "properties": properties, "required": []}
+    if isinstance(template, list):
+        return {"type": "array", "items": validation_schema(template[0]) if template else {}}
+    return {"type": json_schema(template)["type"]}
+
+
+def _require_identifier(schema: dict, path: str) -> None:
+    *parents, key = path.split(".")
+    for part in parents:
+        schema = schema["properties"][part]
+        schema = schema.get("items", schema)
+    schema["properties"][key] = {"type": "string", "minLength": 1}
+    schema["required"].append(key)
+
+
+def event_validation_schema(event_type: str, event_schema: dict) -> dict:
+    schema = validation_schema(event_schema["properties"])
+    for path in IDENTIFIERS.get(event_type, []):
+        _require_identifier(schema, path)
+    constraints = MAPPING_CONSTRAINTS.get(event_type, {})
+    for key in constraints.get("required", []):
+        schema["required"].append(key)
+        if schema["properties"][key]["type"] == "array":
+            schema["properties"][key]["minItems"] = 1
+    for key, constraint in constraints.get("properties", {}).items():
+        schema["properties"][key].update(constraint)
+    return schema
+
+
+def event_json_schema(event_schema: dict) -> dict:
+    """Schema of one event of a type, from its event_schema.json entry."""
+    return json_schema(event_schema["properties"])
+
+
+def events_json_schema(event_schema: dict) -> dict:
+    """Schema of an extraction answer: {"events": [event, ...]}.
+
+    The events are wrapped in an object because strict structured output
+    modes require an object at the top level.
+    """
+    return {
+        "type": "object",
+        "properties": {"events": {"type": "array", "items": event_json_schema(event_schema)}},
+        "required": ["events"],
+        "additionalProperties": False,
+    }
+
+
+def response_format(event_type: str, event_schema: dict) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": re.sub(r"\W", "_", f"{event_type.lower()}_events"),
+            "schema": events_json_schema(event_schema),
+            "strict": True,
+        },
+    }
+
+
+def joint_response_format(event_types: List[str], schemas: Dict[str, dict]) -> dict:
+    """Response format of a joint extraction: {event_type: [event, ...], ...}."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "joint_events",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    event_type: {
+                        "type": "array",
+                        "items": event_json_schema(schemas[event_type]),
+                    }
+                    for event_type in event_types
+                },
+                "required": list(event_types),
+                "additionalProperties": False,
+            },
+            "strict": True,
+        },
+    }
+
+
+def response_formats(schemas: Dict[str, dict]) -> Dict[str, dict]:
+    return {
+        event_type: response_format(event_type, schema)
+        for event_type, schema in schemas.items()
+        if schema.get("properties")
+    }
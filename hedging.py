@@ -0,0 +1,258 @@
+"""Per-stage deadlines and hedged requests for LLM calls.
+
+Hedger keeps a rolling window of call latencies per pipeline stage
+(classification, questionnaire, json_conversion, fused). With hedging on,
+a call still running after the stage's p95 latency gets a duplicate
+request and whichever returns first is used. With a deadline, a call
+(including its hedge) that takes longer raises DeadlineExceeded, which the
+processor handles like any other failed call.
+
+The window holds what callers waited for: a call cut off by its deadline
+is recorded with the deadline as a lower bound, and a call won by its
+hedge with the time since the original request, which was still running.
+Cache hits never reach the hedger (the processor looks them up first).
+
+Abandoned async calls are cancelled. Sync calls cannot be interrupted, so
+a losing sync request runs to completion in the background and is
+discarded.
+
+Streamed calls (stream() and stream_async()) are not hedged: their chunks
+are consumed as they arrive, so a duplicate could not take over. Their
+deadline covers the whole stream, not just the wait for its first byte,
+and the stream is closed however the iteration ends.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+import numpy as np
+
+from llm_cache import aclose_stream, close_stream
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Hedger:
+    def __init__(
+        self,
+        deadlines: Optional[Dict[str, float]] = None,
+        hedge: bool = False,
+        quantile: float = 0.95,
+        min_samples: int = 20,
+        window: int = 200,
+        max_workers: int = 64,
+    ):
+        self.deadlines = deadlines or {}
+        self.hedge = hedge
+        self.quantile = quantile
+        # No hedging until a stage has enough samples for a stable quantile
+        self.min_samples = min_samples
+        self.window = window
+        self.latencies: Dict[str, deque] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        """Seconds after which a call of this stage is hedged, if at all."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            samples = list(self.latencies.get(stage, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return float(np.quantile(samples, self.quantile))
+
+    def _count(self, stage: str, name: str) -> None:
+        with self._lock:
+            counters = self.counters.setdefault(
+                stage, {"calls": 0, "hedged": 0, "hedge_won": 0, "deadline_exceeded": 0}
+            )
+            counters[name] += 1
+
+    def _observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.latencies.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def _deadline_exceeded(self, stage: str, deadline: float) -> DeadlineExceeded:
+        self._count(stage, "deadline_exceeded")
+        # A lower bound of the call's latency, so slow calls still count
+        self._observe(stage, deadline)
+        return DeadlineExceeded(f"{stage} call exceeded its {deadline:g}s deadline")
+
+    @staticmethod
+    def _next_timeout(elapsed, deadline, hedge_after) -> Optional[float]:
+        timeouts = [t - elapsed for t in (deadline, hedge_after) if t is not None]
+        return max(0.0, min(timeouts)) if timeouts else None
+
+    def call(self, stage: str, fn: Callable):
+        """Run fn() under the stage's deadline, hedging it if it is slow."""
+        self._count(stage, "calls")
+        deadline = self.deadlines.get(stage)
+        hedge_after = self.hedge_delay(stage)
+        started = time.monotonic()
+        if deadline is None and hedge_after is None:
+            result = fn()
+            self._observe(stage, time.monotonic() - started)
+            return result
+
+        def timed():
+            call_started = time.monotonic()
+            return fn(), time.monotonic() - call_started
+
+        pending = {self._executor.submit(timed)}
+        hedge = None
+        while True:
+            elapsed = time.monotonic() - started
+            timeout = self._next_timeout(
+                elapsed, deadline, hedge_after if hedge is None else None
+            )
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            error = None
+            for future in done:
+                if future.exception() is None:
+                    result, seconds = future.result()
+                    if future is hedge:
+                        self._count(stage, "hedge_won")
+                        # The original request took at least this long
+                        seconds = time.monotonic() - started
+                    self._observe(stage, seconds)
+                    return result
+                error = future.exception()
+            if error is not None and not pending:
+                raise error
+            elapsed = time.monotonic() - started
+            if deadline is not None and elapsed >= deadline:
+                raise self._deadline_exceeded(stage, deadline)
+            if hedge is None and hedge_after is not None and elapsed >= hedge_after:
+                self._count(stage, "hedged")
+                hedge = self._executor.submit(timed)
+                pending.add(hedge)
+
+    async def call_async(self, stage: str, make_call: Callable[[], Awaitable]):
+        """Async counterpart of call(); make_call() returns a fresh coroutine."""
+        self._count(stage, "calls")
+        deadline = self.deadlines.get(stage)
+        hedge_after = self.hedge_delay(stage)
+        started = time.monotonic()
+        if deadline is None and hedge_after is None:
+            result = await make_call()
+            self._observe(stage, time.monotonic() - started)
+            return result
+
+        async def timed():
+            call_started = time.monotonic()
+            return await make_call(), time.monotonic() - call_started
+
+        pending = {asyncio.ensure_future(timed())}
+        hedge = None
+        try:
+            while True:
+                elapsed = time.monotonic() - started
+                timeout = self._next_timeout(
+                    elapsed, deadline, hedge_after if hedge is None else None
+                )
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                error = None
+                for task in done:
+                    if task.exception() is None:
+                        result, seconds = task.result()
+                        if task is hedge:
+                            self._count(stage, "hedge_won")
+                            # The original request took at least this long
+                            seconds = time.monotonic() - started
+                        self._observe(stage, seconds)
+                        return result
+                    error = task.exception()
+                if error is not None and not pending:
+                    raise error
+                elapsed = time.monotonic() - started
+                if deadline is not None and elapsed >= deadline:
+                    raise self._deadline_exceeded(stage, deadline)
+                if hedge is None and hedge_after is not None and elapsed >= hedge_after:
+                    self._count(stage, "hedged")
+                    hedge = asyncio.ensure_future(timed())
+                    pending.add(hedge)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stream(self, stage: str, open_stream: Callable[[], Iterator]) -> Iterator:
+        """Chunks of the stream open_stream() returns, under the stage's deadline.
+
+        Opening the stream is waited for with a timeout; a stream that opens
+        too late is closed as soon as it does. While reading, the deadline is
+        checked at every chunk, so a stalled read is bounded by the client's
+        read timeout only.
+        """
+        self._count(stage, "calls")
+        deadline = self.deadlines.get(stage)
+        started = time.monotonic()
+        if deadline is None:
+            stream = open_stream()
+        else:
+            future = self._executor.submit(open_stream)
+            done, _ = wait([future], timeout=deadline)
+            if not done:
+                future.add_done_callback(
+                    lambda f: close_stream(f.result()) if f.exception() is None else None
+                )
+                raise self._deadline_exceeded(stage, deadline)
+            stream = future.result()
+        try:
+            for chunk in stream:
+                if deadline is not None and time.monotonic() - started > deadline:
+                    raise self._deadline_exceeded(stage, deadline)
+                yield chunk
+        finally:
+            close_stream(stream)
+        self._observe(stage, time.monotonic() - started)
+
+    async def stream_async(
+        self, stage: str, make_stream: Callable[[], Awaitable]
+    ) -> AsyncIterator:
+        """Async counterpart of stream(); the deadline also interrupts a stalled read."""
+        self._count(stage, "calls")
+        deadline = self.deadlines.get(stage)
+        started = time.monotonic()
+
+        def remaining() -> Optional[float]:
+            if deadline is None:
+                return None
+            return max(0.0, deadline - (time.monotonic() - started))
+
+        try:
+            stream = await asyncio.wait_for(make_stream(), remaining())
+        except asyncio.TimeoutError:
+            raise self._deadline_exceeded(stage, deadline) from None
+        try:
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), remaining())
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise self._deadline_exceeded(stage, deadline) from None
+                yield chunk
+        finally:
+            await aclose_stream(stream)
+        self._observe(stage, time.monotonic() - started)
+
+    def stats(self) -> Dict[str, dict]:
+        """Per-stage call, hedge and deadline counts plus the current hedge delay."""
+        with self._lock:
+            counters = {stage: dict(c) for stage, c in self.counters.items()}
+        for stage, c in counters.items():
+            c["hedge_win_rate"] = round(c["hedge_won"] / c["hedged"], 3) if c["hedged"] else 0.0
+            delay = self.hedge_delay(stage)
+            c["hedge_after_seconds"] = round(delay, 3) if delay is not None else None
+        return counters
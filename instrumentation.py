@@ -0,0 +1,189 @@
+"""Structured per-call instrumentation of the extraction pipeline.
+
+Tracer records one "call" entry per LLM request (stage, wall time, prompt
+and completion tokens, error) and one "parse" entry per parsed response
+(repair_json fallbacks, parse failure, events produced); streamed
+extractions add a "first_event" entry with the time to their first event.
+Entries are tagged with the paragraph and event type being processed, taken
+from the trace_tags context variable that the pipeline sets with tagged().
+They are optionally appended to a JSONL trace, and summary() aggregates
+them per stage and event type.
+"""
+
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Tags (paragraph, event_type) attached to every entry recorded in this context
+trace_tags: contextvars.ContextVar = contextvars.ContextVar("trace_tags", default={})
+
+
+@contextmanager
+def tagged(**tags):
+    token = trace_tags.set({**trace_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        trace_tags.reset(token)
+
+
+class Tracer:
+    def __init__(self, trace_path: Optional[str] = None):
+        self.trace_path = trace_path
+        self._file = open(trace_path, "w", encoding="utf-8") if trace_path else None
+        self._lock = threading.Lock()
+        # Aggregates by (stage, event_type); latencies are kept for percentiles
+        self._groups: Dict[Tuple[str, str], dict] = {}
+
+    def _group(self, stage: str, event_type: Optional[str]) -> dict:
+        key = (stage, event_type or "-")
+        if key not in self._groups:
+            self._groups[key] = {
+                "seconds": [],
+                "errors": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "repair_calls": 0,
+                "parse_failures": 0,
+                "events": 0,
+                "first_event_seconds": [],
+            }
+        return self._groups[key]
+
+    def _write(self, entry: dict) -> None:
+        if self._file is not None:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def record_call(
+        self, stage: str, seconds: float, response=None, error: Optional[Exception] = None
+    ) -> None:
+        usage = getattr(response, "usage", None)
+        entry = {
+            "kind": "call",
+            "stage": stage,
+            **trace_tags.get(),
+            "seconds": round(seconds, 4),
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "error": repr(error) if error is not None else None,
+            "time": time.time(),
+        }
+        with self._lock:
+            group = self._group(stage, entry.get("event_type"))
+            group["seconds"].append(seconds)
+            group["errors"] += error is not None
+            group["prompt_tokens"] += entry["prompt_tokens"] or 0
+            group["completion_tokens"] += entry["completion_tokens"] or 0
+            self._write(entry)
+
+    def record_parse(
+        self,
+        stage: str,
+        repair_calls: int,
+        failed: bool,
+        events: Optional[int] = None,
+    ) -> None:
+        entry = {
+            "kind": "parse",
+            "stage": stage,
+            **trace_tags.get(),
+            "repair_calls": repair_calls,
+            "parse_failed": failed,
+            "events": events,
+            "time": time.time(),
+        }
+        with self._lock:
+            group = self._group(stage, entry.get("event_type"))
+            group["repair_calls"] += repair_calls
+            group["parse_failures"] += failed
+            group["events"] += events or 0
+            self._write(entry)
+
+    def record_first_event(self, stage: str, seconds: float) -> None:
+        """Time from the request of a streamed call to its first complete event."""
+        entry = {
+            "kind": "first_event",
+            "stage": stage,
+            **trace_tags.get(),
+            "seconds": round(seconds, 4),
+            "time": time.time(),
+        }
+        with self._lock:
+            group = self._group(stage, entry.get("event_type"))
+            group["first_event_seconds"].append(seconds)
+            self._write(entry)
+
+    def summary(self) -> List[dict]:
+        """One row per stage and event type, plus a TOTAL row per stage."""
+        with self._lock:
+            groups = {
+                key: dict(
+                    group,
+                    seconds=list(group["seconds"]),
+                    first_event_seconds=list(group["first_event_seconds"]),
+                )
+                for key, group in self._groups.items()
+            }
+        totals: Dict[str, dict] = {}
+        for (stage, _), group in groups.items():
+            total = totals.setdefault(
+                stage, {k: [] if isinstance(v, list) else 0 for k, v in group.items()}
+            )
+            for k, v in group.items():
+                total[k] = total[k] + v
+        rows = []
+        for (stage, event_type), group in sorted(groups.items()) + sorted(
+            ((stage, "TOTAL"), group) for stage, group in totals.items()
+        ):
+            seconds = group["seconds"]
+            rows.append(
+                {
+                    "stage": stage,
+                    "event_type": event_type,
+                    "calls": len(seconds),
+                    "errors": group["errors"],
+                    "p50_seconds": round(float(np.percentile(seconds, 50)), 3)
+                    if seconds
+                    else None,
+                    "p95_seconds": round(float(np.percentile(seconds, 95)), 3)
+                    if seconds
+                    else None,
+                    "total_seconds": round(sum(seconds), 3),
+                    "prompt_tokens": group["prompt_tokens"],
+                    "completion_tokens": group["completion_tokens"],
+                    "repair_calls": group["repair_calls"],
+                    "parse_failures": group["parse_failures"],
+                    "events": group["events"],
+                    "p50_first_event_seconds": round(
+                        float(np.percentile(group["first_event_seconds"], 50)), 3
+                    )
+                    if group["first_event_seconds"]
+                    else None,
+                }
+            )
+        return rows
+
+    def format_summary(self) -> str:
+        rows = self.summary()
+        if not rows:
+            return "No LLM calls recorded"
+        columns = list(rows[0])
+        cells = [columns] + [
+            ["-" if row[c] is None else str(row[c]) for c in columns] for row in rows
+        ]
+        widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+        return "\n".join(
+            "  ".join(cell.ljust(width) for cell, width in zip(line, widths))
+            for line in cells
+        )
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,127 @@
+"""Incremental parsing of streamed extraction answers.
+
+An extraction answer is a JSON array of event objects, the same array
+wrapped as {"events": [...]} (guided decoding), or a single event object.
+EventStreamParser is fed the answer as it streams in and returns each event
+object as soon as its closing brace arrives, so events can be validated
+while the model is still generating the next ones.
+
+Only the characters that change the nesting (brackets, braces, quotes and
+backslashes) are looked at, and each one only once, so feeding an answer
+piece by piece costs no more than scanning it once. Prose or markdown
+fences around the JSON are skipped. An answer the parser cannot follow is
+not an error: complete stays False and the caller parses the full text
+(parser.text) with the usual repair fallback instead.
+"""
+
+import json
+import re
+from typing import List, Optional
+
+STRUCTURE = re.compile(r'[\[\]{}"]')
+STRING_END = re.compile(r'["\\]')
+
+
+class EventStreamParser:
+    def __init__(self):
+        self.text = ""
+        self.events = 0
+        # The root container closed and every event object parsed
+        self.complete = False
+        self.failed = False
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        # Last string read directly inside a root object: the candidate key
+        self._root_key: Optional[str] = None
+        # Depth of the event objects: 1 in a root array, 2 in {"events": [...]}
+        self._event_depth: Optional[int] = None
+        self._event_start: Optional[int] = None
+        self._done = False
+
+    def feed(self, piece: str) -> List[dict]:
+        """Add a piece of the answer; returns the event objects it completed."""
+        self.text += piece
+        events: List[dict] = []
+        text = self.text
+        pos = self._pos
+        while not self._done and pos < len(text):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+                match = STRING_END.search(text, pos)
+                if match is None:
+                    pos = len(text)
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escape = True
+                    continue
+                self._in_string = False
+                if self._stack == ["{"]:
+                    self._root_key = text[self._string_start + 1 : pos - 1]
+                continue
+
+            match = STRUCTURE.search(text, pos)
+            if match is None:
+                pos = len(text)
+                break
+            i = match.start()
+            pos = i + 1
+            char = match.group()
+            if char == '"':
+                if self._stack:
+                    self._in_string = True
+                    self._string_start = i
+            elif char in "[{":
+                self._open(char, i)
+            else:
+                event = self._close(char, i)
+                if event is not None:
+                    events.append(event)
+        self._pos = pos
+        self.events += len(events)
+        return events
+
+    def _open(self, char: str, i: int) -> None:
+        if not self._stack:
+            if char == "[":
+                self._event_depth = 1
+            else:
+                self._event_start = i
+        elif (
+            char == "["
+            and self._stack == ["{"]
+            and self._root_key == "events"
+            and self._event_depth is None
+        ):
+            self._event_depth = 2
+            self._event_start = None
+        elif char == "{" and len(self._stack) == self._event_depth:
+            self._event_start = i
+        self._stack.append(char)
+
+    def _close(self, char: str, i: int) -> Optional[dict]:
+        if not self._stack or self._stack.pop() != {"]": "[", "}": "{"}[char]:
+            self.failed = self._done = True
+            return None
+        event = None
+        # An event object closed, or a root object that is itself the event
+        at_event = len(self._stack) == self._event_depth or (
+            not self._stack and self._event_depth is None
+        )
+        if char == "}" and at_event and self._event_start is not None:
+            try:
+                event = json.loads(self.text[self._event_start : i + 1])
+            except ValueError:
+                # Stop here, so the events returned stay a prefix of the answer
+                self.failed = self._done = True
+            self._event_start = None
+        if not self._stack:
+            self._done = True
+            self.complete = not self.failed
+        return event if isinstance(event, dict) else None
@@ -1,6 +1,260 @@
-from openai import OpenAI
+import asyncio
+import datetime
+import email.utils
+import logging
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Optional
 
-llama_client = OpenAI(
-    api_key="",
-    base_url="https://api.llama-api.com",
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+logger = logging.getLogger(__name__)
+
+LLAMA_API_URL = "https://api.llama-api.com"
+
+# Errors worth retrying: throttling, timeouts, dropped connections, 5xx
+TRANSIENT_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
 )
+TRANSIENT_STATUS_CODES = {408, 409, 429}
+
+
+def _timeout(read_timeout: float) -> httpx.Timeout:
+    return httpx.Timeout(read_timeout, connect=10.0)
+
+
+def _limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=60.0,
+    )
+
+
+def create_client(
+    base_url: str = LLAMA_API_URL,
+    api_key: str = "",
+    max_connections: int = 32,
+    timeout: float = 300.0,
+) -> OpenAI:
+    """A client with its own keep-alive connection pool, e.g. one per worker process.
+
+    SDK retries are disabled; RateLimitedClient owns the retry policy.
+    """
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=0,
+        timeout=_timeout(timeout),
+        http_client=httpx.Client(limits=_limits(max_connections)),
+    )
+
+
+def create_async_client(
+    base_url: str = LLAMA_API_URL,
+    api_key: str = "",
+    max_connections: int = 32,
+    timeout: float = 300.0,
+) -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=0,
+        timeout=_timeout(timeout),
+        http_client=httpx.AsyncClient(limits=_limits(max_connections)),
+    )
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take amount from the bucket and return how long to wait before using it.
+
+        The balance may go negative, which queues later callers behind this one.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def estimate_tokens(request: dict) -> int:
+    """Tokens a request counts against a TPM quota: prompt estimate + max_tokens."""
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+    return prompt_chars // 4 + (request.get("max_tokens") or 0)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # HTTP-date form, e.g. "Wed, 21 Oct 2015 07:28:00 GMT"
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return (
+        isinstance(error, openai.APIStatusError)
+        and error.status_code in TRANSIENT_STATUS_CODES
+    )
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    def admission_delay(self, estimated_tokens: int) -> float:
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            delay = max(delay, self.token_bucket.reserve(estimated_tokens))
+        self.throttled_seconds += delay
+        return delay
+
+    def settle(self, estimated_tokens: int, response) -> None:
+        """Give back the part of the token reservation the call did not use."""
+        usage = getattr(response, "usage", None)
+        if self.token_bucket is not None and usage is not None:
+            self.token_bucket.refund(max(0, estimated_tokens - usage.total_tokens))
+
+    def retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None if the error is final."""
+        if not _is_transient(error) or attempt >= self.max_retries:
+            return None
+        self.retries += 1
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            # The server's hint, but never longer than the policy allows
+            return min(self.max_delay, retry_after + random.uniform(0, self.base_delay))
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+        }
+
+
+class RateLimitedClient:
+    """Wraps an OpenAI client with RPM/TPM token buckets and retries with backoff."""
+
+    def __init__(self, client: OpenAI, policy: Optional[RetryPolicy] = None):
+        self._client = client
+        self.policy = policy or RetryPolicy()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        estimated = estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            time.sleep(self.policy.admission_delay(estimated))
+            try:
+                response = self._client.chat.completions.create(**kwargs)
+            except Exception as e:
+                delay = self.policy.retry_delay(e, attempt)
+                if delay is None:
+                    logger.error(f"LLM call failed after {attempt + 1} attempts: {e}")
+                    raise
+                logger.warning(f"Transient LLM error ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.policy.settle(estimated, response)
+            return response
+
+
+class AsyncRateLimitedClient:
+    """Async counterpart of RateLimitedClient, for AsyncOpenAI clients."""
+
+    def __init__(self, client: AsyncOpenAI, policy: Optional[RetryPolicy] = None):
+        self._client = client
+        self.policy = policy or RetryPolicy()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        estimated = estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.policy.admission_delay(estimated))
+            try:
+                response = await self._client.chat.completions.create(**kwargs)
+            except Exception as e:
+                delay = self.policy.retry_delay(e, attempt)
+                if delay is None:
+                    logger.error(f"LLM call failed after {attempt + 1} attempts: {e}")
+                    raise
+                logger.warning(f"Transient LLM error ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.policy.settle(estimated, response)
+            return response
+
+
+# Shared by the sync and async clients so both draw from the same quota
+default_policy = RetryPolicy()
+
+llama_client = RateLimitedClient(create_client(), default_policy)
+
+async_llama_client = AsyncRateLimitedClient(create_async_client(), default_policy)
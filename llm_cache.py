@@ -0,0 +1,387 @@
+"""Persistent, content-addressed cache for chat completion responses.
+
+Responses are stored in SQLite and keyed by a hash of everything that
+determines the output of a call (model, messages, temperature, max_tokens
+and response_format), so reruns over unchanged text do not hit the network.
+
+Streamed calls share the cache: a hit is replayed as a stream of one
+content chunk (and a usage chunk), and a miss is stored, assembled into a
+regular completion, once its stream has been read to the end.
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import logging
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+from typing import AsyncIterator, Iterator, List, Optional
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_FIELDS = ("model", "messages", "temperature", "max_tokens", "response_format")
+# Seconds a connection waits for another process's write lock (batch workers)
+BUSY_TIMEOUT = 30.0
+
+
+def request_key(**kwargs) -> str:
+    """Hash the fields of a chat completion request that affect its output."""
+    payload = {field: kwargs.get(field) for field in CACHE_KEY_FIELDS}
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CacheMiss(LookupError):
+    """Raised in replay mode when a request has no cached response."""
+
+
+def replay_chunks(completion: ChatCompletion) -> List[ChatCompletionChunk]:
+    """A completion as the chunks of a stream: all its content, then its usage."""
+    choice = completion.choices[0]
+    header = {
+        "id": completion.id,
+        "object": "chat.completion.chunk",
+        "created": completion.created,
+        "model": completion.model,
+    }
+    chunks = [
+        ChatCompletionChunk.model_validate(
+            {
+                **header,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": choice.message.content},
+                        "finish_reason": choice.finish_reason,
+                    }
+                ],
+            }
+        )
+    ]
+    if completion.usage is not None:
+        chunks.append(
+            ChatCompletionChunk.model_validate(
+                {**header, "choices": [], "usage": completion.usage.model_dump()}
+            )
+        )
+    return chunks
+
+
+async def replay_stream_async(completion: ChatCompletion) -> AsyncIterator:
+    for chunk in replay_chunks(completion):
+        yield chunk
+
+
+def close_stream(stream) -> None:
+    close = getattr(stream, "close", None)
+    if close is not None:
+        close()
+
+
+async def aclose_stream(stream) -> None:
+    # Async generators have aclose(), the SDK's AsyncStream an async close()
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if close is not None:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+
+
+class _StreamRecorder:
+    """Assembles the chunks of a stream into the completion to cache."""
+
+    def __init__(self):
+        self.header = None
+        self.pieces: List[str] = []
+        self.finish_reason = None
+        self.usage = None
+
+    def add(self, chunk) -> None:
+        if self.header is None:
+            self.header = chunk
+        if chunk.choices:
+            self.pieces.append(chunk.choices[0].delta.content or "")
+            self.finish_reason = chunk.choices[0].finish_reason or self.finish_reason
+        self.usage = getattr(chunk, "usage", None) or self.usage
+
+    def completion(self) -> Optional[ChatCompletion]:
+        if self.header is None:
+            return None
+        return ChatCompletion.model_validate(
+            {
+                "id": self.header.id,
+                "object": "chat.completion",
+                "created": self.header.created,
+                "model": self.header.model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(self.pieces)},
+                        "finish_reason": self.finish_reason or "stop",
+                    }
+                ],
+                "usage": self.usage.model_dump() if self.usage is not None else None,
+            }
+        )
+
+
+class LLMCache:
+    def __init__(
+        self,
+        path: str = "llm_cache.sqlite",
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+        replay: bool = False,
+    ):
+        """
+        max_entries / max_bytes bound the cache size (least recently used
+        entries are evicted first), max_age expires entries older than that
+        many seconds. In replay mode the cache is opened read-only and misses
+        raise CacheMiss instead of calling the model.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if replay:
+            self._conn = sqlite3.connect(
+                f"file:{path}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+                timeout=BUSY_TIMEOUT,
+            )
+        else:
+            self._conn = sqlite3.connect(
+                path, check_same_thread=False, timeout=BUSY_TIMEOUT
+            )
+            # Readers do not block the writer, so worker processes can share the file
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )"""
+            )
+            self._conn.commit()
+            self.evict()
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1]):
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.replay:
+                self._conn.execute(
+                    "UPDATE responses SET accessed = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+                self._conn.commit()
+        return ChatCompletion.model_validate_json(row[0])
+
+    def put(self, key: str, model: Optional[str], response: ChatCompletion) -> None:
+        if self.replay:
+            return
+        payload = response.model_dump_json()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, payload, len(payload), now, now),
+            )
+            self._conn.commit()
+            self.writes += 1
+        if (self.max_entries or self.max_bytes) and self.writes % 100 == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones over the size limits."""
+        if self.replay:
+            return 0
+        removed = 0
+        with self._lock:
+            if self.max_age is not None:
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE created < ?",
+                    (time.time() - self.max_age,),
+                )
+                removed += cursor.rowcount
+            if self.max_entries is not None:
+                cursor = self._conn.execute(
+                    """DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY accessed DESC
+                        LIMIT -1 OFFSET ?)""",
+                    (self.max_entries,),
+                )
+                removed += cursor.rowcount
+            if self.max_bytes is not None:
+                total = 0
+                stale = []
+                for key, size in self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed DESC"
+                ):
+                    total += size
+                    if total > self.max_bytes:
+                        stale.append((key,))
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                removed += len(stale)
+            self._conn.commit()
+            self.evictions += removed
+        if removed:
+            logger.info(f"Evicted {removed} cached responses from {self.path}")
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _expired(self, created: float) -> bool:
+        return self.max_age is not None and created < time.time() - self.max_age
+
+
+class CachedClient:
+    """Wraps an OpenAI-compatible client so chat completions go through an LLMCache.
+
+    lookup() and fetch() split create() in two, so that callers (the
+    processor's hedging) can treat cache hits and upstream calls apart.
+    """
+
+    def __init__(self, client, cache: LLMCache):
+        self._client = client
+        self.cache = cache
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def lookup(self, **kwargs) -> Optional[ChatCompletion]:
+        """The cached response of a request; a miss in replay mode raises CacheMiss."""
+        key = request_key(**kwargs)
+        cached = self.cache.get(key)
+        if cached is None and self.cache.replay:
+            raise CacheMiss(f"No cached response for request {key}")
+        return cached
+
+    def fetch(self, **kwargs):
+        """Call the wrapped client and cache its response."""
+        response = self._client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._record(response, kwargs)
+        self.cache.put(request_key(**kwargs), kwargs.get("model"), response)
+        return response
+
+    def _record(self, stream, request: dict) -> Iterator:
+        recorder = _StreamRecorder()
+        try:
+            for chunk in stream:
+                recorder.add(chunk)
+                yield chunk
+        finally:
+            close_stream(stream)
+        # Reached only when the stream was read to its end
+        completion = recorder.completion()
+        if completion is not None:
+            self.cache.put(request_key(**request), request.get("model"), completion)
+
+    def create(self, **kwargs):
+        cached = self.lookup(**kwargs)
+        if cached is not None:
+            return iter(replay_chunks(cached)) if kwargs.get("stream") else cached
+        return self.fetch(**kwargs)
+
+
+class AsyncCachedClient:
+    """Async counterpart of CachedClient, for AsyncOpenAI clients."""
+
+    def __init__(self, client, cache: LLMCache):
+        self._client = client
+        self.cache = cache
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def lookup(self, **kwargs) -> Optional[ChatCompletion]:
+        key = request_key(**kwargs)
+        cached = self.cache.get(key)
+        if cached is None and self.cache.replay:
+            raise CacheMiss(f"No cached response for request {key}")
+        return cached
+
+    async def fetch(self, **kwargs):
+        response = await self._client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._record(response, kwargs)
+        self.cache.put(request_key(**kwargs), kwargs.get("model"), response)
+        return response
+
+    async def _record(self, stream, request: dict) -> AsyncIterator:
+        recorder = _StreamRecorder()
+        try:
+            async for chunk in stream:
+                recorder.add(chunk)
+                yield chunk
+        finally:
+            await aclose_stream(stream)
+        completion = recorder.completion()
+        if completion is not None:
+            self.cache.put(request_key(**request), request.get("model"), completion)
+
+    async def create(self, **kwargs):
+        cached = self.lookup(**kwargs)
+        if cached is not None:
+            if kwargs.get("stream"):
+                return replay_stream_async(cached)
+            return cached
+        return await self.fetch(**kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or prune the LLM response cache")
+    parser.add_argument("command", choices=["stats", "evict"])
+    parser.add_argument("--path", default="llm_cache.sqlite")
+    parser.add_argument("--max-entries", type=int)
+    parser.add_argument("--max-bytes", type=int)
+    parser.add_argument("--max-age-days", type=float)
+    args = parser.parse_args()
+
+    cache = LLMCache(
+        args.path,
+        max_entries=args.max_entries,
+        max_bytes=args.max_bytes,
+        max_age=args.max_age_days * 86400 if args.max_age_days else None,
+    )
+    if args.command == "evict":
+        print(f"Evicted {cache.evict()} entries")
+    print(json.dumps(cache.stats(), indent=2))
+    cache.close()
@@ -0,0 +1,516 @@
+"""Local OpenAI-compatible stand-in for the LLM endpoint.
+
+Serves POST .../chat/completions (streaming included) in three modes:
+
+    synth   answer every prompt with a deterministic, schema-valid response
+            synthesized from event_schema.json
+    replay  answer from recorded responses keyed by the request hash
+            (llm_cache.request_key), optionally synthesizing misses
+    record  forward requests to a real endpoint and record its responses
+
+Recordings are LLMCache SQLite files, so a --cache file from a real run can
+be replayed too. Latency is sampled per stage from a configurable
+distribution and errors can be injected to exercise the retry layer:
+
+    python mock_llm_server.py --mode synth --latency lognormal:0.8,0.5 \\
+        --latency json_conversion=lognormal:4,0.6 --port 8000
+    python event_extraction.py --base-url http://127.0.0.1:8000
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from llm_cache import LLMCache, request_key
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = (
+    "BIRTH",
+    "DEATH",
+    "EDUCATION",
+    "EMPLOYMENT",
+    "RELATIONSHIP",
+    "POLITICS",
+    "DOCUMENT",
+)
+
+NAMES = ["Andrea Costa", "Anna Kuliscioff", "Pietro Costa", "Rosa Tozzi", "Carducci"]
+PLACES = ["Imola", "Bologna", "Milano", "Roma", "Lugano"]
+
+
+def detect_stage(prompt: str) -> Tuple[str, Optional[str]]:
+    """Tell which pipeline prompt this is, and for which event type."""
+    event_type = re.search(r"'([A-Z]+)' (?:JSON schema|event)", prompt)
+    event_type = event_type.group(1) if event_type else None
+    if "Text-to-JSON repair agent" in prompt:
+        return "repair", re.search(r"A ([A-Z]+) event", prompt).group(1)
+    if "events of several types" in prompt:
+        return "joint", None
+    if "numbered paragraphs" in prompt:
+        return "batch_classification", None
+    if "Classify the text" in prompt:
+        return "classification", None
+    if "Text-to-JSON agent, tasked" in prompt:
+        return "json_conversion", event_type
+    if "Text-to-JSON agent." in prompt:
+        return "fused", event_type
+    if "### Questions and examples:" in prompt:
+        return "questionnaire", event_type
+    return "unknown", event_type
+
+
+class Synthesizer:
+    """Deterministic responses: the same prompt always gets the same answer."""
+
+    def __init__(self, schemas: Dict[str, dict], max_events: int = 2):
+        self.schemas = schemas
+        self.max_events = max_events
+
+    @staticmethod
+    def _rng(prompt: str) -> random.Random:
+        return random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+
+    def complete(self, prompt: str) -> Tuple[str, str]:
+        """Return (stage, response content) for a prompt."""
+        stage, event_type = detect_stage(prompt)
+        rng = self._rng(prompt)
+        if stage == "classification":
+            content = json.dumps({"classifications": self._classifications(rng)})
+        elif stage == "batch_classification":
+            count = len(re.findall(r"^Paragraph \d+: ", prompt, re.MULTILINE))
+            content = json.dumps(
+                {
+                    "results": [
+                        {"paragraph": i + 1, "classifications": self._classifications(rng)}
+                        for i in range(count)
+                    ]
+                }
+            )
+        elif stage == "questionnaire":
+            content = self._answers(rng, event_type)
+        elif stage in ("json_conversion", "fused") and event_type in self.schemas:
+            events = [
+                self._event(rng, event_type)
+                for _ in range(rng.randint(1, self.max_events))
+            ]
+            content = json.dumps(events, ensure_ascii=False)
+        elif stage == "joint":
+            event_types = re.search(r"^EVENT TYPES: (.*)$", prompt, re.MULTILINE)
+            content = json.dumps(
+                {
+                    event_type: [
+                        self._event(rng, event_type)
+                        for _ in range(rng.randint(1, self.max_events))
+                    ]
+                    for event_type in event_types.group(1).split(", ")
+                    if event_type in self.schemas
+                },
+                ensure_ascii=False,
+            )
+        elif stage == "repair":
+            # Names for the invalid string fields, the rest stays invalid
+            current = json.loads(prompt.split("### Current values:", 1)[1].split("\n\n")[0])
+            content = json.dumps(
+                {
+                    path: rng.choice(NAMES)
+                    for path, value in current.items()
+                    if value is None or isinstance(value, str)
+                }
+            )
+        else:
+            content = "OK"
+        return stage, content
+
+    def _classifications(self, rng: random.Random) -> List[dict]:
+        picked = rng.sample(EVENT_TYPES, rng.choice((0, 1, 1, 2, 2, 3)))
+        if not picked:
+            # Nothing to extract: one class below the confidence threshold
+            return [
+                {
+                    "type": rng.choice(EVENT_TYPES),
+                    "confidence": round(rng.uniform(0.0, 0.4), 2),
+                    "reason": "synthetic",
+                }
+            ]
+        return [
+            {"type": t, "confidence": round(rng.uniform(0.6, 0.99), 2), "reason": "synthetic"}
+            for t in picked
+        ]
+
+    def _answers(self, rng: random.Random, event_type: Optional[str]) -> str:
+        events = rng.randint(1, self.max_events)
+        return "\n".join(
+            f"{i + 1}. {event_type or 'Event'} of {rng.choice(NAMES)} "
+            f"in {rng.choice(PLACES)}, {rng.randint(1850, 1910)}."
+            for i in range(events)
+        )
+
+    def _event(self, rng: random.Random, event_type: str) -> dict:
+        properties = self.schemas[event_type]["properties"]
+        return {"type": event_type, **self._fill(rng, properties)}
+
+    def _fill(self, rng: random.Random, template, key: str = "", first: bool = True):
+        """Replace every "<...>" placeholder of a schema template with a value."""
+        if isinstance(template, dict):
+            return {k: self._fill(rng, v, k, first) for k, v in template.items()}
+        if isinstance(template, list):
+            items = template[:1] * rng.randint(1, 2)
+            return [self._fill(rng, item, key, i == 0) for i, item in enumerate(items)]
+        if not isinstance(template, str):
+            return template
+        hint = template.strip("<>")
+        if "date" in key.lower() or "YYYY" in hint:
+            day, month = rng.randint(1, 28), rng.randint(1, 12)
+            return f"{day:02d}/{month:02d}/{rng.randint(1850, 1910)}"
+        options = hint.split("/")
+        if len(options) > 1 and all(re.fullmatch(r"[a-z]+", o) for o in options):
+            # The first option for the first item, e.g. the newborn of a birth
+            return options[0] if first else rng.choice(options)
+        if key in ("name", "label") or "name" in hint.lower():
+            return rng.choice(PLACES if key == "label" else NAMES)
+        return f"{key or 'value'} {rng.randint(1, 999)}"
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """A latency sampler in seconds from "const:s", "uniform:a,b",
+    "lognormal:median,sigma" or "exp:mean"."""
+    name, _, args = spec.partition(":")
+    params = [float(p) for p in args.split(",") if p]
+    if name == "const":
+        return lambda rng: params[0]
+    if name == "uniform":
+        return lambda rng: rng.uniform(params[0], params[1])
+    if name == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(params[0]), params[1])
+    if name == "exp":
+        return lambda rng: rng.expovariate(1 / params[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class LatencyModel:
+    def __init__(self, specs: Optional[List[str]] = None, seed: int = 0):
+        """specs are "distribution" (all stages) or "stage=distribution"."""
+        self.samplers: Dict[str, Callable] = {}
+        for spec in specs or []:
+            stage, _, distribution = spec.rpartition("=")
+            self.samplers[stage or "*"] = parse_latency(distribution)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, stage: str) -> float:
+        sampler = (
+            self.samplers.get(stage)
+            # Batched classification counts as classification unless set apart
+            or self.samplers.get(stage.replace("batch_", ""))
+            or self.samplers.get("*")
+        )
+        if sampler is None:
+            return 0.0
+        with self._lock:
+            return max(0.0, sampler(self._rng))
+
+
+def error_body(message: str, error_type: str) -> dict:
+    return {"error": {"message": message, "type": error_type}}
+
+
+def completion_payload(model: str, content: str, prompt: str) -> dict:
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": "chatcmpl-mock-" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:24],
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class MockLLMServer:
+    def __init__(
+        self,
+        mode: str = "synth",
+        host: str = "127.0.0.1",
+        port: int = 0,
+        schema_path: str = "event_schema.json",
+        store_path: Optional[str] = None,
+        upstream=None,
+        latency: Optional[LatencyModel] = None,
+        error_rate: float = 0.0,
+        synthesize_misses: bool = False,
+    ):
+        """
+        port 0 picks a free port (see .url). store_path is the recording
+        replayed or written; upstream is the OpenAI client record mode
+        forwards to. error_rate is the share of requests answered with a
+        429 and a Retry-After header.
+        """
+        if mode not in ("synth", "replay", "record"):
+            raise ValueError(f"Unknown mode: {mode}")
+        if mode != "synth" and not store_path:
+            raise ValueError(f"{mode} mode needs a store path")
+        if mode == "record" and upstream is None:
+            raise ValueError("record mode needs an upstream client")
+        self.mode = mode
+        with open(schema_path, encoding="utf-8") as f:
+            self.synthesizer = Synthesizer(json.load(f))
+        self.store = LLMCache(store_path, replay=mode == "replay") if store_path else None
+        self.upstream = upstream
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.synthesize_misses = synthesize_misses
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+    def respond(self, request: dict) -> Tuple[int, dict, float]:
+        """Return (HTTP status, body, latency in seconds) for a request."""
+        prompt = request["messages"][-1]["content"]
+        stage, _ = detect_stage(prompt)
+        self._count(f"stage:{stage}")
+        with self._lock:
+            inject_error = self._rng.random() < self.error_rate
+        if inject_error:
+            self._count("injected_errors")
+            return 429, error_body("Rate limit exceeded (injected)", "rate_limit"), 0.0
+
+        if self.mode == "record":
+            response = self.upstream.chat.completions.create(
+                **{
+                    k: v
+                    for k, v in request.items()
+                    if k not in ("stream", "stream_options")
+                }
+            )
+            self.store.put(request_key(**request), request.get("model"), response)
+            self._count("recorded")
+            return 200, response.model_dump(), 0.0
+
+        if self.mode == "replay":
+            recorded = self.store.get(request_key(**request))
+            if recorded is not None:
+                self._count("replayed")
+                return 200, recorded.model_dump(), self.latency.sample(stage)
+            if not self.synthesize_misses:
+                self._count("misses")
+                return 404, error_body("No recorded response", "not_found"), 0.0
+            self._count("misses")
+
+        _, content = self.synthesizer.complete(prompt)
+        self._count("synthesized")
+        body = completion_payload(request.get("model", "mock"), content, prompt)
+        return 200, body, self.latency.sample(stage)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body are separate writes; avoid Nagle delays
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _send_json(self, status: int, body: dict, headers=()) -> None:
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_stream(self, body: dict, include_usage: bool = False) -> None:
+                """Send a completion as server-sent events, a few characters per chunk.
+
+                With include_usage (stream_options), a last chunk without
+                choices carries the token usage, as OpenAI sends it.
+                """
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                content = body["choices"][0]["message"]["content"] or ""
+                pieces = [content[i : i + 16] for i in range(0, len(content), 16)]
+                chunks = [{"role": "assistant", "content": ""}] + [
+                    {"content": piece} for piece in pieces
+                ]
+                for i, delta in enumerate(chunks):
+                    chunk = {
+                        "id": body["id"],
+                        "object": "chat.completion.chunk",
+                        "created": body["created"],
+                        "model": body["model"],
+                        "choices": [
+                            {
+                                "index": 0,
+                                "delta": delta,
+                                "finish_reason": "stop" if i == len(chunks) - 1 else None,
+                            }
+                        ],
+                    }
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                if include_usage:
+                    chunk = {
+                        "id": body["id"],
+                        "object": "chat.completion.chunk",
+                        "created": body["created"],
+                        "model": body["model"],
+                        "choices": [],
+                        "usage": body.get("usage"),
+                    }
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, data: str) -> None:
+                encoded = data.encode("utf-8")
+                self.wfile.write(f"{len(encoded):x}\r\n".encode() + encoded + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    models = {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+                    self._send_json(200, models)
+                else:
+                    self._send_json(404, error_body("Not found", "not_found"))
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, error_body("Not found", "not_found"))
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+                try:
+                    status, body, latency = server.respond(request)
+                except Exception as e:
+                    logger.error(f"Mock server failed to answer: {e}", exc_info=True)
+                    self._send_json(500, error_body(str(e), "server_error"))
+                    return
+                time.sleep(latency)
+                if status == 429:
+                    self._send_json(status, body, [("Retry-After", "1")])
+                elif status == 200 and request.get("stream"):
+                    self._send_stream(
+                        body,
+                        (request.get("stream_options") or {}).get("include_usage", False),
+                    )
+                else:
+                    self._send_json(status, body)
+
+        return Handler
+
+    def start(self) -> "MockLLMServer":
+        """Serve from a background thread, e.g. inside a benchmark."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+        if self.store is not None:
+            self.store.close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock LLM server")
+    parser.add_argument("--mode", choices=["synth", "replay", "record"], default="synth")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--schema", default="event_schema.json")
+    parser.add_argument(
+        "--store", help="Recorded responses (an LLMCache SQLite file) to replay or write"
+    )
+    parser.add_argument("--upstream", help="Base URL of the real endpoint in record mode")
+    parser.add_argument("--api-key", default="")
+    parser.add_argument(
+        "--synthesize-misses",
+        action="store_true",
+        help="In replay mode, synthesize responses that were not recorded",
+    )
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        metavar="[STAGE=]DIST",
+        help="const:s, uniform:a,b, lognormal:median,sigma or exp:mean (repeatable)",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of 429 answers")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    upstream = None
+    if args.mode == "record":
+        from llama_client import create_client
+
+        upstream = create_client(args.upstream, api_key=args.api_key)
+    server = MockLLMServer(
+        args.mode,
+        args.host,
+        args.port,
+        schema_path=args.schema,
+        store_path=args.store,
+        upstream=upstream,
+        latency=LatencyModel(args.latency),
+        error_rate=args.error_rate,
+        synthesize_misses=args.synthesize_misses,
+    )
+    logger.info(f"Mock LLM server ({args.mode}) listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info(f"Served: {server.stats()}")
+        server.stop()
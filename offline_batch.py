@@ -0,0 +1,527 @@
+"""Offline extraction of a corpus through OpenAI-compatible batch endpoints.
+
+Batch endpoints answer within hours instead of seconds, but cost less and
+are not rate limited like interactive calls. The pipeline is run as
+rounds of batch files, kept in a work directory:
+
+    python offline_batch.py prepare --input-dir biographies --workdir work
+    python offline_batch.py submit --workdir work
+    python offline_batch.py collect --workdir work    # once the batch is done
+    python offline_batch.py prepare --workdir work    # next round
+    ...
+    python offline_batch.py write --workdir work --output-dir out
+
+The first prepare writes the classification requests of every paragraph.
+Each later prepare ingests the collected results and writes the requests
+they unlock: extraction requests for the classified types (one fused call
+per type, or with --fused-types "" a questionnaire round followed by a JSON
+conversion round). `run` chains the steps until nothing is left.
+
+Every request has a custom_id "<stage>:<paragraph key>[:<type>]", which is
+how results are mapped back. The key hashes the document subject and the
+paragraph's content hash (its text and context), not its position, so
+adding documents or editing a text between rounds cannot attach results
+to the wrong paragraph: edited paragraphs simply get new requests. All
+state is in the work directory (corpus.json, requests/, results/,
+batches.json), so every step can be interrupted and rerun: prepare skips
+requests that are answered or still in a batch, and retries failed ones up
+to --max-attempts times. write appends the paragraphs whose requests all
+succeeded to resumable per-document JSONL outputs in the format of
+event_extraction.py; paragraphs with a request that failed every attempt
+are left out, so a later run with a higher --max-attempts retries them. Extracted events are validated as usual,
+but without repair re-asks: what is invalid is pruned or dropped.
+
+--backend local uses LocalBatchBackend, a file-based stand-in that runs
+each batch against a chat completions endpoint (e.g. mock_llm_server.py).
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from batch_extraction import Document, load_documents
+from event_extraction import (
+    QUESTION_SETS,
+    BiographyProcessor,
+    paragraph_hashes,
+    paragraph_result,
+    split_paragraphs,
+)
+from llama_client import create_client
+from results_io import iter_jsonl, open_result_writer
+from routing import ModelRouter
+from segmentation import Segmenter, group_segments
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT = "/v1/chat/completions"
+# Batch statuses after which a batch will not produce more results
+TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+
+def paragraph_key(subject: str, paragraph_hash: str) -> str:
+    """Identify a paragraph's requests: prompts depend on the subject too."""
+    payload = json.dumps([subject, paragraph_hash], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def custom_id(stage: str, key: str, event_type: str = "") -> str:
+    return ":".join([stage, key] + ([event_type] if event_type else []))
+
+
+def parse_custom_id(value: str) -> Tuple[str, str, str]:
+    stage, key, *event_type = value.split(":")
+    return stage, key, event_type[0] if event_type else ""
+
+
+def batch_line(request_id: str, request: dict) -> dict:
+    return {"custom_id": request_id, "method": "POST", "url": ENDPOINT, "body": request}
+
+
+def response_content(result: dict) -> Optional[str]:
+    """The message content of a batch output line, or None for a failed request."""
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        return None
+    try:
+        return response["body"]["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+class OpenAIBatchBackend:
+    """The /v1/files and /v1/batches endpoints of an OpenAI-compatible provider."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, path: str) -> str:
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint=ENDPOINT, completion_window="24h"
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id: str, path: str) -> None:
+        batch = self.client.batches.retrieve(batch_id)
+        with open(path, "w", encoding="utf-8") as f:
+            # Failed requests are in the error file, with the same line format
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    content = self.client.files.content(file_id).text
+                    f.write(content if content.endswith("\n") else content + "\n")
+
+
+class LocalBatchBackend:
+    """File-based stand-in for a batch provider.
+
+    A submitted batch is copied to <root>/<batch id>/input.jsonl. It is run
+    on the first status check, one request at a time against a chat
+    completions client, and its output.jsonl uses the provider format.
+    """
+
+    def __init__(self, root: str, client):
+        self.root = root
+        self.client = client
+        os.makedirs(root, exist_ok=True)
+
+    def submit(self, path: str) -> str:
+        batch_id = f"batch_{len(os.listdir(self.root)) + 1:04d}"
+        os.makedirs(os.path.join(self.root, batch_id))
+        with open(path, encoding="utf-8") as src, open(
+            os.path.join(self.root, batch_id, "input.jsonl"), "w", encoding="utf-8"
+        ) as dst:
+            dst.write(src.read())
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        output = os.path.join(self.root, batch_id, "output.jsonl")
+        if not os.path.exists(output):
+            self._run(batch_id, output)
+        return "completed"
+
+    def _run(self, batch_id: str, output: str) -> None:
+        lines = []
+        input_path = os.path.join(self.root, batch_id, "input.jsonl")
+        for n, line in enumerate(iter_jsonl(input_path)):
+            result = {"id": f"{batch_id}_req_{n}", "custom_id": line["custom_id"]}
+            try:
+                completion = self.client.chat.completions.create(**line["body"])
+                result["response"] = {"status_code": 200, "body": completion.model_dump()}
+                result["error"] = None
+            except Exception as e:
+                result["response"] = None
+                result["error"] = {"code": type(e).__name__, "message": str(e)}
+            lines.append(json.dumps(result, ensure_ascii=False))
+        # Written at once, so a batch is either done or not
+        with open(output + ".tmp", "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(output + ".tmp", output)
+
+    def download(self, batch_id: str, path: str) -> None:
+        output = os.path.join(self.root, batch_id, "output.jsonl")
+        with open(output, encoding="utf-8") as src:
+            content = src.read()
+        with open(path, "w", encoding="utf-8") as dst:
+            dst.write(content)
+
+
+class OfflineBatch:
+    def __init__(
+        self,
+        workdir: str,
+        processor: BiographyProcessor,
+        fused_types: Iterable[str] = QUESTION_SETS.keys(),
+        max_attempts: int = 3,
+    ):
+        self.workdir = workdir
+        self.processor = processor
+        self.fused_types = set(fused_types)
+        self.max_attempts = max_attempts
+        self.requests_dir = os.path.join(workdir, "requests")
+        self.results_dir = os.path.join(workdir, "results")
+        self.batches_path = os.path.join(workdir, "batches.json")
+        os.makedirs(self.requests_dir, exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+
+    # Work directory state
+
+    def save_corpus(self, documents: List[Document]) -> None:
+        with open(os.path.join(self.workdir, "corpus.json"), "w", encoding="utf-8") as f:
+            json.dump([asdict(d) for d in documents], f, indent=2)
+
+    def load_corpus(self) -> List[Document]:
+        with open(os.path.join(self.workdir, "corpus.json"), encoding="utf-8") as f:
+            return [Document(**d) for d in json.load(f)]
+
+    def load_batches(self) -> Dict[str, dict]:
+        """Submitted request files by name: batch id and last known status."""
+        if not os.path.exists(self.batches_path):
+            return {}
+        with open(self.batches_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_batches(self, batches: Dict[str, dict]) -> None:
+        with open(self.batches_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(batches, f, indent=2)
+        os.replace(self.batches_path + ".tmp", self.batches_path)
+
+    def request_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.requests_dir, "*.jsonl")))
+
+    def answers(self) -> Dict[str, Optional[str]]:
+        """Collected results by custom_id: content, or None if the request failed."""
+        answers: Dict[str, Optional[str]] = {}
+        for path in sorted(glob.glob(os.path.join(self.results_dir, "*.jsonl"))):
+            for result in iter_jsonl(path):
+                content = response_content(result)
+                # A later success overrides an earlier failure, not the reverse
+                if content is not None or result["custom_id"] not in answers:
+                    answers[result["custom_id"]] = content
+        return answers
+
+    def in_flight(self) -> Tuple[set, Dict[str, int]]:
+        """custom_ids waiting for a result, and how often each was requested."""
+        batches = self.load_batches()
+        waiting = set()
+        attempts: Dict[str, int] = {}
+        for path in self.request_files():
+            name = os.path.basename(path)
+            done = batches.get(name, {}).get("status") in TERMINAL and os.path.exists(
+                os.path.join(self.results_dir, name)
+            )
+            for line in iter_jsonl(path):
+                attempts[line["custom_id"]] = attempts.get(line["custom_id"], 0) + 1
+                if not done:
+                    waiting.add(line["custom_id"])
+        return waiting, attempts
+
+    # Pipeline
+
+    def _documents(self):
+        """(document index, document, paragraphs, segments, hashes) of the corpus."""
+        for d, document in enumerate(self.load_corpus()):
+            with open(document.path, encoding="utf-8") as f:
+                paragraphs = split_paragraphs(f.read())
+            segments = Segmenter().segment(paragraphs)
+            hashes = paragraph_hashes(paragraphs, segments, group_segments(segments))
+            yield d, document, paragraphs, segments, hashes
+
+    def _classifications(self, content: Optional[str]) -> List[dict]:
+        if content is None:
+            return []
+        try:
+            return self.processor._filter_classifications(
+                self.processor._parse_classifications(content)
+            )
+        except Exception as e:
+            logger.error(f"Classification failed: {e}")
+            return []
+
+    def _events(self, content: Optional[str], event_type: str, text: str, stage: str):
+        if content is None:
+            return []
+        try:
+            events = self.processor._parse_events(content, event_type, text, stage=stage)
+        except Exception as e:
+            logger.error(f"Unparseable {stage} answer for {event_type}: {e}")
+            return []
+        valid = []
+        for event in events:
+            violations = self.processor.validator.validate(event.type, event.data)
+            event = self.processor._settle_event(event, violations, bool(violations))
+            if event is not None:
+                valid.append(event)
+        return valid
+
+    def walk(self, answers: Dict[str, Optional[str]], attempts: Dict[str, int]):
+        """Follow every paragraph through the stages.
+
+        Yields ("request", custom_id, request) for each request that can be
+        made now, ("paragraph", d, i, events) for each paragraph whose
+        requests all succeeded, and ("failed", d, i, None) for each paragraph
+        with a request that failed max_attempts times and nothing pending.
+        """
+
+        def retry(cid: str) -> bool:
+            # Not answered yet, or failed fewer than max_attempts times
+            return answers.get(cid) is None and attempts.get(cid, 0) < self.max_attempts
+
+        for d, document, paragraphs, segments, hashes in self._documents():
+            self.processor.set_subject(document.subject)
+            for i, segment in enumerate(segments):
+                text = segment.text
+                key = paragraph_key(document.subject, hashes[i])
+                cid = custom_id("classification", key)
+                if retry(cid):
+                    request = self.processor._classification_request(
+                        text, self.processor.router.model("classification")
+                    )
+                    yield "request", cid, request
+                    continue
+                complete = True
+                failed = answers.get(cid) is None
+                events = []
+                for c in self._classifications(answers.get(cid)):
+                    event_type = c["type"]
+                    fused = event_type in self.fused_types
+                    stage = "fused" if fused else "questionnaire"
+                    first = custom_id(stage, key, event_type)
+                    if retry(first):
+                        build = (
+                            self.processor._fused_request
+                            if fused
+                            else self.processor._questionnaire_request
+                        )
+                        request = build(
+                            text, event_type, segment.prev_context, segment.next_context
+                        )
+                        if request is not None:
+                            complete = False
+                            yield "request", first, request
+                        continue
+                    answer = answers.get(first)
+                    failed = failed or answer is None
+                    if fused:
+                        events += self._events(answer, event_type, text, "fused")
+                        continue
+                    second = custom_id("json_conversion", key, event_type)
+                    if answer is not None and retry(second):
+                        request = self.processor._json_request(event_type, answer, text)
+                        if request is not None:
+                            complete = False
+                            yield "request", second, request
+                        continue
+                    if answer is not None:
+                        failed = failed or answers.get(second) is None
+                        events += self._events(
+                            answers.get(second), event_type, text, "json_conversion"
+                        )
+                if complete:
+                    yield ("failed" if failed else "paragraph"), d, i, events
+
+    def prepare(self) -> Optional[str]:
+        """Write the requests that can be made now to a new request file."""
+        answers = self.answers()
+        waiting, attempts = self.in_flight()
+        lines = [
+            batch_line(item[1], item[2])
+            for item in self.walk(answers, attempts)
+            if item[0] == "request" and item[1] not in waiting
+        ]
+        if not lines:
+            logger.info("Nothing to request")
+            return None
+        name = f"{len(self.request_files()) + 1:04d}.jsonl"
+        path = os.path.join(self.requests_dir, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        os.replace(path + ".tmp", path)
+        stages: Dict[str, int] = {}
+        for line in lines:
+            stage = parse_custom_id(line["custom_id"])[0]
+            stages[stage] = stages.get(stage, 0) + 1
+        logger.info(f"Wrote {len(lines)} requests to {path}: {stages}")
+        return path
+
+    def submit(self, backend) -> List[str]:
+        """Submit the request files that have not been submitted yet."""
+        batches = self.load_batches()
+        submitted = []
+        for path in self.request_files():
+            name = os.path.basename(path)
+            if name in batches:
+                continue
+            batches[name] = {"id": backend.submit(path), "status": "submitted"}
+            # Saved after every submission, so a crash cannot submit twice
+            self.save_batches(batches)
+            submitted.append(batches[name]["id"])
+            logger.info(f"Submitted {name} as {batches[name]['id']}")
+        return submitted
+
+    def collect(self, backend) -> int:
+        """Download the results of finished batches.
+
+        Returns the number of batches still running.
+        """
+        batches = self.load_batches()
+        running = 0
+        for name, batch in batches.items():
+            result_path = os.path.join(self.results_dir, name)
+            if batch["status"] in TERMINAL and os.path.exists(result_path):
+                continue
+            batch["status"] = backend.status(batch["id"])
+            if batch["status"] in TERMINAL:
+                backend.download(batch["id"], result_path + ".tmp")
+                os.replace(result_path + ".tmp", result_path)
+                logger.info(f"Collected {name} ({batch['status']})")
+            else:
+                running += 1
+            self.save_batches(batches)
+        return running
+
+    def write(self) -> Dict[str, int]:
+        """Append the complete paragraphs to the per-document outputs.
+
+        Paragraphs with a request that failed every attempt are not written
+        (the writer would mark them done), only counted.
+        """
+        answers = self.answers()
+        _, attempts = self.in_flight()
+        complete: Dict[int, Dict[int, list]] = {}
+        failed = 0
+        for item in self.walk(answers, attempts):
+            if item[0] == "paragraph":
+                complete.setdefault(item[1], {})[item[2]] = item[3]
+            elif item[0] == "failed":
+                failed += 1
+
+        summary = {"paragraphs": 0, "complete": 0, "failed": failed}
+        for d, document, paragraphs, segments, hashes in self._documents():
+            output_dir = os.path.dirname(os.path.abspath(document.output_path))
+            os.makedirs(output_dir, exist_ok=True)
+            writer = open_result_writer(document.output_path)
+            done = complete.get(d, {})
+            for i, paragraph in enumerate(paragraphs):
+                if i in done and not writer.done(hashes[i]):
+                    writer.write(paragraph_result(i, paragraph, done[i], hashes[i]))
+            writer.close()
+            summary["paragraphs"] += len(paragraphs)
+            summary["complete"] += len(done)
+        return summary
+
+    def run(self, backend, poll_seconds: float = 60.0) -> Dict[str, int]:
+        """prepare, submit and collect until no request is left, then write."""
+        while True:
+            self.prepare()
+            self.submit(backend)
+            while self.collect(backend):
+                time.sleep(poll_seconds)
+            waiting, _ = self.in_flight()
+            if not waiting and self.prepare() is None:
+                return self.write()
+            self.submit(backend)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract events with batch endpoints")
+    parser.add_argument(
+        "command", choices=["prepare", "submit", "collect", "write", "run"]
+    )
+    parser.add_argument("--workdir", required=True)
+    parser.add_argument("--manifest", help="JSON/JSONL list of {path, subject}")
+    parser.add_argument("--input-dir", help="Directory of .txt biographies")
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--schema", default="event_schema.json")
+    parser.add_argument("--examples", default="examples.json")
+    parser.add_argument(
+        "--fused-types",
+        default="all",
+        help='Types extracted with one fused request ("all", or comma-separated); '
+        "the others take a questionnaire round and a JSON conversion round",
+    )
+    parser.add_argument("--models", help="Per-stage model routing config (routing.py)")
+    parser.add_argument("--thresholds", help="Per-type thresholds from calibration.py")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--backend", choices=["openai", "local"], default="openai")
+    parser.add_argument(
+        "--base-url",
+        help="Provider base URL (openai backend), or the chat completions endpoint "
+        "the local backend runs batches against",
+    )
+    parser.add_argument("--local-dir", help="Batch directory of the local backend")
+    parser.add_argument("--poll", type=float, default=60.0, help="Seconds between polls")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    processor = BiographyProcessor(
+        args.schema,
+        examples_path=args.examples,
+        router=ModelRouter.from_config(args.models) if args.models else None,
+        thresholds_path=args.thresholds,
+    )
+    offline = OfflineBatch(
+        args.workdir,
+        processor,
+        fused_types=QUESTION_SETS.keys()
+        if args.fused_types == "all"
+        else [t for t in args.fused_types.upper().split(",") if t],
+        max_attempts=args.max_attempts,
+    )
+    if args.manifest or args.input_dir:
+        documents = load_documents(args.manifest, args.input_dir, args.output_dir)
+        offline.save_corpus(documents)
+
+    if args.backend == "local":
+        backend = LocalBatchBackend(
+            args.local_dir or os.path.join(args.workdir, "local_batches"),
+            create_client(args.base_url),
+        )
+    elif args.base_url:
+        backend = OpenAIBatchBackend(create_client(args.base_url))
+    else:
+        from openai_client import openai_client
+
+        backend = OpenAIBatchBackend(openai_client)
+
+    if args.command == "prepare":
+        offline.prepare()
+    elif args.command == "submit":
+        offline.submit(backend)
+    elif args.command == "collect":
+        print(f"{offline.collect(backend)} batches still running")
+    elif args.command == "write":
+        print(json.dumps(offline.write()))
+    else:
+        print(json.dumps(offline.run(backend, args.poll)))
@@ -0,0 +1,298 @@
+"""Prompt templates split into a static prefix and a variable suffix.
+
+Everything that does not depend on the paragraph (instructions, the
+questionnaire, the JSON schema and, unless they are picked per paragraph,
+the few-shot examples) is rendered once into the prefix when the templates
+are built. The paragraph, its context and the questionnaire answers are
+rendered last, so inference servers with prefix caching (vLLM, llama.cpp)
+can reuse the prefix across calls.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# str.format() template, filled with the biography subject
+CLASSIFICATION_INSTRUCTIONS = """Classify the text depending on what's being discussed.
+Use one or more of the following classes and return the JSON array of classification.
+The event must be categorized indipendently of whether the event is happening to {subject} or to someone mentioned in the biography.
+BIRTH: the birth of one or more humans. For example, the birth of {subject}, the birth of person who is close to them, etc.
+RELATIONSHIP: any relationship between two humans; friendship; friendly collaboration; the marriage of one or more humans. Not relatives (e.g. becoming a dad of a child). For example, the marriage of two people, two people becoming friends; of {subject}, etc.
+EDUCATION: the education and upbringing of a person. Going to school, university, studying somewhere or with someone.
+EMPLOYMENT: the employment of someone or someone working at a specific thing. For example, going to work for a new contractor; working on a new project; working on a book.
+POLITICS: the political activity of someone or of a group. For example, the birth of a movement, the failure of a party, election, {subject} being elected.
+DOCUMENT: the creation of a document, an artifact, or other relevant creation. For example, {subject} writing a book.
+DEATH: the death of an entity. For example, {subject}'s death, a close friend's, etc."""
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    prefix: str
+    # str.format() template holding only the per-call fields
+    suffix: str
+
+    def render(self, **fields) -> str:
+        return self.prefix + self.suffix.format(**fields)
+
+
+def format_examples(examples: List[dict]) -> str:
+    return "\n\n".join(
+        f"Example {i+1}:\nInput Text:\n{ex['input_text']}\nCorresponding JSON Output:\n{json.dumps(ex['event'], indent=2)}"
+        for i, ex in enumerate(examples)
+    )
+
+
+def _classification_template(subject: str) -> PromptTemplate:
+    prefix = f"""The following text contains a snippet of the biography of {subject}.
+{CLASSIFICATION_INSTRUCTIONS.format(subject=subject)}
+
+Return only a JSON array of classifications. If no proper classification is possible, return any class with 0.0 confidence.
+[{{"type": "EVENT_TYPE", "confidence": 0.0-1.0, "reason": "explanation"}}]
+
+"""
+    return PromptTemplate(prefix, "Text: {text}\n")
+
+
+def _batch_classification_template(subject: str) -> PromptTemplate:
+    prefix = f"""The following numbered paragraphs are consecutive snippets of the biography of {subject}.
+Classify each paragraph independently.
+{CLASSIFICATION_INSTRUCTIONS.format(subject=subject)}
+
+Return only a JSON object with one entry per paragraph, in order. If no proper classification is possible for a paragraph, return any class with 0.0 confidence.
+{{"results": [{{"paragraph": 1, "classifications": [{{"type": "EVENT_TYPE", "confidence": 0.0-1.0, "reason": "explanation"}}]}}]}}
+
+"""
+    return PromptTemplate(prefix, "{numbered}\n")
+
+
+def _context_suffix(event_type: str) -> str:
+    return f"""### Context:
+EVENT TYPE: {event_type}
+- **Previous context:** {{prev_context}}
+- **Target text:** {{text}}
+- **Following context:** {{next_context}}
+"""
+
+
+def _questionnaire_template(
+    subject: str, event_type: str, questions: List[str]
+) -> PromptTemplate:
+    prefix = f"""The following text has been classified as describing a '{event_type}' event in {subject}'s life. The text and its context are given at the end.
+
+### Instructions:
+1. Read the questions carefully, and only answer the questions with information relevant for the {event_type} context.
+2. Read the **target text** with the utmost attention, as it contains the primary information you need.
+2. If there are more than one event described, return the information for each event separately.
+
+3. Use the additional context (previous and following) only as supplementary information when the target text alone does not provide clarity.
+4. Each event is to be considered as a single situation in which there are participants. If there are multiple situations happening, describe them as separate events.
+5. Assume the event involves {subject} if no explicit subject is mentioned in the target text.
+
+### Questions and examples:
+{chr(10).join(f'- {q}' for q in questions)}
+
+
+### Requirements:
+- Provide concise, direct answers to each question in the order listed.
+- Focus on entities, dates, their actions and only answer the questions from the {event_type} sections of the text. For example:
+- Avoid speculation or assumptions not supported by the provided text.
+- Use dates in **DD/MM/YYYY** format or state the year if precise dates are unavailable.
+- Highlight the specific relations between entities, institutions, and other places if any.
+
+"""
+    return PromptTemplate(prefix, _context_suffix(event_type))
+
+
+def _examples_block(static_examples: Optional[str]) -> str:
+    return f"Examples:\n{static_examples}\n\n" if static_examples else ""
+
+
+def _json_template(
+    subject: str, event_type: str, schema: dict, static_examples: Optional[str]
+) -> PromptTemplate:
+    event_instructions = schema.get("instruction", schema.get("instructions", ""))
+    prefix = f"""You are an expert Text-to-JSON agent, tasked with generating structured data for the '{event_type}' JSON schema provided.
+
+Type-Specific Instructions for {event_type}:
+{event_instructions}
+
+Context:
+An expert has analyzed a section of {subject}'s biography and answered questions about it. Your job is to summarize this text into JSON objects (one for each of the described events) that follow the schema and the type-specific instructions above.
+
+Key Guidelines:
+2. "Participants" refer to the individuals involved in the individual event. Do not conflate multiple situations into a single event.
+3. If data for a field is unavailable, use null.
+4. Do not add any attributes, comments, or keys beyond what is defined in the schema.
+5. Keep the original italian language for entity labels (e.g. "Socialisti", not "Socialists").
+
+Your Task:
+- Follow the schema using the provided information
+- Generate JSON objects for each event described in the text
+
+OUTPUT EXPECTATIONS:
+- Return **only** a valid JSON array of events.
+- Ensure the output is strictly compliant with the provided schema.
+- DO NOT CHANGE KEYS, EVEN WHEN THEY DO NOT SEEM ENOUGH.
+- If the input text contains comments or other data that is not required by the schema, do not insert it in the output.
+- Information from the text that does not fit the schema is not important.
+
+SCHEMA:
+{json.dumps(schema['properties'], indent=2)}
+
+{_examples_block(static_examples)}"""
+    return PromptTemplate(prefix, "{examples}INPUT TEXT:\n{answers}\n\nYOUR ANSWER:\n")
+
+
+def _fused_template(
+    subject: str,
+    event_type: str,
+    schema: dict,
+    questions: List[str],
+    static_examples: Optional[str],
+) -> PromptTemplate:
+    event_instructions = schema.get("instruction", schema.get("instructions", ""))
+    prefix = f"""You are an expert Text-to-JSON agent. The text given at the end has been classified as describing a '{event_type}' event in {subject}'s life, and your task is to generate structured data for the '{event_type}' JSON schema provided.
+
+Type-Specific Instructions for {event_type}:
+{event_instructions}
+
+### Guiding questions:
+Use these questions (and their worked example) to decide what to extract. Do not write the answers, only use them to fill in the JSON.
+{chr(10).join(f'- {q}' for q in questions)}
+
+### Instructions:
+1. Read the **target text** with the utmost attention, as it contains the primary information you need.
+2. Use the additional context (previous and following) only as supplementary information when the target text alone does not provide clarity.
+3. Each event is to be considered as a single situation in which there are participants. If there are multiple situations happening, return them as separate JSON objects. Do not conflate multiple situations into a single event.
+4. Assume the event involves {subject} if no explicit subject is mentioned in the target text.
+5. Use dates in DD/MM/YYYY format or the year if precise dates are unavailable. If data for a field is unavailable, use null.
+6. Do not add any attributes, comments, or keys beyond what is defined in the schema.
+7. Keep the original italian language for entity labels (e.g. "Socialisti", not "Socialists").
+
+OUTPUT EXPECTATIONS:
+- Return **only** a valid JSON array of events.
+- Ensure the output is strictly compliant with the provided schema.
+- DO NOT CHANGE KEYS, EVEN WHEN THEY DO NOT SEEM ENOUGH.
+
+SCHEMA:
+{json.dumps(schema['properties'], indent=2)}
+
+{_examples_block(static_examples)}"""
+    return PromptTemplate(
+        prefix, "{examples}" + _context_suffix(event_type) + "\nYOUR ANSWER:\n"
+    )
+
+
+JOINT_PREFIX = """You are an expert Text-to-JSON agent. The text given at the end has been classified as describing events of several types in {subject}'s life, and your task is to generate structured data for the JSON schema of each of these types, given below with their instructions.
+
+### Instructions:
+1. Read the **target text** with the utmost attention, as it contains the primary information you need.
+2. Use the additional context (previous and following) only as supplementary information when the target text alone does not provide clarity.
+3. Each event is to be considered as a single situation in which there are participants. If there are multiple situations happening, return them as separate JSON objects. Do not conflate multiple situations into a single event.
+4. Only extract events of a type under that type, following its schema and its guiding questions. Do not write the answers to the questions, only use them to fill in the JSON.
+5. Assume the event involves {subject} if no explicit subject is mentioned in the target text.
+6. Use dates in DD/MM/YYYY format or the year if precise dates are unavailable. If data for a field is unavailable, use null.
+7. Do not add any attributes, comments, or keys beyond what is defined in the schemas.
+8. Keep the original italian language for entity labels (e.g. "Socialisti", not "Socialists").
+
+OUTPUT EXPECTATIONS:
+- Return **only** a valid JSON object with one key per event type given below, each holding the JSON array of the events of that type (an empty array if there are none).
+- Ensure the events are strictly compliant with the schema of their type.
+- DO NOT CHANGE KEYS, EVEN WHEN THEY DO NOT SEEM ENOUGH.
+
+"""
+
+
+def _joint_section(
+    event_type: str,
+    schema: dict,
+    questions: List[str],
+    static_examples: Optional[str],
+) -> str:
+    event_instructions = schema.get("instruction", schema.get("instructions", ""))
+    return f"""## {event_type}
+Type-Specific Instructions for {event_type}:
+{event_instructions}
+
+Guiding questions:
+{chr(10).join(f'- {q}' for q in questions)}
+
+SCHEMA:
+{json.dumps(schema['properties'], indent=2)}
+
+{_examples_block(static_examples)}"""
+
+
+@dataclass
+class PromptTemplates:
+    classification: PromptTemplate
+    batch_classification: PromptTemplate
+    questionnaire: Dict[str, PromptTemplate] = field(default_factory=dict)
+    json_conversion: Dict[str, PromptTemplate] = field(default_factory=dict)
+    fused: Dict[str, PromptTemplate] = field(default_factory=dict)
+    # Joint extraction: the prefix and suffix wrap the sections of the
+    # paragraph's event types, joined in schema order
+    joint: Optional[PromptTemplate] = None
+    joint_sections: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def build(
+        cls,
+        schemas: Dict[str, dict],
+        question_sets: Dict[str, List[str]],
+        static_examples: Optional[Dict[str, str]] = None,
+        subject: str = "Andrea Costa",
+    ) -> "PromptTemplates":
+        """Render the static parts of every prompt once.
+
+        static_examples maps event types to their formatted few-shot
+        examples when those are the same for every paragraph; otherwise
+        examples are passed per call through the "examples" field.
+        """
+        static_examples = static_examples or {}
+        templates = cls(
+            _classification_template(subject), _batch_classification_template(subject)
+        )
+        for event_type, schema in schemas.items():
+            questions = question_sets.get(event_type)
+            if questions:
+                templates.questionnaire[event_type] = _questionnaire_template(
+                    subject, event_type, questions
+                )
+                templates.fused[event_type] = _fused_template(
+                    subject,
+                    event_type,
+                    schema,
+                    questions,
+                    static_examples.get(event_type),
+                )
+                templates.joint_sections[event_type] = _joint_section(
+                    event_type, schema, questions, static_examples.get(event_type)
+                )
+            templates.json_conversion[event_type] = _json_template(
+                subject, event_type, schema, static_examples.get(event_type)
+            )
+        templates.joint = PromptTemplate(
+            JOINT_PREFIX.format(subject=subject),
+            """{sections}### Context:
+EVENT TYPES: {event_types}
+- **Previous context:** {prev_context}
+- **Target text:** {text}
+- **Following context:** {next_context}
+
+YOUR ANSWER:
+""",
+        )
+        return templates
+
+    def static_prefixes(self) -> Dict[str, str]:
+        """All static prefixes by name, e.g. to warm a server's prefix cache."""
+        prefixes = {
+            "classification": self.classification.prefix,
+            "batch_classification": self.batch_classification.prefix,
+            "joint": self.joint.prefix,
+        }
+        for stage in ("questionnaire", "json_conversion", "fused"):
+            for event_type, template in getattr(self, stage).items():
+                prefixes[f"{stage}:{event_type}"] = template.prefix
+        return prefixes
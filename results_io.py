@@ -0,0 +1,141 @@
+"""Writers for per-paragraph extraction results.
+
+JsonResultWriter keeps the historical output.json format: a list of
+paragraph results written once at the end. JsonlResultWriter appends one
+line per paragraph as soon as it is done and fsyncs it, so a crashed run
+keeps its paid work; reopening the same file skips paragraphs whose
+content hash is already in it. load_previous_results lets an incremental
+run reuse the results of paragraphs (and contexts) that did not change.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(
+    paragraph: str, prev_context: str, next_context: str, segment: Optional[str] = None
+) -> str:
+    """Identify a paragraph by its text and the context it was extracted with.
+
+    segment is the text actually sent to the model when the paragraph was
+    merged with others or split (see segmentation.py).
+    """
+    fields = [prev_context, paragraph, next_context]
+    if segment is not None:
+        fields.append(segment)
+    payload = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def iter_jsonl(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_results(path: str) -> List[dict]:
+    """Load a .json or .jsonl results file as a list ordered by paragraph_index."""
+    if path.endswith(".jsonl"):
+        results = list(iter_jsonl(path))
+    else:
+        with open(path, encoding="utf-8") as f:
+            results = json.load(f)
+    return sorted(results, key=lambda r: r["paragraph_index"])
+
+
+def load_previous_results(path: str) -> Dict[str, dict]:
+    """Index a previous run's results by content hash.
+
+    Results written before content hashes were recorded get them recomputed
+    from the ordered paragraph texts, which is how they were segmented.
+    """
+    results = load_results(path)
+    texts = [r["paragraph_text"] for r in results]
+    previous = {}
+    for i, result in enumerate(results):
+        paragraph_hash = result.get("content_hash") or content_hash(
+            texts[i],
+            texts[i - 1] if i > 0 else "",
+            texts[i + 1] if i < len(texts) - 1 else "",
+        )
+        previous[paragraph_hash] = result
+    return previous
+
+
+class JsonResultWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self.results = []
+
+    def done(self, paragraph_hash: str) -> bool:
+        return False
+
+    def write(self, result: dict) -> None:
+        self.results.append(result)
+
+    def close(self) -> None:
+        self.results.sort(key=lambda r: r["paragraph_index"])
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.results, f, indent=2, ensure_ascii=False)
+
+
+class JsonlResultWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self.completed: Set[str] = set()
+        if os.path.exists(path):
+            self._recover()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _recover(self) -> None:
+        """Collect the hashes already written, dropping a torn last line.
+
+        Only an unterminated last line is a torn write; complete lines that
+        cannot be read are skipped (and their paragraphs redone), not cut.
+        """
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for number, line in enumerate(f, 1):
+                if not line.endswith(b"\n"):
+                    break
+                valid_bytes += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    self.completed.add(json.loads(line)["content_hash"])
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(
+                        f"Skipping line {number} of {self.path}: no readable content_hash"
+                    )
+        if valid_bytes < os.path.getsize(self.path):
+            logger.warning(f"Truncating partial record at the end of {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_bytes)
+        logger.info(
+            f"Resuming {self.path}: {len(self.completed)} paragraphs already done"
+        )
+
+    def done(self, paragraph_hash: str) -> bool:
+        return paragraph_hash in self.completed
+
+    def write(self, result: dict) -> None:
+        self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.completed.add(result["content_hash"])
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def open_result_writer(path: str):
+    """A .jsonl path streams and resumes; anything else writes one JSON list."""
+    if path.endswith(".jsonl"):
+        return JsonlResultWriter(path)
+    return JsonResultWriter(path)
@@ -0,0 +1,72 @@
+"""Per-stage model routing for the extraction pipeline.
+
+ModelRouter picks the model of each LLM call by pipeline stage
+(classification, questionnaire, json_conversion, fused, repair), so the
+short multi-label classification can run on a small model while the
+extraction stays on the large one. A classification the small model is
+unsure about (any confidence inside the uncertain band, or an answer that
+cannot be parsed) is escalated: the paragraph is classified again by the
+escalation model and that answer is used.
+
+Routes are read from a JSON config:
+
+    {
+        "default": "llama3.3-70b",
+        "models": {"classification": "llama3.1-8b"},
+        "escalation": {"model": "llama3.3-70b", "uncertain": [0.3, 0.8]}
+    }
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MODEL = "llama3.3-70b"
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        models: Optional[Dict[str, str]] = None,
+        default: str = DEFAULT_MODEL,
+        escalation_model: Optional[str] = None,
+        uncertain: Tuple[float, float] = (0.3, 0.8),
+    ):
+        self.models = dict(models or {})
+        self.default = default
+        self.escalation_model = escalation_model
+        self.uncertain = tuple(uncertain)
+
+    @classmethod
+    def from_config(cls, path: str) -> "ModelRouter":
+        with open(path) as f:
+            config = json.load(f)
+        escalation = config.get("escalation") or {}
+        return cls(
+            models=config.get("models"),
+            default=config.get("default", DEFAULT_MODEL),
+            escalation_model=escalation.get("model"),
+            uncertain=escalation.get("uncertain", (0.3, 0.8)),
+        )
+
+    def model(self, stage: str) -> str:
+        return self.models.get(stage, self.default)
+
+    def should_escalate(self, model: str, classifications: Optional[List]) -> bool:
+        """Whether a classification answer of model goes to the escalation model.
+
+        classifications is the unfiltered answer, or None if it could not be
+        parsed.
+        """
+        if self.escalation_model is None or model == self.escalation_model:
+            return False
+        if classifications is None:
+            return True
+        if not isinstance(classifications, list):
+            return False
+        low, high = self.uncertain
+        return any(
+            isinstance(c, dict)
+            and isinstance(c.get("confidence"), (int, float))
+            and low <= c["confidence"] < high
+            for c in classifications
+        )
@@ -0,0 +1,191 @@
+"""Group the lines of a biography into the units sent to the LLM.
+
+split_paragraphs() yields one paragraph per non-empty line, so headings and
+one-line fragments each cost a classification call, and an event spanning
+two lines is split across calls. Segmenter turns those paragraphs into
+segments:
+
+- merge: consecutive paragraphs are merged until a segment reaches
+  min_tokens (without going over max_tokens);
+- split: paragraphs over max_tokens are split at sentence boundaries;
+- window: segments of `window` consecutive units, each given the `overlap`
+  units on either side as previous/following context. The overlap is only
+  context, so no text is extracted twice.
+
+Every segment keeps the indices of the paragraphs it covers, so results
+are still written per original paragraph_index. The defaults (no merging
+or splitting, window 1, overlap 1) reproduce the one-line-per-paragraph
+behaviour with the neighbouring paragraphs as context.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+SENTENCE_END = re.compile(r"(?<=[.!?;])\s+(?=[\"'«(]?[A-ZÀ-Ý0-9])")
+
+
+@dataclass
+class Segment:
+    text: str
+    paragraph_indices: List[int]
+    prev_context: str = ""
+    next_context: str = ""
+
+
+@dataclass
+class _Unit:
+    text: str
+    paragraph_indices: List[int] = field(default_factory=list)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in SENTENCE_END.split(text) if s.strip()]
+
+
+class Segmenter:
+    def __init__(
+        self,
+        min_tokens: int = 0,
+        max_tokens: Optional[int] = None,
+        window: int = 1,
+        overlap: int = 1,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ):
+        if window < 1 or overlap < 0:
+            raise ValueError("window must be >= 1 and overlap >= 0")
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.window = window
+        self.overlap = overlap
+        self.count_tokens = count_tokens or estimate_tokens
+
+    def segment(self, paragraphs: List[str]) -> List[Segment]:
+        units = [_Unit(p, [i]) for i, p in enumerate(paragraphs)]
+        if self.min_tokens:
+            units = self._merge(units)
+        if self.max_tokens:
+            units = self._split(units)
+        return self._windows(units)
+
+    def _fits(self, text: str) -> bool:
+        return self.max_tokens is None or self.count_tokens(text) <= self.max_tokens
+
+    def _merge(self, units: List[_Unit]) -> List[_Unit]:
+        merged: List[_Unit] = []
+        buffer: Optional[_Unit] = None
+        for unit in units:
+            if buffer is None:
+                buffer = _Unit(unit.text, list(unit.paragraph_indices))
+            elif self._fits(buffer.text + "\n" + unit.text):
+                buffer.text += "\n" + unit.text
+                buffer.paragraph_indices += unit.paragraph_indices
+            else:
+                merged.append(buffer)
+                buffer = _Unit(unit.text, list(unit.paragraph_indices))
+            if self.count_tokens(buffer.text) >= self.min_tokens:
+                merged.append(buffer)
+                buffer = None
+        if buffer is not None:
+            # A short tail joins the previous segment when it fits
+            last = merged[-1] if merged else None
+            if last is not None and self._fits(last.text + "\n" + buffer.text):
+                last.text += "\n" + buffer.text
+                last.paragraph_indices += buffer.paragraph_indices
+            else:
+                merged.append(buffer)
+        return merged
+
+    def _split(self, units: List[_Unit]) -> List[_Unit]:
+        split: List[_Unit] = []
+        for unit in units:
+            if self._fits(unit.text):
+                split.append(unit)
+                continue
+            part = ""
+            for sentence in split_sentences(unit.text):
+                candidate = f"{part} {sentence}" if part else sentence
+                if part and not self._fits(candidate):
+                    split.append(_Unit(part, list(unit.paragraph_indices)))
+                    part = sentence
+                else:
+                    part = candidate
+            if part:
+                split.append(_Unit(part, list(unit.paragraph_indices)))
+        return split
+
+    def _windows(self, units: List[_Unit]) -> List[Segment]:
+        segments = []
+        for start in range(0, len(units), self.window):
+            group = units[start : start + self.window]
+            before = units[max(0, start - self.overlap) : start]
+            after = units[start + len(group) : start + len(group) + self.overlap]
+            indices = []
+            for unit in group:
+                indices += [i for i in unit.paragraph_indices if i not in indices]
+            segments.append(
+                Segment(
+                    "\n".join(u.text for u in group),
+                    indices,
+                    "\n".join(u.text for u in before),
+                    "\n".join(u.text for u in after),
+                )
+            )
+        return segments
+
+
+def group_segments(segments: List[Segment]) -> List[List[int]]:
+    """Group consecutive segments sharing paragraphs (the parts of a split one).
+
+    A group covers whole paragraphs, so its results can be written per
+    paragraph once all of its segments are done.
+    """
+    groups: List[List[int]] = []
+    for k, segment in enumerate(segments):
+        if groups and set(segment.paragraph_indices) & set(
+            segments[groups[-1][-1]].paragraph_indices
+        ):
+            groups[-1].append(k)
+        else:
+            groups.append([k])
+    return groups
+
+
+def _strings(value) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [s for k, v in value.items() if k != "type" for s in _strings(v)]
+    if isinstance(value, list):
+        return [s for v in value for s in _strings(v)]
+    return []
+
+
+def assign_events(
+    events: list, paragraph_indices: List[int], paragraphs: List[str]
+) -> Dict[int, list]:
+    """Attribute the events of a multi-paragraph segment to its paragraphs.
+
+    Each event goes to the paragraph containing most of its string values
+    (names, places, dates), or to the first paragraph on a tie.
+    """
+    assigned = {i: [] for i in paragraph_indices}
+    if len(paragraph_indices) == 1:
+        assigned[paragraph_indices[0]] = list(events)
+        return assigned
+    texts = {i: paragraphs[i].casefold() for i in paragraph_indices}
+    for event in events:
+        values = [s.casefold() for s in _strings(event.data) if len(s) > 2]
+        best = max(
+            paragraph_indices,
+            key=lambda i: (
+                sum(v in texts[i] for v in values),
+                -paragraph_indices.index(i),
+            ),
+        )
+        assigned[best].append(event)
+    return assigned
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from event_extraction import BiographyProcessor
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "..", "event_schema.json")
+
+# Answers whose malformed entries must be dropped, not crash the run
+MALFORMED = [
+    {"type": "BIRTH", "confidence": None},
+    {"type": "DEATH", "confidence": "0.8"},
+    {"type": "EDUCATION", "confidence": True},
+    {"confidence": 0.9},
+    "EMPLOYMENT",
+    {"type": "politics", "confidence": 0.9},
+]
+EXPECTED = [{"type": "POLITICS", "confidence": 0.9}]
+
+
+def completion(content):
+    message = SimpleNamespace(content=json.dumps(content))
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def make_processor(tmp_path, answer):
+    examples_path = tmp_path / "examples.json"
+    examples_path.write_text(json.dumps({"examples": []}))
+
+    def create(**kwargs):
+        return completion(answer)
+
+    async def create_async(**kwargs):
+        return completion(answer)
+
+    return BiographyProcessor(
+        SCHEMA_PATH,
+        examples_path=str(examples_path),
+        client=SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))),
+        async_client=SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=create_async))
+        ),
+    )
+
+
+def test_malformed_confidences_are_skipped(tmp_path):
+    processor = make_processor(tmp_path, MALFORMED)
+    assert processor._classify_paragraph("text", "", "") == EXPECTED
+
+
+def test_malformed_confidences_are_skipped_async(tmp_path):
+    processor = make_processor(tmp_path, MALFORMED)
+    result = asyncio.run(processor._classify_paragraph_async("text", "", ""))
+    assert result == EXPECTED
+
+
+def test_malformed_confidences_are_skipped_in_batches(tmp_path):
+    answer = {
+        "results": [
+            {"paragraph": 1, "classifications": MALFORMED},
+            {"paragraph": 2, "classifications": [{"type": "BIRTH", "confidence": None}]},
+        ]
+    }
+    processor = make_processor(tmp_path, answer)
+    assert processor.classify_paragraphs(["a", "b"]) == [EXPECTED, []]
+    result = asyncio.run(processor.classify_paragraphs_async(["a", "b"]))
+    assert result == [EXPECTED, []]
+
+
+@pytest.mark.parametrize("answer", [0.9, "BIRTH", None])
+def test_non_list_answer_classifies_nothing(tmp_path, answer):
+    processor = make_processor(tmp_path, answer)
+    assert processor._classify_paragraph("text", "", "") == []
+    assert asyncio.run(processor._classify_paragraph_async("text", "", "")) == []
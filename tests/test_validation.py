@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+
+from validation import EventValidator
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "..", "event_schema.json")
+
+
+@pytest.fixture(scope="module")
+def validator():
+    with open(SCHEMA_PATH) as f:
+        return EventValidator(json.load(f))
+
+
+def settle(validator, event_type, data):
+    """What the processor keeps of an event: data, pruned data, or None."""
+    violations = validator.validate(event_type, data)
+    if not violations:
+        return data
+    data = validator.prune(event_type, data, violations)
+    if data is None or validator.validate(event_type, data):
+        return None
+    return data
+
+
+def test_null_institution_name_is_valid(validator):
+    data = {
+        "description": "Studies",
+        "education": [
+            {
+                "name": "Carducci",
+                "role": "teacher",
+                "institution": {"name": None, "type": None, "location": None},
+            }
+        ],
+    }
+    assert validator.validate("EDUCATION", data) == []
+
+
+def test_years_and_null_locations_are_coerced(validator):
+    data = {
+        "properties": {
+            "actions": [
+                {
+                    "action": None,
+                    "participants": [{"name": "Andrea Costa", "type": "person", "role": None}],
+                    "date": {"startDate": 1877, "endDate": 1879.0},
+                    "location": None,
+                }
+            ]
+        }
+    }
+    assert validator.validate("POLITICS", data) == []
+    action = data["properties"]["actions"][0]
+    assert action["date"] == {"startDate": "1877", "endDate": "1879"}
+    assert action["location"] == []
+
+
+def test_prune_keeps_indexed_objects(validator):
+    data = {
+        "description": "Studies",
+        "education": [
+            {
+                "name": "Andrea Costa",
+                "role": "student",
+                "institution": {"name": ["Bologna"], "type": None, "location": None},
+                "period": None,
+            },
+            {"name": None, "role": "teacher", "institution": None},
+        ],
+    }
+    pruned = settle(validator, "EDUCATION", data)
+    assert pruned["education"] == [
+        {
+            "name": "Andrea Costa",
+            "role": "student",
+            "institution": {"name": None, "type": None, "location": None},
+            "period": {"startDate": None, "endDate": None},
+        }
+    ]
+
+
+def test_event_emptied_by_pruning_is_dropped(validator):
+    data = {"properties": {"actions": ["founding of the Federazione"]}}
+    assert settle(validator, "POLITICS", data) is None
+    assert settle(validator, "POLITICS", {"description": "No actions"}) is not None
@@ -0,0 +1,158 @@
+"""Token accounting for LLM calls.
+
+TokenBudget counts prompt tokens before a call, sizes max_tokens from what
+the call is expected to produce instead of a fixed worst case, trims the
+previous/following context when a prompt would not fit the context window,
+and records the usage reported by the server.
+"""
+
+import logging
+import re
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Starting estimates of JSON completion tokens per extracted event, refined
+# from the observed usage as the run goes on
+DEFAULT_TOKENS_PER_EVENT = {
+    "BIRTH": 250,
+    "DEATH": 250,
+    "EDUCATION": 350,
+    "EMPLOYMENT": 400,
+    "RELATIONSHIP": 400,
+    "POLITICS": 600,
+    "DOCUMENT": 300,
+}
+
+
+def _load_tokenizer(tokenizer_name: Optional[str]) -> Optional[Callable[[str], int]]:
+    """Return a token counting function, or None to fall back to an estimate.
+
+    A Hugging Face tokenizer (e.g. the served model's) is preferred; tiktoken's
+    cl100k_base is a close approximation of the Llama 3 vocabulary.
+    """
+    if tokenizer_name:
+        try:
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer {tokenizer_name}: {e}")
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        logger.warning("No tokenizer available, estimating 4 characters per token")
+        return None
+
+
+class TokenBudget:
+    def __init__(
+        self,
+        context_window: int = 16384,
+        tokenizer_name: Optional[str] = None,
+        max_completion_tokens: int = 15000,
+        min_completion_tokens: int = 256,
+        completion_margin: float = 1.5,
+    ):
+        """
+        context_window is the window configured on the inference server.
+        JSON conversion reservations are completion_margin times the expected
+        output, clamped to [min_completion_tokens, max_completion_tokens].
+        """
+        self.context_window = context_window
+        self.max_completion_tokens = max_completion_tokens
+        self.min_completion_tokens = min_completion_tokens
+        self.completion_margin = completion_margin
+        self.tokens_per_event = dict(DEFAULT_TOKENS_PER_EVENT)
+        self._counter = _load_tokenizer(tokenizer_name)
+        self._observed_events: Dict[str, Tuple[int, int]] = {}
+        self.usage: Dict[str, Dict[str, int]] = {}
+
+    def count(self, text: str) -> int:
+        if self._counter is None:
+            return len(text) // 4 + 1
+        return self._counter(text)
+
+    def expected_events(self, answers: str) -> int:
+        """Estimate how many events the questionnaire answers describe.
+
+        The model restarts the numbered answers for each separate event.
+        """
+        return max(1, len(re.findall(r"^\W*1[.)]", answers, re.MULTILINE)))
+
+    def json_completion_tokens(self, event_type: str, expected_events: int) -> int:
+        per_event = self.tokens_per_event.get(event_type, 400)
+        budget = int(expected_events * per_event * self.completion_margin) + 100
+        return max(self.min_completion_tokens, min(budget, self.max_completion_tokens))
+
+    def fit(self, prompt_tokens: int, max_tokens: int) -> int:
+        """Shrink a max_tokens reservation so prompt and completion fit the window."""
+        available = self.context_window - prompt_tokens
+        return max(self.min_completion_tokens, min(max_tokens, available))
+
+    def trim_context(
+        self,
+        render: Callable[[str, str], str],
+        prev_context: str,
+        next_context: str,
+        max_tokens: int,
+    ) -> Tuple[str, str]:
+        """Trim prev/next context until render(prev, next) leaves room for max_tokens.
+
+        The previous context keeps its end and the following context keeps its
+        beginning, as those are the parts closest to the target text.
+        """
+        def overflow() -> int:
+            prompt_tokens = self.count(render(prev_context, next_context))
+            return prompt_tokens + max_tokens - self.context_window
+
+        excess = overflow()
+        while excess > 0 and (prev_context or next_context):
+            # Drop roughly half the excess from each side, in characters
+            cut = max(excess * 2, 16)
+            prev_context = prev_context[cut:] if len(prev_context) > cut else ""
+            next_context = next_context[:-cut] if len(next_context) > cut else ""
+            excess = overflow()
+        if excess > 0:
+            logger.warning(
+                f"Prompt exceeds the context window by {excess} tokens even without context"
+            )
+        return prev_context, next_context
+
+    def record(self, stage: str, requested_max_tokens: int, usage) -> None:
+        if usage is None:
+            return
+        totals = self.usage.setdefault(
+            stage,
+            {
+                "calls": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "reserved_tokens": 0,
+            },
+        )
+        totals["calls"] += 1
+        totals["prompt_tokens"] += usage.prompt_tokens or 0
+        totals["completion_tokens"] += usage.completion_tokens or 0
+        totals["reserved_tokens"] += requested_max_tokens or 0
+
+    def observe_events(self, event_type: str, usage, events: int) -> None:
+        """Refine tokens_per_event from a JSON conversion that produced events."""
+        if usage is None or not events:
+            return
+        tokens, count = self._observed_events.get(event_type, (0, 0))
+        tokens, count = tokens + usage.completion_tokens, count + events
+        self._observed_events[event_type] = (tokens, count)
+        self.tokens_per_event[event_type] = max(1, tokens // count)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for stage, totals in self.usage.items():
+            reserved = totals["reserved_tokens"]
+            used = totals["completion_tokens"] / reserved if reserved else 0.0
+            summary[stage] = dict(totals, reservation_used=used)
+        return summary
@@ -0,0 +1,295 @@
+"""Validation of extracted events before they reach the mapping scripts.
+
+EventValidator compiles one validator per event type at startup from the
+validation schemas of event_schemas.py. A compiled validator is a tree of
+closures, one per schema node, so checking an event does not re-read the
+schema. It supports the JSON Schema subset those schemas use: type,
+properties, required, items, minItems, minLength, const and contains.
+
+Each violation carries the path of the offending field, so the processor
+can ask the model to repair just those fields (repair_prompt) and merge the
+answer back into the event (apply_repairs).
+
+Before checking an event, the validator coerces what the mapping scripts
+can take once converted (normalize): a null nested object becomes an
+object of nulls shaped like the schema template, a null array an empty
+one, and a number where the template has a string (a year such as 1877)
+its string.
+"""
+
+import copy
+import json
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from event_schemas import event_validation_schema
+
+Path = Tuple  # keys and list indices from the event root
+
+TYPE_CHECKS = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+@dataclass
+class Violation:
+    path: Path
+    message: str
+
+
+Check = Callable[[object, Path], List[Violation]]
+
+
+def empty(template):
+    """A value shaped like template with nothing in it."""
+    if isinstance(template, dict):
+        return {key: empty(value) for key, value in template.items()}
+    if isinstance(template, list):
+        return []
+    return None
+
+
+def normalize(template, value):
+    """value coerced to the shape of template; dicts and lists are updated in place."""
+    if isinstance(template, dict):
+        if value is None:
+            return empty(template)
+        if isinstance(value, dict):
+            for key, sub in template.items():
+                if key in value:
+                    value[key] = normalize(sub, value[key])
+    elif isinstance(template, list):
+        if value is None:
+            return []
+        if template and isinstance(value, list):
+            for i, item in enumerate(value):
+                # Null items are left to validation, which drops them
+                if item is not None:
+                    value[i] = normalize(template[0], item)
+    elif isinstance(template, str) and TYPE_CHECKS["number"](value):
+        return str(int(value)) if value == int(value) else str(value)
+    return value
+
+
+def format_path(path: Path) -> str:
+    text = ""
+    for part in path:
+        text += f"[{part}]" if isinstance(part, int) else f".{part}" if text else part
+    return text or "$"
+
+
+def compile_schema(schema: dict) -> Check:
+    checks: List[Check] = []
+
+    types = schema.get("type")
+    if types is not None:
+        type_names = [types] if isinstance(types, str) else list(types)
+        type_checks = [TYPE_CHECKS[t] for t in type_names]
+
+        def check_type(value, path):
+            if any(check(value) for check in type_checks):
+                return []
+            return [Violation(path, f"expected {' or '.join(type_names)}")]
+
+        checks.append(check_type)
+
+    if "const" in schema:
+        const = schema["const"]
+        checks.append(
+            lambda value, path: []
+            if value == const
+            else [Violation(path, f"expected {json.dumps(const)}")]
+        )
+
+    if "minLength" in schema:
+        min_length = schema["minLength"]
+        checks.append(
+            lambda value, path: [Violation(path, "must not be empty")]
+            if isinstance(value, str) and len(value.strip()) < min_length
+            else []
+        )
+
+    required = schema.get("required", [])
+    properties = {
+        key: compile_schema(sub) for key, sub in schema.get("properties", {}).items()
+    }
+    if required or properties:
+
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return []
+            violations = [
+                Violation(path + (key,), "is required")
+                for key in required
+                if key not in value
+            ]
+            for key, check in properties.items():
+                if key in value:
+                    violations += check(value[key], path + (key,))
+            return violations
+
+        checks.append(check_object)
+
+    if "items" in schema or "minItems" in schema:
+        items = compile_schema(schema.get("items", {}))
+        min_items = schema.get("minItems", 0)
+
+        def check_array(value, path):
+            if not isinstance(value, list):
+                return []
+            violations = []
+            if len(value) < min_items:
+                violations.append(Violation(path, f"needs at least {min_items} item(s)"))
+            for i, item in enumerate(value):
+                violations += items(item, path + (i,))
+            return violations
+
+        checks.append(check_array)
+
+    if "contains" in schema:
+        contains = compile_schema(schema["contains"])
+        consts = [
+            f"{key} {json.dumps(sub['const'])}"
+            for key, sub in schema["contains"].get("properties", {}).items()
+            if "const" in sub
+        ]
+        description = f"an item with {', '.join(consts)}" if consts else "a matching item"
+
+        def check_contains(value, path):
+            if not isinstance(value, list) or any(
+                not contains(item, path) for item in value
+            ):
+                return []
+            return [Violation(path, f"must contain {description}")]
+
+        checks.append(check_contains)
+
+    def check(value, path=()):
+        violations = []
+        for c in checks:
+            found = c(value, path)
+            if found:
+                # A value of the wrong type is not checked any further
+                if c is checks[0] and types is not None:
+                    return found
+                violations += found
+        return violations
+
+    return check
+
+
+class EventValidator:
+    def __init__(self, schemas: Dict[str, dict]):
+        self.templates = {
+            event_type: schema["properties"]
+            for event_type, schema in schemas.items()
+            if schema.get("properties")
+        }
+        self.validators = {
+            event_type: compile_schema(event_validation_schema(event_type, schema))
+            for event_type, schema in schemas.items()
+            if schema.get("properties")
+        }
+
+    @staticmethod
+    def _root(data) -> Path:
+        # Events echoing the schema layout: {"description": ..., "properties": {...}}
+        if isinstance(data, dict) and isinstance(data.get("properties"), dict):
+            return ("properties",)
+        return ()
+
+    def validate(self, event_type: str, data: dict) -> List[Violation]:
+        """Violations of an event; data is normalized in place first."""
+        validator = self.validators.get(event_type)
+        if validator is None:
+            return []
+        root = self._root(data)
+        normalize(self.templates[event_type], get_path(data, root))
+        return validator(get_path(data, root), root)
+
+    def prune(
+        self, event_type: str, data: dict, violations: List[Violation]
+    ) -> Optional[dict]:
+        """Copy of data without the invalid parts, or None if the event itself is invalid.
+
+        Invalid fields are nulled. Where null is not valid either (a missing
+        name, an object the mapping scripts index), the innermost list item
+        holding the field is dropped instead: objects are never nulled.
+        """
+        data = copy.deepcopy(data)
+        root = len(self._root(data))
+        for violation in violations:
+            path = violation.path
+            parent = get_path(data, path[:-1])
+            if len(path) > root and isinstance(parent, dict):
+                parent[path[-1]] = None
+
+        removals: Dict[Path, List[int]] = {}
+        for violation in self.validate(event_type, data):
+            path = violation.path
+            items = [i for i in range(len(path) - 1, root, -1) if isinstance(path[i], int)]
+            if not items:
+                return None
+            removals.setdefault(path[: items[0]], []).append(path[items[0]])
+        for list_path, indices in removals.items():
+            items = get_path(data, list_path)
+            for index in sorted(set(indices), reverse=True):
+                del items[index]
+        return data
+
+
+def _parent(data, path: Path):
+    for part in path[:-1]:
+        data = data[part]
+    return data
+
+
+def get_path(data, path: Path):
+    """Value at path, or None where the path does not exist."""
+    try:
+        for part in path:
+            data = data[part]
+    except (KeyError, IndexError, TypeError):
+        return None
+    return data
+
+
+def repair_prompt(event_type: str, data: dict, violations: List[Violation], text: str) -> str:
+    fields = {format_path(v.path): get_path(data, v.path) for v in violations}
+    problems = "\n".join(f"- {format_path(v.path)}: {v.message}" for v in violations)
+    return f"""You are a Text-to-JSON repair agent. A {event_type} event was extracted from the text below, but some of its fields are invalid.
+
+### Text:
+{text}
+
+### Invalid fields:
+{problems}
+
+### Current values:
+{json.dumps(fields, ensure_ascii=False, indent=2)}
+
+Return a JSON object with the same keys and the corrected values, taken from the text. Leave out the keys the text gives no valid value for. Return only the JSON object."""
+
+
+def apply_repairs(data: dict, violations: List[Violation], repairs: dict) -> dict:
+    """Copy of data with the repaired values written at the violation paths."""
+    data = copy.deepcopy(data)
+    for violation in violations:
+        key = format_path(violation.path)
+        if key not in repairs:
+            continue
+        if not violation.path:
+            if isinstance(repairs[key], dict):
+                data = repairs[key]
+            continue
+        try:
+            parent = _parent(data, violation.path)
+            parent[violation.path[-1]] = repairs[key]
+        except (KeyError, IndexError, TypeError):
+            continue
+    return data